@@ -0,0 +1,95 @@
+"""
+Measures picking the best auto apply campaign for a cart across cart sizes
+and the number of auto apply campaigns on the site.
+
+Every campaign applies to a few random products from the catalog. The cart
+is a snapshot of random products, so the timings cover the campaign index
+lookups and pricing the candidates, the part that runs on every cart view.
+
+Usage:
+    python benchmarks/auto_apply.py --campaigns 100 1000 5000 --cart-sizes 1 12 48 --carts 200
+"""
+import argparse
+import random
+import time
+
+import bootstrap  # noqa: F401 sets up Django
+
+from django.contrib.sites.models import Site
+from django.utils import timezone
+from vendor.models import Offer, Price
+from vendor.models.base import get_product_model
+
+from vendorpromo.auto_apply import rank_auto_apply_campaigns
+from vendorpromo.campaign_index import campaign_index
+from vendorpromo.discounts import CartLine
+from vendorpromo.models import PromotionalCampaign
+
+Product = get_product_model()
+
+
+def create_campaigns(site, products, total, products_per_campaign):
+    """
+    Creates the campaigns with bulk_create so the signal handlers do not
+    update the index for each one. The offers are loaded back because SQLite
+    does not return the primary keys from bulk_create.
+    """
+    now = timezone.now()
+    Offer.objects.bulk_create([
+        Offer(site=site, name=f"Benchmark Offer {i}", start_date=now, is_promotional=True)
+        for i in range(total)
+    ])
+    offers = list(Offer.objects.filter(site=site, is_promotional=True, promo_campaign__isnull=True))
+    Price.objects.bulk_create([
+        Price(offer=offer, cost=-random.randint(1, 50), start_date=now, priority=1)
+        for offer in offers
+    ])
+    Product.offers.through.objects.bulk_create([
+        Product.offers.through(offer_id=offer.pk, product_id=product.pk)
+        for offer in offers
+        for product in random.sample(products, products_per_campaign)
+    ])
+    PromotionalCampaign.objects.bulk_create([
+        PromotionalCampaign(name=f"Benchmark Campaign {i}", applies_to=offer, site=site, is_percent_off=bool(i % 2), auto_apply=True)
+        for i, offer in enumerate(offers)
+    ])
+
+
+def random_carts(products, cart_size, total):
+    return [
+        ([CartLine(i, random.randint(1, 3), random.randint(10, 200), frozenset([product.pk])) for i, product in enumerate(random.sample(products, cart_size))],)
+        for _ in range(total)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--campaigns', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--cart-sizes', type=int, nargs='+', default=[1, 12, 48])
+    parser.add_argument('--carts', type=int, default=200)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--products-per-campaign', type=int, default=3)
+    options = parser.parse_args()
+
+    with bootstrap.test_database():
+        site = Site.objects.get_current()
+        Product.objects.bulk_create([Product(site=site, name=f"Benchmark Product {i}") for i in range(options.products)])
+        products = list(Product.objects.filter(site=site))
+        created = 0
+
+        for total in sorted(options.campaigns):
+            create_campaigns(site, products, total - created, options.products_per_campaign)
+            created = total
+
+            campaign_index.clear()
+            start = time.perf_counter()
+            campaign_index.get(site.pk)
+            print(f"\n{total} campaigns, index compiled in {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+            for cart_size in options.cart_sizes:
+                carts = random_carts(products, cart_size, options.carts)
+                bootstrap.report(f"{cart_size} items", bootstrap.time_calls(lambda cart_lines: rank_auto_apply_campaigns(site.pk, cart_lines), carts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Shared setup for the benchmark scripts. Importing this module configures
+Django with the develop project settings, the same settings the test suite
+uses. Benchmarks run against a throwaway test database so they never touch
+the develop database.
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import django
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'develop'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'develop.settings')
+django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def time_calls(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    percentile = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))]
+    print(f"{label:<40} n={len(samples):<7} mean={statistics.mean(samples) * 1e6:10.1f}us "
+          f"p50={percentile(0.50) * 1e6:10.1f}us p95={percentile(0.95) * 1e6:10.1f}us p99={percentile(0.99) * 1e6:10.1f}us")
@@ -0,0 +1,96 @@
+"""
+Compares the checkout coupon code lookups on a campaign with a large number
+of codes:
+
+    legacy iexact     CouponCode.code__iexact joined on promo__site (scan)
+    normalized_code   CouponCode.normalized_code + site (unique index)
+    coupon table      compiled in-memory coupon table
+
+Usage:
+    python benchmarks/coupon_code_lookup.py --codes 1000000 --lookups 200
+"""
+import argparse
+import random
+import string
+import uuid
+
+import bootstrap  # noqa: F401 sets up Django
+
+from django.contrib.sites.models import Site
+from django.utils import timezone
+from vendor.models import Offer
+
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.utils import normalize_code
+
+
+def random_code(length=12):
+    return "".join(random.choices(string.ascii_uppercase + string.digits, k=length))
+
+
+def insert_codes(connection, promotional_campaign, total, batch_size):
+    """
+    Inserts the codes with executemany, CouponCode.save and bulk_create would
+    spend most of the time on AutoSlugField uniqueness queries.
+    """
+    now = timezone.now()
+    table = CouponCode._meta.db_table
+    sql = (f"INSERT INTO {table} (created, updated, uuid, active, code, max_redemptions, end_date, meta, promo_id, normalized_code, site_id) "
+           f"VALUES (%s, %s, %s, %s, %s, NULL, NULL, '{{}}', %s, %s, %s)")
+    codes = set()
+
+    while len(codes) < total:
+        codes.add(random_code())
+
+    codes = list(codes)
+    with connection.cursor() as cursor:
+        for start in range(0, total, batch_size):
+            cursor.executemany(sql, [
+                (now, now, uuid.uuid4().hex, True, code, promotional_campaign.pk, normalize_code(code), promotional_campaign.site_id)
+                for code in codes[start:start + batch_size]
+            ])
+
+    return codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    options = parser.parse_args()
+
+    with bootstrap.test_database() as connection:
+        site = Site.objects.get_current()
+        offer = Offer.objects.create(site=site, name="Benchmark Offer", start_date=timezone.now(), is_promotional=True)
+        promotional_campaign = PromotionalCampaign.objects.create(name="Benchmark Campaign", applies_to=offer, site=site, is_percent_off=True)
+
+        codes = insert_codes(connection, promotional_campaign, options.codes, options.batch_size)
+        print(f"Inserted {len(codes)} coupon codes")
+
+        # Mix of hits typed in lower case and misses, like customers at checkout
+        lookups = [(code.lower(),) for code in random.sample(codes, options.lookups // 2)]
+        lookups += [(random_code(),) for _ in range(options.lookups - len(lookups))]
+        random.shuffle(lookups)
+
+        def legacy_lookup(code):
+            list(CouponCode.objects.filter(code__iexact=code, promo__site=site)[:1])
+
+        def normalized_lookup(code):
+            list(CouponCode.objects.filter(normalized_code=normalize_code(code), site=site)[:1])
+
+        def coupon_table_lookup(code):
+            coupon_table.lookup(site.pk, code)
+
+        print(CouponCode.objects.filter(code__iexact="x", promo__site=site).explain())
+        print(CouponCode.objects.filter(normalized_code="x", site=site).explain())
+
+        bootstrap.report("legacy iexact", bootstrap.time_calls(legacy_lookup, lookups))
+        bootstrap.report("normalized_code", bootstrap.time_calls(normalized_lookup, lookups))
+        coupon_table.lookup(site.pk, "")  # Compile the table before timing lookups
+        bootstrap.report("coupon table", bootstrap.time_calls(coupon_table_lookup, lookups))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures the per-call latency of the Vouchery API calls with a new
+connection per call, the old requests.request() behaviour, against the
+pooled keep-alive session, using a local stub server.
+
+The stub is plain HTTP on localhost, so the saving shown is only the TCP
+connection setup. Against the real API each new connection also pays a TLS
+handshake and the network round trips, so the saving there is larger.
+
+Usage:
+    python benchmarks/vouchery_session.py --calls 500
+"""
+import argparse
+
+import bootstrap  # noqa: F401 sets up Django
+import requests
+
+from vendorpromo.http_sessions import close_sessions, request
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=500)
+    options = parser.parse_args()
+
+    server = FakeVoucheryServer().start()
+    url = f"{server.url}/vouchers/code/redemptions"
+    calls = [()] * options.calls
+
+    try:
+        request(server.url, "GET", url)  # Opens the pooled connection
+
+        bootstrap.report("new connection per call", bootstrap.time_calls(lambda: requests.request("GET", url), calls))
+        bootstrap.report("pooled session", bootstrap.time_calls(lambda: request(server.url, "GET", url), calls))
+
+        # is_code_valid_on_checkout makes two sequential calls
+        bootstrap.report("checkout, new connections", bootstrap.time_calls(lambda: (requests.request("GET", url), requests.request("POST", url, json={})), calls))
+        bootstrap.report("checkout, pooled session", bootstrap.time_calls(lambda: (request(server.url, "GET", url), request(server.url, "POST", url, json={})), calls))
+    finally:
+        close_sessions()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from vendorpromo.models import Affiliate, PromotionalCampaign, CouponCode, Promo
+from vendorpromo.models import Affiliate, PromotionalCampaign, CouponCode, Promo, SignedCodeRedemption, CampaignRedemption, VoucheryExport, DeferredValidation, OutboxMessage, StripeEvent
+from vendorpromo.utils import normalize_code
 from vendor.models import CustomerProfile, Offer
 
 
@@ -26,10 +27,10 @@ class AffiliateAdmin(admin.ModelAdmin):
 
 
 class PromotionalCampaignAdmin(admin.ModelAdmin):
-    readonly_fields = ('uuid',)
-    list_display = ('name', 'site')
+    readonly_fields = ('uuid', 'signed_code_count')
+    list_display = ('name', 'site', 'auto_apply', 'code_mode')
     search_fields = ('name',)
-    list_filter = ('site',)
+    list_filter = ('site', 'auto_apply', 'code_mode')
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "applies_to" and hasattr(request, 'site'):
@@ -40,13 +41,57 @@ class PromotionalCampaignAdmin(admin.ModelAdmin):
 class CouponCodeAdmin(admin.ModelAdmin):
     readonly_fields = ('uuid', 'invoice')
     list_display = ('code', 'promo')
-    search_fields = ('code', 'promo__name')
+    search_fields = ('promo__name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Codes are matched by prefix against the indexed normalized_code column
+        instead of a code__icontains scan, which does not scale to generated
+        code batches.
+        """
+        search_results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+
+        if search_term:
+            search_results |= queryset.filter(normalized_code__startswith=normalize_code(search_term))
+
+        return search_results, may_have_duplicates
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "promo" and hasattr(request, 'site'):
             kwargs["queryset"] = PromotionalCampaign.objects.filter(site=request.site)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
+class SignedCodeRedemptionAdmin(admin.ModelAdmin):
+    readonly_fields = ('promo', 'serial', 'invoice', 'created')
+    list_display = ('promo', 'serial', 'invoice', 'created')
+    list_filter = ('promo__site', )
+
+class CampaignRedemptionAdmin(admin.ModelAdmin):
+    readonly_fields = ('promo', 'invoice', 'created')
+    list_display = ('promo', 'invoice', 'created')
+    list_filter = ('promo__site', )
+
+class VoucheryExportAdmin(admin.ModelAdmin):
+    readonly_fields = ('promo', 'campaign_id', 'last_coupon_code_pk', 'exported_count', 'skipped_count', 'failed_count', 'seconds', 'throughput', 'completed', 'created', 'updated')
+    list_display = ('promo', 'campaign_id', 'exported_count', 'skipped_count', 'failed_count', 'throughput', 'completed')
+    list_filter = ('promo__site', )
+
+class DeferredValidationAdmin(admin.ModelAdmin):
+    readonly_fields = ('site', 'code', 'invoice', 'offer_cost', 'kind', 'attempts', 'is_valid', 'error', 'checked', 'created', 'updated')
+    list_display = ('code', 'site', 'invoice', 'kind', 'attempts', 'is_valid', 'checked')
+    list_filter = ('site', 'is_valid')
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    readonly_fields = ('site', 'processor', 'action', 'content_type', 'object_id', 'idempotency_key', 'status', 'attempts', 'next_attempt', 'error', 'sent', 'created', 'updated')
+    list_display = ('__str__', 'site', 'status', 'attempts', 'next_attempt', 'sent')
+    list_filter = ('site', 'status', 'processor')
+
+class StripeEventAdmin(admin.ModelAdmin):
+    readonly_fields = ('site', 'event_id', 'type', 'data', 'stripe_created', 'created', 'applied')
+    list_display = ('event_id', 'site', 'type', 'stripe_created', 'applied')
+    list_filter = ('site', 'type')
+    search_fields = ('event_id',)
+
 ###############
 # REGISTRATION
 ###############
@@ -54,3 +99,9 @@ admin.site.register(Promo, PromoAdmin)
 admin.site.register(Affiliate, AffiliateAdmin)
 admin.site.register(PromotionalCampaign, PromotionalCampaignAdmin)
 admin.site.register(CouponCode, CouponCodeAdmin)
+admin.site.register(SignedCodeRedemption, SignedCodeRedemptionAdmin)
+admin.site.register(CampaignRedemption, CampaignRedemptionAdmin)
+admin.site.register(VoucheryExport, VoucheryExportAdmin)
+admin.site.register(DeferredValidation, DeferredValidationAdmin)
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
+admin.site.register(StripeEvent, StripeEventAdmin)
@@ -0,0 +1,39 @@
+import logging
+
+import stripe
+from django.http.response import HttpResponse, HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+from vendor.utils import get_site_from_request
+
+from vendorpromo.processors.stripe_events import (apply_events,
+                                                  construct_event,
+                                                  is_handled_event,
+                                                  record_event)
+
+logger = logging.getLogger(__name__)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StripeWebhookAPIView(View):
+    """
+    Receives the site's Stripe webhook events. Redemption events are stored
+    and the pending ones applied to the local counters, the rest are
+    acknowledged and dropped.
+    """
+
+    def post(self, request, *args, **kwargs):
+        site = get_site_from_request(request)
+
+        try:
+            event = construct_event(request.body, request.META.get('HTTP_STRIPE_SIGNATURE', ""), site)
+        except (ValueError, stripe.error.SignatureVerificationError) as error:
+            logger.warning(f"StripeWebhookAPIView rejected an event for site {site.pk}: {error}")
+            return HttpResponseBadRequest()
+
+        if is_handled_event(event['type']) and record_event(site, event):
+            # The event is stored, if applying fails the apply_stripe_events command picks it up
+            apply_events(site=site, max_batches=1)
+
+        return HttpResponse()
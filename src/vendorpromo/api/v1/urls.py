@@ -1,14 +1,20 @@
 from django.urls import path
 
 from vendorpromo.api.v1 import views as api_views
+from vendorpromo.api.v1.stripe import views as stripe_api_views
 from vendorpromo.api.v1.vouchery import views as vouchery_api_views
 
 urlpatterns = [
     path('checkout/validate/<str:invoice_uuid>', api_views.ValidateCodeCheckoutProcessAPIView.as_view(), name='checkout-validation'),
     path('checkout/validate/<str:invoice_uuid>/coupon', api_views.ValidateCouponCodeCheckoutProcessAPIView.as_view(), name='checkout-validation-coupon-code'),
+    path('checkout/async/validate/<str:invoice_uuid>', api_views.AsyncValidateCodeCheckoutProcessAPIView.as_view(), name='checkout-validation-async'),
+    path('checkout/async/validate/<str:invoice_uuid>/coupon', api_views.AsyncValidateCouponCodeCheckoutProcessAPIView.as_view(), name='checkout-validation-coupon-code-async'),
+    path('checkout/auto-apply/<str:invoice_uuid>', api_views.AutoApplyPromotionAPIView.as_view(), name='checkout-auto-apply'),
     path('open/validate', api_views.ValidateLinkCodeAPIView.as_view(), name='open-validation'),
     path('delete/<str:uuid>', api_views.DeletePromoAPIView.as_view(), name='api-promo-delete'),
 
+    path('stripe/webhook', stripe_api_views.StripeWebhookAPIView.as_view(), name='stripe-webhook'),
+
     path('vouchery/promo/autocreate', vouchery_api_views.VoucheryCreateOfferPromoAPIView.as_view(), name='vouchery-promo-autocreate'),
     path('vouchery/campaigns', vouchery_api_views.VoucheryCampaignsView.as_view(), name='vouchery-campaigns-list'),
     path('vouchery/campaign/<int:campaign_id>', vouchery_api_views.VoucheryCampaignDetailView.as_view(), name='vouchery-campaigns-list'),
@@ -1,5 +1,6 @@
-import math
+from collections import namedtuple
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http.response import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
@@ -10,9 +11,23 @@ from django.views.generic import DeleteView, View
 from vendor.api.v1.views import AddToCartView
 from vendor.models import Invoice
 
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.auto_apply import apply_best_campaign
+from vendorpromo.discounts import get_cart_snapshot
 from vendorpromo.forms import PromoForm
+from vendorpromo.mixins import AsyncLoginRequiredMixin
 from vendorpromo.models import Promo, CouponCode
-from vendorpromo.processors import get_site_promo_processor
+from vendorpromo.processors import get_site_promo_processor_instance
+from vendorpromo.redemptions import (release_invoice_redemptions,
+                                     reserve_redemption,
+                                     reserve_signed_redemption)
+from vendorpromo.resolvers import (get_invoice_queryset,
+                                   get_order_items_product_ids,
+                                   resolve_order_items)
+from vendorpromo.signed_codes import parse_code, resolve_signed_code
+from vendorpromo.stacking import (can_stack, get_applied_coupons, solve_stack,
+                                  write_stack)
+from vendorpromo.utils import normalize_code
 
 
 class CreatePromoAPIView(LoginRequiredMixin, View):
@@ -25,7 +40,7 @@ class CreatePromoAPIView(LoginRequiredMixin, View):
             messages.info(request, _(f'Create Promo Failed. Errors: {promo_form.errors}'))
             return redirect(request.META.get('HTTP_REFERER', "vendorpromo-list"))
             
-        processor = get_site_promo_processor(promo.offer.site)(promo.offer.site)
+        processor = get_site_promo_processor_instance(promo.offer.site)
         processor.create_promo(promo_form)
         messages.success(request, _("Promo Code Created"))
         return redirect(request.META.get('HTTP_REFERER', "vendorpromo-list"))
@@ -37,25 +52,28 @@ class DeletePromoAPIView(LoginRequiredMixin, DeleteView):
     slug_url_kwarg = 'uuid'
 
     def post(self, request, *args, **kwargs):
-        processor = get_site_promo_processor(self.get_object().offer.site)(self.get_object().offer.site)
+        processor = get_site_promo_processor_instance(self.get_object().offer.site)
         processor.delete_promo(self.get_object())
         return redirect(request.META.get('HTTP_REFERER'))
 
 
-class ValidateCodeCheckoutProcessAPIView(LoginRequiredMixin, View):
+PromoCheckout = namedtuple('PromoCheckout', ['invoice', 'promo', 'offer_in_cart', 'processor'])
+
+
+class PromoCheckoutMixin:
     """
-    When a customer is applying a code during the checkout process
-    the function will check if the entered code is valid to the items
-    in the cart. If valsid it will swap the Offer with the Offer that
-    has that promo code. If not it will display an error message.
-    In both cases it will redirect to the view that called the
-    endpoint.
+    Steps of applying a Promo code on checkout shared by the sync and async
+    views, which only differ in how they call the processor.
     """
-    def post(self, request, *args, **kwargs):
+    def get_promo_checkout(self, request, invoice_uuid):
+        """
+        Returns the PromoCheckout for the code or the response with the reason
+        it can not be applied.
+        """
         offer_in_cart = None
         try:
-            invoice = get_object_or_404(Invoice, uuid=kwargs['invoice_uuid'])
-            promo = get_object_or_404(Promo, code=request.POST['promo_code'], offer__site=invoice.site)
+            invoice = get_object_or_404(Invoice, uuid=invoice_uuid)
+            promo = get_object_or_404(Promo, normalized_code=normalize_code(request.POST['promo_code']), site=invoice.site)
         except Http404 as error:
             messages.success(request, _("Invalid Promo Code"))
             return HttpResponseBadRequest(f"404 error: {error}")
@@ -70,17 +88,66 @@ class ValidateCodeCheckoutProcessAPIView(LoginRequiredMixin, View):
             messages.success(request, _("Invalid Promo Code"))
             return HttpResponseBadRequest(f"No related offer in cart for code: {promo.code}")
 
-        processor = get_site_promo_processor(invoice.site)(invoice.site, invoice=invoice)
+        processor = get_site_promo_processor_instance(invoice.site)
 
-        if not processor.is_code_valid_on_checkout(promo.code, promo.offer.current_price()):
-            messages.success(request, _("Invalid Promo Code"))
-            return HttpResponseBadRequest(f"Processor rejected code {promo.code}\nmsg:{processor.response_message}\nerror: {processor.response_error}")
+        return PromoCheckout(invoice, promo, offer_in_cart, processor)
+
+    def get_offer_cost(self, promo_checkout):
+        return promo_checkout.promo.offer.current_price()
+
+    def reject_promo(self, request, promo_checkout):
+        processor = promo_checkout.processor
+        messages.success(request, _("Invalid Promo Code"))
+        return HttpResponseBadRequest(f"Processor rejected code {promo_checkout.promo.code}\nmsg:{processor.response_message}\nerror: {processor.response_error}")
 
-        invoice.swap_offer(offer_in_cart, promo.offer)
+    def apply_promo(self, request, promo_checkout):
+        promo_checkout.invoice.swap_offer(promo_checkout.offer_in_cart, promo_checkout.promo.offer)
         messages.success(request, _("Promo Code Applied"))
         return HttpResponse(_("Promo Code Applied"))
 
 
+class ValidateCodeCheckoutProcessAPIView(LoginRequiredMixin, PromoCheckoutMixin, View):
+    """
+    When a customer is applying a code during the checkout process
+    the function will check if the entered code is valid to the items
+    in the cart. If valsid it will swap the Offer with the Offer that
+    has that promo code. If not it will display an error message.
+    In both cases it will redirect to the view that called the
+    endpoint.
+    """
+    def post(self, request, *args, **kwargs):
+        promo_checkout = self.get_promo_checkout(request, kwargs['invoice_uuid'])
+
+        if isinstance(promo_checkout, HttpResponse):
+            return promo_checkout
+
+        if not promo_checkout.processor.is_code_valid_on_checkout(promo_checkout.promo.code, self.get_offer_cost(promo_checkout), invoice=promo_checkout.invoice):
+            return self.reject_promo(request, promo_checkout)
+
+        return self.apply_promo(request, promo_checkout)
+
+
+class AsyncValidateCodeCheckoutProcessAPIView(AsyncLoginRequiredMixin, PromoCheckoutMixin, View):
+    """
+    Async version of ValidateCodeCheckoutProcessAPIView for ASGI. The
+    database steps run in a worker thread, Django 3.2 has no async ORM, and
+    the processor's external calls are awaited so the worker is free while
+    they are in flight.
+    """
+    async def post(self, request, *args, **kwargs):
+        promo_checkout = await sync_to_async(self.get_promo_checkout)(request, kwargs['invoice_uuid'])
+
+        if isinstance(promo_checkout, HttpResponse):
+            return promo_checkout
+
+        offer_cost = await sync_to_async(self.get_offer_cost)(promo_checkout)
+
+        if not await promo_checkout.processor.ais_code_valid_on_checkout(promo_checkout.promo.code, offer_cost, invoice=promo_checkout.invoice):
+            return await sync_to_async(self.reject_promo)(request, promo_checkout)
+
+        return await sync_to_async(self.apply_promo)(request, promo_checkout)
+
+
 class ValidateLinkCodeAPIView(AddToCartView):
     """
     Endpoint used when a customer clicks on a link that has a promo code.
@@ -124,84 +191,160 @@ class ValidateLinkCodeAPIView(AddToCartView):
         # return super().post(request, args, kwargs)
 
 
-def does_coupon_apply_to_order_item(coupon_code, order_item_products):
-    return next((product for product in coupon_code.promo.applies_to.products.all() if product in order_item_products), False)
+CouponCheckout = namedtuple('CouponCheckout', ['invoice', 'compiled_coupon', 'coupon_code', 'order_items', 'applied_coupons', 'cart_order_items', 'processor'])
 
 
-class ValidateCouponCodeCheckoutProcessAPIView(LoginRequiredMixin, View):
+class CouponCodeCheckoutMixin:
     """
-    When a customer is applying a code during the checkout process
-    the function will check if the entered code is valid to the items
-    in the cart. If valsid it will swap the Offer with the Offer that
-    has that promo code. If not it will display an error message.
-    In both cases it will redirect to the view that called the
-    endpoint.
+    Steps of applying a coupon code on checkout shared by the sync and async
+    views, which only differ in how they call the processor.
     """
-    def post(self, request, *args, **kwargs):
+    def get_coupon_checkout(self, request, invoice_uuid):
+        """
+        Returns the CouponCheckout for the code or the response with the reason
+        it can not be applied. Everything is checked here except the
+        processor, which is called next, before any redemption is reserved.
+        """
         try:
             now = timezone.now()
-            invoice = get_object_or_404(Invoice, uuid=kwargs['invoice_uuid'])
-            coupon_code = get_object_or_404(CouponCode, code__iexact=request.POST['promo_code'], promo__site=invoice.site)
+            invoice = get_object_or_404(get_invoice_queryset(), uuid=invoice_uuid)
+            compiled_coupon = coupon_table.lookup(invoice.site_id, request.POST['promo_code']) or resolve_signed_code(invoice.site_id, request.POST['promo_code'])
         except Http404 as error:
             return JsonResponse({'error': _("Invalid Code")}, status=404)
-        
-        if coupon_code.promo.start_date and now < coupon_code.promo.start_date:
+
+        # The compiled coupon table answers invalid, inactive, out of window and
+        # non applicable codes without querying the coupon code tables.
+        if compiled_coupon is None or not compiled_coupon.active:
+            return JsonResponse({'error': _("Invalid Code")}, status=404)
+
+        if compiled_coupon.start_date and now < compiled_coupon.start_date:
             return JsonResponse({'error': "Code has not been released"}, status=404)
 
-        if coupon_code.promo.end_date and now > coupon_code.promo.end_date:
+        if compiled_coupon.end_date and now > compiled_coupon.end_date:
             return JsonResponse({'error': "Code has expired"}, status=404)
 
-        if invoice.order_items.filter(offer__is_promotional=True).exists():
-            return JsonResponse({'error': "You can only apply one promo code per checkout session"}, status=404)
+        order_items = resolve_order_items(invoice)
+        applied_coupons, other_promotional_offers = get_applied_coupons(invoice, order_items)
+        applied_coupons = [applied_coupon for applied_coupon in applied_coupons if applied_coupon.pk != compiled_coupon.pk]
 
-        processor = get_site_promo_processor(invoice.site)(invoice.site, invoice=invoice)
-        if not processor.is_code_valid(coupon_code):
-            return JsonResponse({'error': _("Invalid Code")}, status=404)
+        # Codes can only be combined when all their campaigns share a stack group
+        if other_promotional_offers or not can_stack(applied_coupons + [compiled_coupon]):
+            return JsonResponse({'error': "You can only apply one promo code per checkout session"}, status=404)
 
-        invoice_products = invoice.get_products()
-        if not next((product for product in coupon_code.promo.applies_to.products.all() if product in invoice_products), False):
+        cart_order_items = [order_item for order_item in order_items if not order_item.offer.is_promotional]
+        if not compiled_coupon.product_ids & get_order_items_product_ids(cart_order_items):
             return JsonResponse({'error': _("Code does not apply to any of the products in you cart")}, status=404)
-        
-        if invoice.profile.has_owned_product(coupon_code.promo.applies_to.products.all()):
+
+        if invoice.profile.has_owned_product(list(compiled_coupon.product_ids)):
             return JsonResponse({'error': _("Code only applies to first time purchases")}, status=404)
-        
-        coupon_code.invoice.add(invoice)
-        invoice.add_offer(coupon_code.promo.applies_to)
 
-        coupon_order_item = invoice.order_items.get(offer=coupon_code.promo.applies_to)
-        if coupon_code.promo.applies_to.products.count():  # Calculate discount independently 
-            invoice_order_items = invoice.order_items.all().exclude(offer=coupon_code.promo.applies_to)
-            
-            if coupon_code.promo.is_percent_off:
-                # Calculate global_discount
-                total_global_discount = 0
-                for order_item in invoice_order_items:
-                    order_item_products = list(order_item.offer.products.all())
-                    coupon_code_discount_value = math.fabs(coupon_code.promo.applies_to.current_price())
-                    if does_coupon_apply_to_order_item(coupon_code, order_item_products):
-                        total_global_discount += (order_item.total * coupon_code_discount_value) / 100
-                
-                # invoice.global_discount = total_global_discount - coupon_code_discount_value
-                invoice.global_discount = total_global_discount
-                invoice.update_totals()
-                invoice.save()
-
-            else:
-                coupon_count = 0
-                for order_item in invoice_order_items:
-                    order_item_products = list(order_item.offer.products.all())
-                    if does_coupon_apply_to_order_item(coupon_code, order_item_products):
-                        coupon_count += order_item.quantity
-
-                coupon_order_item.quantity = coupon_count
-                coupon_order_item.save()
-                invoice.update_totals()
+        # Signed codes are validated by their signature, there is no Coupon Code
+        # for the processor to check.
+        coupon_code, processor = None, None
+
+        if compiled_coupon.pk is not None:
+            # One query for the row the redemption is reserved on, without the
+            # campaign and offer joins the compiled coupon already answered. The
+            # table can miss a change made to the code without its signals, the
+            # row has the final say on the code's own active flag and end date.
+            coupon_code = CouponCode.objects.filter(pk=compiled_coupon.pk).first()
+
+            if coupon_code is None or not coupon_code.active:
+                return JsonResponse({'error': _("Invalid Code")}, status=404)
+
+            if coupon_code.end_date and now > coupon_code.end_date:
+                return JsonResponse({'error': "Code has expired"}, status=404)
+
+            processor = get_site_promo_processor_instance(invoice.site)
+
+        return CouponCheckout(invoice, compiled_coupon, coupon_code, order_items, applied_coupons, cart_order_items, processor)
+
+    def reject_coupon(self, request, coupon_checkout):
+        return JsonResponse({'error': _("Invalid Code")}, status=404)
+
+    def apply_coupon(self, request, coupon_checkout):
+        invoice, compiled_coupon, coupon_code, order_items, applied_coupons, cart_order_items, _processor = coupon_checkout
+
+        # Reserved last so failed validations never take a redemption. Re-applying
+        # a code already linked to the invoice does not count as a new redemption.
+        if compiled_coupon.pk is None:
+            if not reserve_signed_redemption(parse_code(compiled_coupon.code), invoice):
+                return JsonResponse({'error': _("Code has already been redeemed")}, status=404)
         else:
-            if coupon_code.promo.is_percent_off:
-                # Calculate global_discount
-                invoice.global_discount = (invoice.subtotal * coupon_code.promo.applies_to.current_price()) / 100
-                invoice.update_totals()
-                invoice.save()
-                
+            if not coupon_code.invoice.filter(pk=invoice.pk).exists() and not reserve_redemption(coupon_code):
+                return JsonResponse({'error': _("Code has reached its maximum redemptions")}, status=404)
+
+            coupon_code.invoice.add(invoice)
+
+        stack, total = solve_stack(get_cart_snapshot(cart_order_items), applied_coupons + [compiled_coupon])
+        stack_pks = set(stacked_coupon.pk for stacked_coupon, _stacked_discount in stack)
+
+        if compiled_coupon.pk not in stack_pks:
+            release_invoice_redemptions(invoice, [compiled_coupon])
+            return JsonResponse({'error': _("Code does not add to the discount of the codes already applied")}, status=404)
+
+        # Codes dropped from the stack are released along with their order item,
+        # the ones sharing an offer with a code that stays are released here.
+        write_stack(invoice, order_items, stack, total)
+        release_invoice_redemptions(invoice, [applied_coupon for applied_coupon in applied_coupons if applied_coupon.pk not in stack_pks])
+
         messages.success(request, _("Promo Code Applied"))
         return HttpResponse(_("Promo Code Applied"))
+
+
+class ValidateCouponCodeCheckoutProcessAPIView(LoginRequiredMixin, CouponCodeCheckoutMixin, View):
+    """
+    When a customer is applying a code during the checkout process
+    the function will check if the entered code is valid to the items
+    in the cart. If valsid it will swap the Offer with the Offer that
+    has that promo code. If not it will display an error message.
+    In both cases it will redirect to the view that called the
+    endpoint. Codes from campaigns in the same stack group are
+    combined with the codes already applied, keeping the combination
+    that saves the most. Codes that are not in the coupon table are
+    checked as signed codes.
+    """
+    def post(self, request, *args, **kwargs):
+        coupon_checkout = self.get_coupon_checkout(request, kwargs['invoice_uuid'])
+
+        if isinstance(coupon_checkout, HttpResponse):
+            return coupon_checkout
+
+        if coupon_checkout.processor is not None and not coupon_checkout.processor.is_code_valid(coupon_checkout.coupon_code, invoice=coupon_checkout.invoice):
+            return self.reject_coupon(request, coupon_checkout)
+
+        return self.apply_coupon(request, coupon_checkout)
+
+
+class AsyncValidateCouponCodeCheckoutProcessAPIView(AsyncLoginRequiredMixin, CouponCodeCheckoutMixin, View):
+    """
+    Async version of ValidateCouponCodeCheckoutProcessAPIView for ASGI. The
+    database steps run in a worker thread, Django 3.2 has no async ORM, and
+    the processor's external call is awaited so the worker is free while it
+    is in flight.
+    """
+    async def post(self, request, *args, **kwargs):
+        coupon_checkout = await sync_to_async(self.get_coupon_checkout)(request, kwargs['invoice_uuid'])
+
+        if isinstance(coupon_checkout, HttpResponse):
+            return coupon_checkout
+
+        if coupon_checkout.processor is not None and not await coupon_checkout.processor.ais_code_valid(coupon_checkout.coupon_code, invoice=coupon_checkout.invoice):
+            return self.reject_coupon(request, coupon_checkout)
+
+        return await sync_to_async(self.apply_coupon)(request, coupon_checkout)
+
+
+class AutoApplyPromotionAPIView(LoginRequiredMixin, View):
+    """
+    Applies the auto apply campaign that saves the customer the most on the
+    items in the cart, if there is one and the cart does not have a promotion yet.
+    """
+    def post(self, request, *args, **kwargs):
+        invoice = get_object_or_404(get_invoice_queryset(), uuid=kwargs['invoice_uuid'])
+
+        if apply_best_campaign(invoice) is None:
+            return JsonResponse({'error': _("No promotion applies to your cart")}, status=404)
+
+        messages.success(request, _("Promotion Applied"))
+        return HttpResponse(_("Promotion Applied"))
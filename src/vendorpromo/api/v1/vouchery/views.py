@@ -1,5 +1,6 @@
 import json
 import logging
+from collections import namedtuple
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http.response import Http404, HttpResponseBadRequest, HttpResponseServerError
@@ -7,6 +8,7 @@ from django.shortcuts import render, redirect
 from django.views.generic import TemplateView, FormView
 from django.utils.translation import gettext as _
 
+from vendorpromo.processors import processor_pool
 from vendorpromo.processors.vouchery import VoucheryProcessor
 from vendorpromo.forms import VoucherySearchForm, PromoForm
 
@@ -23,7 +25,7 @@ class VoucheryCreateOfferPromoAPIView(LoginRequiredMixin, FormView):
         if not promo_form.is_valid():
             raise HttpResponseBadRequest()
 
-        processor = VoucheryProcessor(get_site_from_request(request))
+        processor = processor_pool.get(get_site_from_request(request), VoucheryProcessor)
         try:
             processor.create_promo_automate(promo_form)
 
@@ -36,40 +38,91 @@ class VoucheryCreateOfferPromoAPIView(LoginRequiredMixin, FormView):
         return redirect(request.META.get('HTTP_REFERER'))
 
 
-# The following views are intended for Sys Admins to quickly and easy monitor
-# the state of there vouchery account. It is not recommended that this tools
-# are made available to commeners.
-# TODO: Should probably add more admin/perms
-class VoucheryCampaignsView(LoginRequiredMixin, TemplateView):
+class VoucheryPage(namedtuple('VoucheryPage', ['number', 'has_next'])):
+    """
+    The parts of Django's Page the list template uses, for lists where the
+    total number of items is not known.
+    """
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+
+class VoucheryListMixin(object):
+    """
+    Renders one page of a Vouchery list with a single call for the requested
+    page. Vouchery does not return the total, so a full page is taken to mean
+    there is a next one.
+    """
     template_name = 'vendorpromo/vouchery_list.html'
+    paginate_by = 25
+    search_form_class = VoucherySearchForm
 
-    def get(self, request, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
+    def get_path_route(self, processor):
+        raise NotImplementedError
 
-        processor = VoucheryProcessor(get_site_from_request(request))
-        processor.get_campaigns()
+    def get_page_number(self):
+        try:
+            return max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            return 1
+
+    def render_page(self, request, form, **kwargs):
+        context = super().get_context_data(**kwargs)
+        querystring = {}
 
-        if not processor.is_request_success:
-            raise HttpResponseBadRequest(_(f"Error: {processor.response_message}"))
+        if form is not None and form.is_valid():
+            querystring = form.cleaned_data['querystring'] or {}
 
-        context['object_list'] = processor.response_content
-        context['form'] = VoucherySearchForm
+        page_number = self.get_page_number()
+        processor = processor_pool.get(get_site_from_request(request), VoucheryProcessor)
+
+        result = processor.get_page(self.get_path_route(processor), page_number, self.paginate_by, **querystring)
+
+        if not result.is_success:
+            return HttpResponseBadRequest(_(f"Error: {result.message}"))
+
+        object_list = result.content or []
+        context['object_list'] = object_list
+        context['page_obj'] = VoucheryPage(page_number, len(object_list) == self.paginate_by)
+        context['querystring'] = json.dumps(querystring) if querystring else ""
+        context['form'] = form
 
         return render(request, self.template_name, context)
 
+    def get(self, request, *args, **kwargs):
+        form = None
+
+        if self.search_form_class:
+            form = self.search_form_class(request.GET) if 'querystring' in request.GET else self.search_form_class()
+
+        return self.render_page(request, form, **kwargs)
+
     def post(self, request, *args, **kwargs):
-        context = super().get_context_data(**kwargs)
-        vouchery_search_form = VoucherySearchForm(request.POST)
+        if not self.search_form_class:
+            return self.get(request, *args, **kwargs)
 
-        processor = VoucheryProcessor(get_site_from_request(request))
-        processor.get_campaigns(**json.loads(vouchery_search_form.data['querystring']))
+        return self.render_page(request, self.search_form_class(request.POST), **kwargs)
 
-        if not processor.is_request_success:
-            raise HttpResponseBadRequest(_(f"Error: {processor.response_message}"))
 
-        context['object_list'] = processor.response_content
-        context['form'] = vouchery_search_form
-        return render(request, self.template_name, context)
+# The following views are intended for Sys Admins to quickly and easy monitor
+# the state of there vouchery account. It is not recommended that this tools
+# are made available to commeners.
+# TODO: Should probably add more admin/perms
+class VoucheryCampaignsView(LoginRequiredMixin, VoucheryListMixin, TemplateView):
+
+    def get_path_route(self, processor):
+        return [processor.CAMPAIGN_URL]
 
 
 class VoucheryCampaignDetailView(LoginRequiredMixin, TemplateView):
@@ -78,31 +131,21 @@ class VoucheryCampaignDetailView(LoginRequiredMixin, TemplateView):
     def get(self, request, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         
-        processor = VoucheryProcessor(get_site_from_request(request))
-        processor.get_campaign(kwargs.get('campaign_id'))
+        processor = processor_pool.get(get_site_from_request(request), VoucheryProcessor)
+        result = processor.get_campaign(kwargs.get('campaign_id'))
         
-        if not processor.is_request_success:
-            raise HttpResponseBadRequest(_(f"Error: {processor.response_message}"))
-        context['object'] = processor.response_content
+        if not result.is_success:
+            raise HttpResponseBadRequest(_(f"Error: {result.message}"))
+        context['object'] = result.content
         
         return render(request, self.template_name, context)
 
 
-class VoucheryRedeemListView(LoginRequiredMixin, TemplateView):
-    template_name = 'vendorpromo/vouchery_list.html'
+class VoucheryRedeemListView(LoginRequiredMixin, VoucheryListMixin, TemplateView):
+    search_form_class = None
 
-    def get(self, request, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        
-        processor = VoucheryProcessor(get_site_from_request(request))
-        processor.get_redeems(kwargs.get('campaign_id'))
-        
-        if not processor.is_request_success:
-            raise HttpResponseBadRequest(_(f"Error: {processor.response_message}"))
-        
-        context['object_list'] = processor.response_content
-        
-        return render(request, self.template_name, context)
+    def get_path_route(self, processor):
+        return [processor.CAMPAIGN_URL, str(self.kwargs.get('campaign_id')), processor.REDEMPTION_URL]
 
 
 class VoucheryRedeemDetailView(LoginRequiredMixin, TemplateView):
@@ -111,49 +154,21 @@ class VoucheryRedeemDetailView(LoginRequiredMixin, TemplateView):
     def get(self, request, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         
-        processor = VoucheryProcessor()
-        processor.get_redeem(kwargs.get('code'), kwargs.get('transaction_id'))
+        processor = processor_pool.get(get_site_from_request(request), VoucheryProcessor)
+        result = processor.get_redeem(kwargs.get('code'), kwargs.get('transaction_id'))
 
-        if not processor.is_request_success:
+        if not result.is_success:
             raise Http404()
 
-        context['object'] = processor.response_content
-        
-        return render(request, self.template_name, context)
-
-
-class VoucheryVouchersView(LoginRequiredMixin, TemplateView):
-    template_name = 'vendorpromo/vouchery_list.html'
-
-    def get(self, request, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        
-        processor = VoucheryProcessor()
-        processor.get_vouchers(kwargs.get('campaign_id'))
-        
-        if not processor.is_request_success:
-            raise HttpResponseBadRequest(_(f"Error: {processor.response_message}"))
-        
-        context['object_list'] = processor.response_content
-        context['form'] = VoucherySearchForm
+        context['object'] = result.content
         
         return render(request, self.template_name, context)
 
-    def post(self, request, *args, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        vouchery_search_form = VoucherySearchForm(request.POST)
 
-        processor = VoucheryProcessor()
-        processor.get_vouchers(kwargs.get('campaign_id'), **json.loads(vouchery_search_form.data['params']))
+class VoucheryVouchersView(LoginRequiredMixin, VoucheryListMixin, TemplateView):
 
-        if not processor.is_request_success:
-            raise HttpResponseBadRequest(_(f"Error: {processor.response_message}"))
-
-        context['object_list'] = processor.response_content
-        context['form'] = vouchery_search_form
-        
-        return render(request, self.template_name, context)
+    def get_path_route(self, processor):
+        return [processor.CAMPAIGN_URL, str(self.kwargs.get('campaign_id')), processor.VOUCHER_URL]
 
 
 class VoucheryVoucherDetailView(LoginRequiredMixin, TemplateView):
@@ -161,12 +176,12 @@ class VoucheryVoucherDetailView(LoginRequiredMixin, TemplateView):
 
     def get(self, request, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
-        processor = VoucheryProcessor()
-        processor.get_voucher(kwargs.get('code'))
+        processor = processor_pool.get(get_site_from_request(request), VoucheryProcessor)
+        result = processor.get_voucher(kwargs.get('code'))
 
-        if not processor.is_request_success:
+        if not result.is_success:
             raise Http404()
 
-        context['object'] = processor.response_content
+        context['object'] = result.content
         
         return render(request, self.template_name, context)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DjangoVendorPromoConfig(AppConfig):
     name = 'vendorpromo'
+
+    def ready(self):
+        import vendorpromo.signals
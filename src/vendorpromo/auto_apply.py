@@ -0,0 +1,103 @@
+"""
+Picks and applies the auto apply campaign that saves the customer the most.
+
+Candidate campaigns come from the campaign index, one lookup per product in
+the cart, and each candidate is priced against the cart snapshot with the
+same discount engine used for coupon codes, so picking the best campaign
+runs no queries once the cart is loaded.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from vendor.models import Offer
+
+from vendorpromo.campaign_index import campaign_index
+from vendorpromo.discounts import (apply_discount, calculate_discount,
+                                   get_cart_snapshot)
+from vendorpromo.redemptions import reserve_campaign_redemption
+from vendorpromo.resolvers import resolve_order_items
+
+
+def get_auto_apply_campaign_lines(site_id, cart_lines, now=None):
+    """
+    Returns a list of (IndexedCampaign, cart lines) for the auto apply
+    campaigns running now, each with only the cart lines it applies to.
+    """
+    product_campaigns = campaign_index.lookup(site_id, set().union(*(cart_line.product_ids for cart_line in cart_lines)), now)
+    campaigns = {}
+    campaign_lines = defaultdict(dict)
+
+    for cart_line in cart_lines:
+        for product_pk in cart_line.product_ids:
+            for indexed_campaign in product_campaigns.get(product_pk, ()):
+                if indexed_campaign.auto_apply:
+                    campaigns[indexed_campaign.pk] = indexed_campaign
+                    campaign_lines[indexed_campaign.pk][cart_line.pk] = cart_line
+
+    return [(indexed_campaign, list(campaign_lines[pk].values())) for pk, indexed_campaign in campaigns.items()]
+
+
+def rank_auto_apply_campaigns(site_id, cart_lines, now=None):
+    """
+    Returns (IndexedCampaign, CouponDiscount) for the auto apply campaigns that
+    discount the cart, from the highest to the lowest saving. Ties go to the
+    oldest campaign. Each campaign is only priced against the lines it applies
+    to, so the cost grows with the matches instead of campaigns x lines.
+    """
+    ranked_campaigns = []
+
+    for indexed_campaign, matched_lines in get_auto_apply_campaign_lines(site_id, cart_lines, now):
+        coupon_discount = calculate_discount(matched_lines, indexed_campaign)
+
+        if coupon_discount.total > 0:
+            ranked_campaigns.append((coupon_discount.total, indexed_campaign, coupon_discount))
+
+    ranked_campaigns.sort(key=lambda ranked_campaign: (-ranked_campaign[0], ranked_campaign[1].pk))
+
+    return [(indexed_campaign, coupon_discount) for _, indexed_campaign, coupon_discount in ranked_campaigns]
+
+
+def get_best_campaign(invoice, order_items=None, now=None):
+    """
+    Returns (IndexedCampaign, CouponDiscount) for the auto apply campaign that
+    saves the most on the invoice or None if no campaign applies.
+    """
+    if order_items is None:
+        order_items = resolve_order_items(invoice)
+
+    ranked_campaigns = rank_auto_apply_campaigns(invoice.site_id, get_cart_snapshot(order_items), now)
+
+    return ranked_campaigns[0] if ranked_campaigns else None
+
+
+def apply_best_campaign(invoice, now=None):
+    """
+    Adds the offer of the best auto apply campaign to the invoice and applies
+    its discount. Campaigns for products the customer already owns or that
+    reached max_redemptions are skipped for the next best one. The redemption
+    is reserved in the same transaction that adds the offer and its discount,
+    so it is not kept if either fails, and given back if the offer is removed
+    before checkout, see vendorpromo.signals. Returns the applied
+    IndexedCampaign or None if the cart already has a promotion or no
+    campaign applies.
+    """
+    order_items = resolve_order_items(invoice)
+
+    if any(order_item.offer.is_promotional for order_item in order_items):
+        return None
+
+    for indexed_campaign, coupon_discount in rank_auto_apply_campaigns(invoice.site_id, get_cart_snapshot(order_items), now):
+        # Promotions only apply to first time purchases, like coupon codes
+        if invoice.profile.has_owned_product(list(indexed_campaign.product_ids)):
+            continue
+
+        with transaction.atomic():
+            if not reserve_campaign_redemption(indexed_campaign.pk, invoice):
+                continue
+
+            coupon_order_item = invoice.add_offer(Offer.objects.get(pk=indexed_campaign.offer_pk))
+            apply_discount(invoice, coupon_order_item, coupon_discount, indexed_campaign.is_percent_off)
+
+        return indexed_campaign
+
+    return None
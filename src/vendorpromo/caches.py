@@ -0,0 +1,125 @@
+import random
+import threading
+
+from django.core.cache import cache
+
+from vendorpromo.config import VENDOR_PROMO_TABLE_CACHE_TIMEOUT
+
+
+class SiteTable(object):
+    """
+    Base class for a compiled per-site lookup table.
+
+    The table for each site is held in process memory and shared with other
+    processes through Django's cache framework. Each site has a version
+    counter in the cache and a table is only used while it was compiled under
+    the current version. A change calls invalidate(), which increments the
+    version, so every process compiles the table again on its next get(). A
+    table compiled from data read before the change is stored under the old
+    version and never used. Changes to a few entries call patch() instead,
+    which stores the patched table under the next version so the other
+    processes load it from the cache instead of compiling it. A patch is
+    dropped if another change moved the version on in the meantime.
+    Subclasses implement compile() to build the full table for a site from
+    the database.
+    """
+    name = None
+    timeout = VENDOR_PROMO_TABLE_CACHE_TIMEOUT
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    def get_cache_key(self, site_id):
+        return f"vendorpromo.{self.name}.{site_id}"
+
+    def get_version_key(self, site_id):
+        return f"vendorpromo.{self.name}.{site_id}.version"
+
+    def compile(self, site_id):
+        """
+        Returns a dict with the full table for the site.
+        """
+        raise NotImplementedError
+
+    def get_version(self, site_id):
+        version = cache.get(self.get_version_key(site_id))
+
+        if version is None:
+            # A random start, so a table cached under an evicted version is not picked up again
+            cache.add(self.get_version_key(site_id), random.getrandbits(62), self.timeout)
+            version = cache.get(self.get_version_key(site_id))
+
+        return version
+
+    def increment_version(self, site_id):
+        """
+        Returns the next version of the site, or None if it had no version
+        that could be incremented and a new one was set.
+        """
+        try:
+            return cache.incr(self.get_version_key(site_id))
+        except (ValueError, TypeError):
+            # Missing, or not a counter like the versions of earlier releases
+            cache.set(self.get_version_key(site_id), random.getrandbits(62), self.timeout)
+            return None
+
+    def get(self, site_id):
+        """
+        Returns the table for the site. It is treated as read only, changes
+        to the data it is compiled from must call invalidate().
+        """
+        version = cache.get(self.get_version_key(site_id))
+        local_version, table = self._tables.get(site_id, (None, None))
+
+        if version is not None and version == local_version:
+            return table
+
+        with self._lock:
+            cached_version, table = cache.get(self.get_cache_key(site_id), (None, None))
+
+            if version is not None and version == cached_version:
+                self._tables[site_id] = (cached_version, table)
+                return table
+
+            # Read before compiling, so a change committed in the meantime leaves this table behind
+            version = self.get_version(site_id)
+            table = self.compile(site_id)
+            cache.set(self.get_cache_key(site_id), (version, table), self.timeout)
+            self._tables[site_id] = (version, table)
+            return table
+
+    def patch(self, site_id, apply):
+        """
+        Applies a change to the site's current table. apply(table) returns a
+        patched copy, the table itself is shared with readers, or None if the
+        table has to be compiled again. Without a current table to patch this
+        is the same as invalidate().
+        """
+        version = cache.get(self.get_version_key(site_id))
+        cached_version, table = cache.get(self.get_cache_key(site_id), (None, None))
+        table = apply(table) if isinstance(version, int) and version == cached_version else None
+
+        if table is None:
+            return self.invalidate(site_id)
+
+        # Counters are incremented atomically, any other change in between
+        # moves the version past this one and the patch is left unused.
+        next_version = self.increment_version(site_id)
+
+        if next_version != version + 1:
+            cache.delete(self.get_cache_key(site_id))
+            self._tables.pop(site_id, None)
+            return None
+
+        cache.set(self.get_cache_key(site_id), (next_version, table), self.timeout)
+        self._tables[site_id] = (next_version, table)
+
+    def invalidate(self, site_id):
+        self.increment_version(site_id)
+        cache.delete(self.get_cache_key(site_id))
+        self._tables.pop(site_id, None)
+
+    def clear(self):
+        for site_id in list(self._tables.keys()):
+            self.invalidate(site_id)
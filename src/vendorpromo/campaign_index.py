@@ -0,0 +1,124 @@
+"""
+Inverted index from product id to the promotional campaigns that apply to it.
+
+Each site gets a dict that maps a product id to a tuple of IndexedCampaign
+with the campaign's date window and the discount compiled from its offer.
+Finding the campaigns for a cart is one dict lookup per product and the date
+window is checked at lookup time. Campaigns that have already ended are left
+out when the index is compiled. The handlers in vendorpromo.signals refresh
+the entries of a campaign whenever it or the products or prices of its offer
+change.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from vendorpromo.caches import SiteTable
+from vendorpromo.coupon_table import compile_campaign
+from vendorpromo.resolvers import get_promotional_campaign_queryset
+
+IndexedCampaign = namedtuple('IndexedCampaign', [
+    'pk',
+    'offer_pk',
+    'start_date',
+    'end_date',
+    'auto_apply',
+    'is_percent_off',
+    'discount_value',
+    'product_ids',
+])
+
+
+def is_campaign_running(indexed_campaign, now):
+    if indexed_campaign.start_date and now < indexed_campaign.start_date:
+        return False
+
+    if indexed_campaign.end_date and now > indexed_campaign.end_date:
+        return False
+
+    return True
+
+
+def index_campaigns(**filters):
+    """
+    Returns a dict that maps product ids to the IndexedCampaign of the
+    campaigns that match the filters and have not ended (3 queries).
+    """
+    product_campaigns = defaultdict(list)
+    promotional_campaigns = get_promotional_campaign_queryset().filter(Q(end_date__isnull=True) | Q(end_date__gt=timezone.now()), **filters)
+
+    for promotional_campaign in promotional_campaigns:
+        compiled_campaign = compile_campaign(promotional_campaign)
+        indexed_campaign = IndexedCampaign(
+            pk=compiled_campaign['campaign_pk'],
+            offer_pk=compiled_campaign['offer_pk'],
+            start_date=compiled_campaign['start_date'],
+            end_date=compiled_campaign['end_date'],
+            auto_apply=promotional_campaign.auto_apply,
+            is_percent_off=compiled_campaign['is_percent_off'],
+            discount_value=compiled_campaign['discount_value'],
+            product_ids=compiled_campaign['product_ids'],
+        )
+
+        for product_pk in indexed_campaign.product_ids:
+            product_campaigns[product_pk].append(indexed_campaign)
+
+    return product_campaigns
+
+
+class CampaignIndex(SiteTable):
+    name = "campaign_index"
+
+    def compile(self, site_id):
+        return {product_pk: tuple(indexed_campaigns) for product_pk, indexed_campaigns in index_campaigns(site=site_id).items()}
+
+    def lookup(self, site_id, product_pks, now=None):
+        """
+        Returns a dict that maps each of the product ids to the IndexedCampaign
+        of the campaigns running now. Products without campaigns are left out.
+        """
+        now = now or timezone.now()
+        table = self.get(site_id)
+        product_campaigns = {}
+
+        for product_pk in product_pks:
+            indexed_campaigns = [indexed_campaign for indexed_campaign in table.get(product_pk, ()) if is_campaign_running(indexed_campaign, now)]
+
+            if indexed_campaigns:
+                product_campaigns[product_pk] = indexed_campaigns
+
+        return product_campaigns
+
+    def lookup_campaign_pks(self, site_id, product_pks, now=None):
+        """
+        Returns the ids of the campaigns running now that apply to any of the products.
+        """
+        return set(indexed_campaign.pk for indexed_campaigns in self.lookup(site_id, product_pks, now).values() for indexed_campaign in indexed_campaigns)
+
+    def refresh_campaigns(self, site_id, campaign_pks, remove=False):
+        """
+        Replaces the entries of the campaigns with the campaigns indexed
+        again, or drops them if remove is True.
+        """
+        campaign_pks = set(campaign_pks)
+
+        def apply(table):
+            product_campaigns = defaultdict(list)
+
+            for product_pk, indexed_campaigns in table.items():
+                product_campaigns[product_pk].extend(indexed_campaign for indexed_campaign in indexed_campaigns if indexed_campaign.pk not in campaign_pks)
+
+            if not remove:
+                for product_pk, indexed_campaigns in index_campaigns(site=site_id, pk__in=campaign_pks).items():
+                    product_campaigns[product_pk].extend(indexed_campaigns)
+
+            return {product_pk: tuple(indexed_campaigns) for product_pk, indexed_campaigns in product_campaigns.items() if indexed_campaigns}
+
+        self.patch(site_id, apply)
+
+    def remove_campaigns(self, site_id, campaign_pks):
+        self.refresh_campaigns(site_id, campaign_pks, remove=True)
+
+
+campaign_index = CampaignIndex()
@@ -0,0 +1,153 @@
+"""
+Circuit breaker for the promo processors' external calls.
+
+Each processor and site has a breaker whose state lives in Django's cache, so
+every worker sees the same state. Calls and failures are counted in fixed
+windows of the policy's window seconds, a call that takes longer than
+slow_call_seconds counts as failed too. Once a window has min_calls calls and
+failure_rate of them failed the circuit opens and calls fail fast with
+CircuitOpenError. After reset_timeout seconds the circuit is half open and
+one call, from any worker, is let through as a probe. It closes the circuit
+if it succeeds and opens it again if it fails.
+
+The policy comes from VENDOR_PROMO_CIRCUIT_BREAKER with the overrides for the
+site in VENDOR_PROMO_CIRCUIT_BREAKER_SITES. Its fallback tells the processors
+what to do with a code they can not check while the circuit is open,
+FALLBACK_LOCAL accepts it if the local data does and FALLBACK_REJECT
+rejects it.
+"""
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from vendorpromo.config import (VENDOR_PROMO_CIRCUIT_BREAKER,
+                                VENDOR_PROMO_CIRCUIT_BREAKER_SITES)
+
+FALLBACK_LOCAL = 'local'
+FALLBACK_REJECT = 'reject'
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+BreakerPolicy = namedtuple('BreakerPolicy', ['failure_rate', 'min_calls', 'slow_call_seconds', 'window', 'reset_timeout', 'fallback'])
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def get_policy(site_id):
+    return BreakerPolicy(**{**VENDOR_PROMO_CIRCUIT_BREAKER, **VENDOR_PROMO_CIRCUIT_BREAKER_SITES.get(site_id, {})})
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name, site_id, policy=None):
+        self.name = name
+        self.site_id = site_id
+        self.policy = policy or get_policy(site_id)
+
+    def get_key(self, suffix):
+        return f"vendorpromo.breaker.{self.name}.{self.site_id}.{suffix}"
+
+    def get_state(self):
+        opened = cache.get(self.get_key('opened'))
+
+        if opened is None:
+            return CLOSED
+
+        if time.time() - opened < self.policy.reset_timeout:
+            return OPEN
+
+        return HALF_OPEN
+
+    def allow(self):
+        """
+        Returns None if the call can not be made, and otherwise whether it is
+        the half open circuit's probe.
+        """
+        state = self.get_state()
+
+        if state == CLOSED:
+            return False
+
+        if state == HALF_OPEN and cache.add(self.get_key('probe'), True, self.policy.reset_timeout):
+            return True
+
+        return None
+
+    def open(self):
+        cache.set(self.get_key('opened'), time.time(), None)
+        cache.delete(self.get_key('probe'))
+
+    def close(self):
+        cache.delete_many([self.get_key('opened'), self.get_key('probe')])
+
+    def increment(self, key):
+        cache.add(key, 0, self.policy.window * 2)
+
+        try:
+            return cache.incr(key)
+        except ValueError:  # Expired since it was added
+            cache.set(key, 1, self.policy.window * 2)
+            return 1
+
+    def record(self, success, seconds, probe=False):
+        failed = not success or seconds > self.policy.slow_call_seconds
+
+        if probe:
+            if failed:
+                self.open()
+            else:
+                self.close()
+            return None
+
+        window = int(time.time() // self.policy.window)
+        calls = self.increment(self.get_key(f"{window}.calls"))
+        failures = self.increment(self.get_key(f"{window}.failures")) if failed else cache.get(self.get_key(f"{window}.failures"), 0)
+
+        if failed and calls >= self.policy.min_calls and failures / calls >= self.policy.failure_rate:
+            self.open()
+
+    def before_call(self):
+        probe = self.allow()
+
+        if probe is None:
+            raise CircuitOpenError(f"The {self.name} circuit of site {self.site_id} is open")
+
+        return probe
+
+    def call(self, function, is_success=None):
+        """
+        Returns function() if the circuit lets the call through, raises
+        CircuitOpenError otherwise. The call fails if it raises or
+        is_success(result) is false.
+        """
+        probe = self.before_call()
+        start_time = time.monotonic()
+
+        try:
+            result = function()
+        except Exception:
+            self.record(False, time.monotonic() - start_time, probe)
+            raise
+
+        self.record(is_success is None or is_success(result), time.monotonic() - start_time, probe)
+        return result
+
+    async def acall(self, function, is_success=None):
+        """
+        Same as call() for a coroutine function.
+        """
+        probe = await sync_to_async(self.before_call)()
+        start_time = time.monotonic()
+
+        try:
+            result = await function()
+        except Exception:
+            await sync_to_async(self.record)(False, time.monotonic() - start_time, probe)
+            raise
+
+        await sync_to_async(self.record)(is_success is None or is_success(result), time.monotonic() - start_time, probe)
+        return result
@@ -0,0 +1,208 @@
+"""
+Bulk coupon code generation.
+
+Codes are minted by encrypting a counter with a small keyed Feistel network
+over the code space, so every counter value maps to a different code and no
+set of the generated codes has to be kept in memory. The key is random for
+each run and never stored, so codes from one run can not be used to guess
+the others. Only the existing codes that share the prefix and length are
+loaded to skip collisions with earlier runs.
+
+Rows are written in chunks with executemany, each chunk in its own
+transaction, which skips the per-row uniqueness queries of CouponCode.code's
+AutoSlugField and the cost of building a model instance per row. The
+normalized code and site are set here and the unique (site, normalized_code)
+constraint still guards against concurrent runs.
+"""
+import hashlib
+import math
+import secrets
+import string
+import time
+import uuid
+from collections import namedtuple
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import CouponCode
+from vendorpromo.utils import normalize_code
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Upper case letters and digits without the ones that are easy to mistake for each other (0/O, 1/I/L)
+DEFAULT_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+DEFAULT_LENGTH = 10
+DEFAULT_CHUNK_SIZE = 5000
+FEISTEL_ROUNDS = 4
+
+# Codes are stored like the AutoSlugField would store them
+SLUG_CHARACTERS = set(string.ascii_lowercase + string.digits + "-_")
+
+GenerationResult = namedtuple('GenerationResult', ['created', 'skipped', 'seconds', 'peak_memory'])
+
+
+def get_peak_memory():
+    """
+    Returns the peak resident memory of the process in bytes or None if it
+    can not be measured on this platform.
+    """
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Kilobytes on Linux
+
+
+class CodeGenerator(object):
+    """
+    Generates unique codes of a fixed length from an alphabet, with an
+    optional prefix. generate(count) yields the codes for counter values
+    0 to count - 1, which are all different for the same key.
+    """
+
+    def __init__(self, alphabet=DEFAULT_ALPHABET, length=DEFAULT_LENGTH, prefix="", key=None):
+        self.alphabet = normalize_code(alphabet)
+        self.length = length
+        self.prefix = normalize_code(prefix or "")
+        self.key = key or secrets.token_bytes(32)
+
+        if len(set(self.alphabet)) != len(self.alphabet) or len(self.alphabet) < 2:
+            raise ValueError("The alphabet needs at least 2 characters and they must be unique regardless of case")
+
+        if not set(self.alphabet + self.prefix) <= SLUG_CHARACTERS:
+            raise ValueError("The alphabet and prefix can only have letters, digits, '-' and '_'")
+
+        if length < 1 or len(self.prefix) + length > CouponCode._meta.get_field('code').max_length:
+            raise ValueError("The code is longer than the coupon code field")
+
+        self.code_space = len(self.alphabet) ** length
+        self.half_space = math.isqrt(self.code_space - 1) + 1
+
+    def round_function(self, round_number, value):
+        digest = hashlib.blake2b(value.to_bytes(16, 'big'), key=self.key, person=bytes([round_number]), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.half_space
+
+    def encrypt(self, value):
+        """
+        Permutes a value in [0, code_space). The Feistel network permutes
+        [0, half_space ** 2) and values that land outside the code space are
+        encrypted again until they land in it, which keeps it a permutation.
+        """
+        while True:
+            left, right = divmod(value, self.half_space)
+
+            for round_number in range(FEISTEL_ROUNDS):
+                left, right = right, (left + self.round_function(round_number, right)) % self.half_space
+
+            value = left * self.half_space + right
+
+            if value < self.code_space:
+                return value
+
+    def encode(self, value):
+        characters = []
+
+        for _ in range(self.length):
+            value, index = divmod(value, len(self.alphabet))
+            characters.append(self.alphabet[index])
+
+        return self.prefix + "".join(characters)
+
+    def generate(self, count, start=0):
+        if start + count > self.code_space:
+            raise ValueError(f"Can not generate {count} codes, there are only {self.code_space} codes of length {self.length}")
+
+        for counter in range(start, start + count):
+            yield self.encode(self.encrypt(counter))
+
+
+def get_existing_codes(site_id, generator):
+    """
+    Returns the normalized codes on the site that could collide with the
+    generated ones.
+    """
+    alphabet = set(generator.alphabet)
+
+    return set(
+        code for code in CouponCode.objects.filter(site=site_id, normalized_code__startswith=generator.prefix).values_list('normalized_code', flat=True).iterator()
+        if len(code) == len(generator.prefix) + generator.length and set(code[len(generator.prefix):]) <= alphabet
+    )
+
+
+def insert_coupon_codes(template, codes, using):
+    """
+    Inserts a coupon code for each code with executemany. Every other column
+    comes from the template instance and is prepared once, and the rows skip
+    the fields' pre_save, so the AutoSlugField does not query for uniqueness
+    on every row.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    fields = [field for field in CouponCode._meta.concrete_fields if not field.primary_key]
+    values = [field.get_db_prep_save(getattr(template, field.attname), connection) for field in fields]
+    uuid_index, code_index, normalized_code_index = [fields.index(CouponCode._meta.get_field(name)) for name in ('uuid', 'code', 'normalized_code')]
+    uuid_field = fields[uuid_index]
+
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        quote_name(CouponCode._meta.db_table),
+        ", ".join(quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+
+    rows = []
+    for code in codes:
+        values[uuid_index] = uuid_field.get_db_prep_save(uuid.uuid4(), connection)
+        values[code_index] = values[normalized_code_index] = code
+        rows.append(tuple(values))
+
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def generate_coupon_codes(promotional_campaign, count, alphabet=DEFAULT_ALPHABET, length=DEFAULT_LENGTH, prefix="", chunk_size=DEFAULT_CHUNK_SIZE, max_redemptions=1, end_date=None, progress=None):
+    """
+    Creates count new single use (by default) coupon codes for the campaign.
+    progress(created) is called after each chunk is written.
+    """
+    start_time = time.perf_counter()
+    generator = CodeGenerator(alphabet, length, prefix)
+    existing_codes = get_existing_codes(promotional_campaign.site_id, generator)
+
+    if count + len(existing_codes) > generator.code_space:
+        raise ValueError(f"Can not generate {count} codes, only {generator.code_space - len(existing_codes)} codes of length {length} are left")
+
+    created, skipped, counter = 0, 0, 0
+
+    using = router.db_for_write(CouponCode)
+
+    while created < count:
+        now = timezone.now()
+        template = CouponCode(created=now, updated=now, max_redemptions=max_redemptions, end_date=end_date, promo_id=promotional_campaign.pk, site_id=promotional_campaign.site_id)
+        codes = []
+
+        for code in generator.generate(min(chunk_size, count - created), start=counter):
+            counter += 1
+
+            if code in existing_codes:
+                skipped += 1
+                continue
+
+            codes.append(code)
+
+        with transaction.atomic(using=using):
+            insert_coupon_codes(template, codes, using)
+
+        created += len(codes)
+
+        if progress:
+            progress(created)
+
+    # Bulk inserts do not send post_save. The table is compiled again on the next
+    # lookup, which also leaves out the campaign if it has too many codes now.
+    transaction.on_commit(lambda: coupon_table.invalidate(promotional_campaign.site_id))
+
+    return GenerationResult(created, skipped, time.perf_counter() - start_time, get_peak_memory())
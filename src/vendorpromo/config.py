@@ -50,3 +50,86 @@ VENDOR_PROMO_PROCESSOR = getattr(settings, "VENDOR_PROMO_PROCESSOR", "dummy.Dumm
 VENDOR_PROMO_PROCESSOR_URL = getattr(settings, "VENDOR_PROMO_PROCESSOR_URL")
 
 VENDOR_PROMO_PROCESSOR_BARRER_KEY = getattr(settings, "VENDOR_PROMO_PROCESSOR_BARRER_KEY")
+
+# Seconds the compiled per-site promo tables are kept in the cache. None keeps them until they are invalidated.
+VENDOR_PROMO_TABLE_CACHE_TIMEOUT = getattr(settings, "VENDOR_PROMO_TABLE_CACHE_TIMEOUT", None)
+
+# Campaigns with more coupon codes than this, like bulk generated single use codes, are left out of the
+# compiled coupon table and their codes are looked up in the database instead.
+VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES = getattr(settings, "VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES", 50000)
+
+# Secret used to sign the codes of signed code campaigns, defaults to the SECRET_KEY. Changing it invalidates
+# every signed code already issued.
+VENDOR_PROMO_SIGNED_CODE_SECRET = getattr(settings, "VENDOR_PROMO_SIGNED_CODE_SECRET", None)
+
+# Connection pool and timeouts, in seconds, of the HTTP sessions used to call the promo processor APIs.
+VENDOR_PROMO_PROCESSOR_POOL_SIZE = getattr(settings, "VENDOR_PROMO_PROCESSOR_POOL_SIZE", 10)
+
+# Connections per event loop of the async clients, which can have many more calls in flight than a thread pool.
+VENDOR_PROMO_PROCESSOR_ASYNC_POOL_SIZE = getattr(settings, "VENDOR_PROMO_PROCESSOR_ASYNC_POOL_SIZE", 100)
+
+VENDOR_PROMO_PROCESSOR_CONNECT_TIMEOUT = getattr(settings, "VENDOR_PROMO_PROCESSOR_CONNECT_TIMEOUT", 3.05)
+
+VENDOR_PROMO_PROCESSOR_READ_TIMEOUT = getattr(settings, "VENDOR_PROMO_PROCESSOR_READ_TIMEOUT", 10)
+
+# Items requested per page when iterating over the promo processor's list endpoints.
+VENDOR_PROMO_PROCESSOR_PAGE_SIZE = getattr(settings, "VENDOR_PROMO_PROCESSOR_PAGE_SIZE", 100)
+
+# Concurrent calls, calls per second (None for no limit) and retries of transient failures used when a whole
+# campaign is deleted from the promo processor.
+VENDOR_PROMO_PROCESSOR_MAX_WORKERS = getattr(settings, "VENDOR_PROMO_PROCESSOR_MAX_WORKERS", 8)
+
+VENDOR_PROMO_PROCESSOR_RATE_LIMIT = getattr(settings, "VENDOR_PROMO_PROCESSOR_RATE_LIMIT", None)
+
+VENDOR_PROMO_PROCESSOR_RETRIES = getattr(settings, "VENDOR_PROMO_PROCESSOR_RETRIES", 3)
+
+# Seconds the responses of the promo processor's read calls are cached, per resource. A resource that is missing or
+# 0 is not cached. Stale responses are served for VENDOR_PROMO_PROCESSOR_CACHE_STALE_TIMEOUT more seconds while they
+# are fetched again in the background.
+VENDOR_PROMO_PROCESSOR_CACHE_TIMEOUTS = getattr(settings, "VENDOR_PROMO_PROCESSOR_CACHE_TIMEOUTS", {
+    'campaigns': 60,
+    'rewards': 60,
+    'vouchers': 30,
+    'redemptions': 10,
+})
+
+VENDOR_PROMO_PROCESSOR_CACHE_STALE_TIMEOUT = getattr(settings, "VENDOR_PROMO_PROCESSOR_CACHE_STALE_TIMEOUT", 300)
+
+# Circuit breaker policy of the promo processors' external calls, see vendorpromo.circuit_breaker. The fallback is
+# 'local', to validate codes from the local data while the circuit is open and check them with the processor once
+# it is back, or 'reject'.
+VENDOR_PROMO_CIRCUIT_BREAKER = {
+    'failure_rate': 0.5,
+    'min_calls': 10,
+    'slow_call_seconds': 5,
+    'window': 60,
+    'reset_timeout': 30,
+    'fallback': 'local',
+    **getattr(settings, "VENDOR_PROMO_CIRCUIT_BREAKER", {}),
+}
+
+# Circuit breaker policy overrides per site id, e.g. {1: {'fallback': 'reject'}}
+VENDOR_PROMO_CIRCUIT_BREAKER_SITES = getattr(settings, "VENDOR_PROMO_CIRCUIT_BREAKER_SITES", {})
+
+# Queues the promo processors' create calls in an outbox, written in the same transaction as the model, instead of
+# making them during the request. The drain_promo_outbox command sends them.
+VENDOR_PROMO_PROCESSOR_OUTBOX = getattr(settings, "VENDOR_PROMO_PROCESSOR_OUTBOX", False)
+
+# Outbox messages claimed and sent at a time by drain_promo_outbox
+VENDOR_PROMO_PROCESSOR_OUTBOX_BATCH_SIZE = getattr(settings, "VENDOR_PROMO_PROCESSOR_OUTBOX_BATCH_SIZE", 100)
+
+# Times an outbox message is sent before it is marked as failed, and the seconds before its first retry, doubled on
+# each one after.
+VENDOR_PROMO_PROCESSOR_OUTBOX_MAX_ATTEMPTS = getattr(settings, "VENDOR_PROMO_PROCESSOR_OUTBOX_MAX_ATTEMPTS", 8)
+
+VENDOR_PROMO_PROCESSOR_OUTBOX_BACKOFF = getattr(settings, "VENDOR_PROMO_PROCESSOR_OUTBOX_BACKOFF", 30)
+
+# Max Stripe calls per second of the Stripe bulk jobs when VENDOR_PROMO_PROCESSOR_RATE_LIMIT is not set. Stripe
+# allows 25 in test mode and 100 in live mode.
+VENDOR_PROMO_STRIPE_RATE_LIMIT = getattr(settings, "VENDOR_PROMO_STRIPE_RATE_LIMIT", 25)
+
+# Signing secret of the Stripe webhook endpoint, or a dict of them per site id
+VENDOR_PROMO_STRIPE_WEBHOOK_SECRET = getattr(settings, "VENDOR_PROMO_STRIPE_WEBHOOK_SECRET", None)
+
+# Stripe webhook events whose redemptions are applied to the local counters in one transaction
+VENDOR_PROMO_STRIPE_EVENTS_BATCH_SIZE = getattr(settings, "VENDOR_PROMO_STRIPE_EVENTS_BATCH_SIZE", 500)
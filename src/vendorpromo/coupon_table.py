@@ -0,0 +1,192 @@
+"""
+Compiled coupon table used by checkout to validate codes without querying
+CouponCode, PromotionalCampaign and their Offer on every request.
+
+Each site gets a dict that maps the normalized code to an immutable
+CompiledCoupon. The handlers in vendorpromo.signals refresh the entries of
+the coupon codes and campaigns that change, including changes to the
+products or prices of a campaign's offer, by compiling just those again.
+
+Campaigns with more than VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES codes
+are left out of the table, so bulk generated codes do not have to fit in
+every process. Codes that are not in the table are looked up in the database
+when the site has any of those campaigns.
+"""
+import math
+from collections import namedtuple
+
+from django.db.models import Count
+
+from vendorpromo.caches import SiteTable
+from vendorpromo.config import VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES
+from vendorpromo.models import CouponCode
+from vendorpromo.resolvers import (get_current_price, get_product_ids,
+                                   get_promotional_campaign_queryset)
+from vendorpromo.utils import normalize_code
+
+CompiledCoupon = namedtuple('CompiledCoupon', [
+    'pk',
+    'code',
+    'campaign_pk',
+    'offer_pk',
+    'start_date',
+    'end_date',
+    'is_percent_off',
+    'discount_value',
+    'product_ids',
+    'active',
+    'stack_group',
+    'stack_limit',
+])
+
+
+def compile_campaign(promotional_campaign):
+    """
+    Returns the CompiledCoupon fields shared by all the campaign's coupon codes.
+    Expects a campaign loaded with get_promotional_campaign_queryset().
+    """
+    return {
+        'campaign_pk': promotional_campaign.pk,
+        'offer_pk': promotional_campaign.applies_to_id,
+        'start_date': promotional_campaign.start_date,
+        'end_date': promotional_campaign.end_date,
+        'is_percent_off': promotional_campaign.is_percent_off,
+        'discount_value': math.fabs(get_current_price(promotional_campaign.applies_to)),
+        'product_ids': get_product_ids(promotional_campaign.applies_to),
+        'stack_group': promotional_campaign.stack_group or None,
+        'stack_limit': promotional_campaign.stack_limit,
+    }
+
+
+def get_end_date(coupon_code_end_date, campaign):
+    """
+    Returns the earliest of the coupon code's and its compiled campaign's end
+    dates, a code can not outlive its campaign.
+    """
+    return min((end_date for end_date in (coupon_code_end_date, campaign['end_date']) if end_date), default=None)
+
+
+# Table key with the campaigns left out of the table, it can not clash with a code
+UNCOMPILED_CAMPAIGNS = ('uncompiled_campaigns',)
+
+
+def compile_coupon_codes(exclude_campaigns=(), **filters):
+    """
+    Compiles the coupon codes that match the filters. Each campaign is compiled
+    once and shared by its codes, so this is 4 queries regardless of how many
+    codes or campaigns match.
+    """
+    coupon_codes = CouponCode.objects.filter(normalized_code__isnull=False, **filters)
+
+    if exclude_campaigns:
+        coupon_codes = coupon_codes.exclude(promo__in=exclude_campaigns)
+
+    coupon_codes = list(coupon_codes.values_list('pk', 'normalized_code', 'active', 'end_date', 'promo_id'))
+    campaigns = {
+        promotional_campaign.pk: compile_campaign(promotional_campaign)
+        for promotional_campaign in get_promotional_campaign_queryset().filter(pk__in=set(promo_id for *_, promo_id in coupon_codes))
+    }
+
+    return [
+        CompiledCoupon(pk=pk, code=code, active=active, **dict(campaigns[promo_id], end_date=get_end_date(end_date, campaigns[promo_id])))
+        for pk, code, active, end_date, promo_id in coupon_codes
+    ]
+
+
+def compile_coupon_code(coupon_code):
+    """
+    Compiles a single coupon code instance without going through the table.
+    """
+    campaign = compile_campaign(coupon_code.promo)
+
+    return CompiledCoupon(
+        pk=coupon_code.pk,
+        code=coupon_code.normalized_code,
+        active=coupon_code.active,
+        **dict(campaign, end_date=get_end_date(coupon_code.end_date, campaign))
+    )
+
+
+def get_uncompiled_campaigns(site_id):
+    return frozenset(
+        CouponCode.objects.filter(site=site_id).order_by().values('promo').annotate(count=Count('pk')).filter(count__gt=VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES).values_list('promo', flat=True)
+    )
+
+
+class CouponTable(SiteTable):
+    name = "coupon_table"
+
+    def compile(self, site_id):
+        uncompiled_campaigns = get_uncompiled_campaigns(site_id)
+        table = {compiled_coupon.code: compiled_coupon for compiled_coupon in compile_coupon_codes(exclude_campaigns=uncompiled_campaigns, site=site_id)}
+        table[UNCOMPILED_CAMPAIGNS] = uncompiled_campaigns
+        return table
+
+    def get_compiled_coupon(self, coupon_code):
+        """
+        Returns the coupon code's entry in its site table, compiling it on
+        its own if the table does not have it.
+        """
+        compiled_coupon = self.lookup(coupon_code.site_id, coupon_code.normalized_code)
+
+        if compiled_coupon is None or compiled_coupon.pk != coupon_code.pk:
+            return compile_coupon_code(coupon_code)
+
+        return compiled_coupon
+
+    def lookup(self, site_id, code):
+        """
+        Returns the CompiledCoupon for the code on the site or None if the code does not exist.
+        """
+        code = normalize_code(code)
+        table = self.get(site_id)
+        compiled_coupon = table.get(code)
+
+        if compiled_coupon is None and table[UNCOMPILED_CAMPAIGNS]:
+            compiled_coupon = next(iter(compile_coupon_codes(site=site_id, normalized_code=code, promo__in=table[UNCOMPILED_CAMPAIGNS])), None)
+
+        return compiled_coupon
+
+    def refresh(self, site_id, is_stale, filters=None):
+        """
+        Replaces the entries is_stale(compiled_coupon) is True for with the
+        codes that match the filters compiled again, or drops them if there
+        are no filters. The whole table is compiled again instead if a
+        campaign crossed VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES.
+        """
+        def apply(table):
+            uncompiled_campaigns = get_uncompiled_campaigns(site_id)
+
+            if uncompiled_campaigns != table[UNCOMPILED_CAMPAIGNS]:
+                return None
+
+            patched_table = {code: compiled_coupon for code, compiled_coupon in table.items() if code == UNCOMPILED_CAMPAIGNS or not is_stale(compiled_coupon)}
+
+            if filters is not None:
+                patched_table.update((compiled_coupon.code, compiled_coupon) for compiled_coupon in compile_coupon_codes(exclude_campaigns=uncompiled_campaigns, site=site_id, **filters))
+
+            return patched_table
+
+        self.patch(site_id, apply)
+
+    def refresh_coupon_code(self, coupon_code):
+        self.refresh_coupon_codes(coupon_code.site_id, [coupon_code.pk])
+
+    def refresh_coupon_codes(self, site_id, coupon_code_pks):
+        coupon_code_pks = set(coupon_code_pks)
+        self.refresh(site_id, lambda compiled_coupon: compiled_coupon.pk in coupon_code_pks, {'pk__in': coupon_code_pks})
+
+    def refresh_campaigns(self, site_id, campaign_pks):
+        campaign_pks = set(campaign_pks)
+        self.refresh(site_id, lambda compiled_coupon: compiled_coupon.campaign_pk in campaign_pks, {'promo__in': campaign_pks})
+
+    def remove(self, site_id, coupon_code_pks):
+        coupon_code_pks = set(coupon_code_pks)
+        self.refresh(site_id, lambda compiled_coupon: compiled_coupon.pk in coupon_code_pks)
+
+    def remove_campaigns(self, site_id, campaign_pks):
+        campaign_pks = set(campaign_pks)
+        self.refresh(site_id, lambda compiled_coupon: compiled_coupon.campaign_pk in campaign_pks)
+
+
+coupon_table = CouponTable()
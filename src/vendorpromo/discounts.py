@@ -0,0 +1,100 @@
+"""
+Discount engine shared by checkout, quotes and reports.
+
+The cart is reduced to a snapshot of CartLine tuples with the product ids of
+each line, and a coupon to its CompiledCoupon. Whether the coupon applies to
+a line is a set intersection, so calculating the discount for a cart is a
+single pass over its lines with no queries.
+"""
+from collections import namedtuple
+
+from vendorpromo.resolvers import (get_current_price, get_order_item_total,
+                                   get_product_ids)
+
+CartLine = namedtuple('CartLine', ['pk', 'quantity', 'total', 'product_ids'])
+
+CouponDiscount = namedtuple('CouponDiscount', [
+    'line_discounts',   # {CartLine.pk: discount} for the lines the coupon applies to
+    'global_discount',  # Invoice.global_discount for percent off coupons
+    'coupon_quantity',  # Quantity of the coupon order item for fixed amount coupons
+    'total',            # Amount the customer saves
+])
+
+
+def get_cart_snapshot(order_items):
+    """
+    Returns a CartLine for each order item. Expects order items loaded with
+    resolve_order_items().
+    """
+    return [
+        CartLine(order_item.pk, order_item.quantity, get_order_item_total(order_item), get_product_ids(order_item.offer))
+        for order_item in order_items
+    ]
+
+
+def get_offer_snapshot(offer, quantity=1):
+    """
+    Returns a single CartLine to quote the discount of a coupon on an offer.
+    """
+    return [CartLine(offer.pk, quantity, get_current_price(offer) * quantity, get_product_ids(offer))]
+
+
+def calculate_discount(cart_lines, compiled_coupon, subtotal=None):
+    """
+    Calculates the discount of the compiled coupon on the cart lines.
+
+    Coupons with products only discount the lines that share a product with
+    them, percent off as a share of each line total and fixed amount once per
+    unit. Coupons without products discount the whole subtotal when they are
+    percent off, which defaults to the sum of the line totals, and their
+    amount once otherwise.
+    """
+    coupon_product_ids = compiled_coupon.product_ids
+    discount_value = compiled_coupon.discount_value
+
+    if not coupon_product_ids:
+        if not compiled_coupon.is_percent_off:
+            return CouponDiscount({}, 0, 1, discount_value)
+
+        if subtotal is None:
+            subtotal = sum(cart_line.total for cart_line in cart_lines)
+
+        global_discount = (subtotal * discount_value) / 100
+        return CouponDiscount({}, global_discount, None, global_discount)
+
+    line_discounts = {}
+    coupon_quantity = 0
+
+    for cart_line in cart_lines:
+        if cart_line.product_ids.isdisjoint(coupon_product_ids):
+            continue
+
+        if compiled_coupon.is_percent_off:
+            line_discounts[cart_line.pk] = (cart_line.total * discount_value) / 100
+        else:
+            line_discounts[cart_line.pk] = cart_line.quantity * discount_value
+            coupon_quantity += cart_line.quantity
+
+    total = sum(line_discounts.values())
+
+    if compiled_coupon.is_percent_off:
+        return CouponDiscount(line_discounts, total, None, total)
+
+    return CouponDiscount(line_discounts, 0, coupon_quantity, total)
+
+
+def apply_discount(invoice, coupon_order_item, coupon_discount, is_percent_off):
+    """
+    Applies a discount to an invoice that already has the coupon order item.
+    Percent off discounts go to the invoice global discount and fixed amount
+    discounts to the quantity of the coupon order item.
+    """
+    if is_percent_off:
+        invoice.global_discount = coupon_discount.global_discount
+        invoice.update_totals()
+        invoice.save()
+
+    elif coupon_discount.coupon_quantity is not None:
+        coupon_order_item.quantity = coupon_discount.coupon_quantity
+        coupon_order_item.save()
+        invoice.update_totals()
@@ -0,0 +1,107 @@
+"""
+Local validation of codes for when a promo processor can not be reached, and
+the queue of the codes accepted that way.
+
+A code is valid locally if it is an active Coupon Code within its campaign's
+dates, or a Promo of the site. Each code accepted this way is stored as a
+DeferredValidation and checked with the processor by
+reconcile_deferred_validations() once its circuit is closed again.
+"""
+import json
+import logging
+from collections import namedtuple
+
+import requests
+from django.utils import timezone
+
+from vendorpromo.circuit_breaker import CircuitOpenError
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import DeferredValidation, Promo, ValidationKind
+from vendorpromo.utils import normalize_code
+
+logger = logging.getLogger(__name__)
+
+# Errors raised by a processor that can not be reached
+UNAVAILABLE_ERRORS = (CircuitOpenError, requests.RequestException, json.JSONDecodeError)
+
+ReconcileResult = namedtuple('ReconcileResult', ['checked', 'rejected', 'pending'])
+
+
+def is_code_valid_locally(site_id, code):
+    compiled_coupon = coupon_table.lookup(site_id, code)
+
+    if compiled_coupon is None:
+        return Promo.objects.filter(site=site_id, normalized_code=normalize_code(code)).exists()
+
+    now = timezone.now()
+
+    return (
+        compiled_coupon.active
+        and not (compiled_coupon.start_date and now < compiled_coupon.start_date)
+        and not (compiled_coupon.end_date and now > compiled_coupon.end_date)
+    )
+
+
+def defer_validation(site, code, invoice=None, offer_cost=None, kind=ValidationKind.CHECKOUT):
+    return DeferredValidation.objects.create(site=site, code=code, invoice=invoice, offer_cost=offer_cost, kind=kind)
+
+
+def reconcile_deferred_validations(site=None, limit=None):
+    """
+    Checks the deferred validations with their site's processor, oldest
+    first, with the same kind of check they were accepted for: code checks
+    only look the code up, checkout checks create its redemption. A site
+    whose processor still can not be reached is skipped until the next run. Codes the processor rejects are logged and kept with
+    is_valid False for review.
+    """
+    from vendorpromo.processors import get_site_promo_processor_instance  # The processors import this module
+
+    deferred_validations = DeferredValidation.objects.filter(checked__isnull=True).select_related('site', 'invoice').order_by('pk')
+
+    if site is not None:
+        deferred_validations = deferred_validations.filter(site=site)
+
+    if limit is not None:
+        deferred_validations = deferred_validations[:limit]
+
+    checked, rejected, pending = 0, 0, 0
+    unavailable_sites = set()
+
+    for deferred_validation in deferred_validations.iterator():
+        if deferred_validation.site_id in unavailable_sites:
+            pending += 1
+            continue
+
+        deferred_validation.attempts += 1
+
+        if deferred_validation.invoice is None:
+            deferred_validation.error = "The invoice was deleted before the code could be checked"
+            deferred_validation.checked = timezone.now()
+            deferred_validation.save()
+            checked += 1
+            continue
+
+        processor = get_site_promo_processor_instance(deferred_validation.site)
+
+        try:
+            if deferred_validation.kind == ValidationKind.CODE:
+                deferred_validation.is_valid = processor.check_code(deferred_validation.code, invoice=deferred_validation.invoice)
+            else:
+                deferred_validation.is_valid = processor.check_code_on_checkout(deferred_validation.code, deferred_validation.offer_cost, invoice=deferred_validation.invoice)
+        except UNAVAILABLE_ERRORS as error:
+            unavailable_sites.add(deferred_validation.site_id)
+            deferred_validation.error = str(error)
+            deferred_validation.save()
+            pending += 1
+            continue
+
+        deferred_validation.error = None
+        deferred_validation.checked = timezone.now()
+        deferred_validation.save()
+        checked += 1
+
+        if not deferred_validation.is_valid:
+            rejected += 1
+            logger.warning(f"reconcile_deferred_validations: the processor rejected code {deferred_validation.code} of invoice {deferred_validation.invoice_id}")
+
+    return ReconcileResult(checked, rejected, pending)
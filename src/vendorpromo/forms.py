@@ -85,6 +85,9 @@ class PromotionalCampaignForm(forms.ModelForm):
             "start_date",
             "end_date",
             "max_redemptions",
+            "auto_apply",
+            "stack_group",
+            "stack_limit",
         ]
 
     def __init__(self, *args, **kwargs):
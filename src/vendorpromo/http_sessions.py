@@ -0,0 +1,133 @@
+"""
+Pooled HTTP sessions for the promo processor APIs.
+
+Each process keeps one requests.Session per base URL, so calls to the same
+API reuse keep-alive connections instead of opening a new TCP and TLS
+connection each time. The connection pool of a session is thread safe and
+sized with VENDOR_PROMO_PROCESSOR_POOL_SIZE. Sessions are keyed by the
+process id as well, a worker forked from a process that already made calls
+opens its own connections instead of sharing the parent's sockets.
+
+The async processor calls use an httpx.AsyncClient per event loop and base
+URL in the same way. httpx is optional, installed with the async extra.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+
+from vendorpromo.config import (VENDOR_PROMO_PROCESSOR_ASYNC_POOL_SIZE,
+                                VENDOR_PROMO_PROCESSOR_CONNECT_TIMEOUT,
+                                VENDOR_PROMO_PROCESSOR_POOL_SIZE,
+                                VENDOR_PROMO_PROCESSOR_READ_TIMEOUT)
+
+try:
+    import httpx
+except ImportError:  # Optional, pip install django-vendor-promo[async]
+    httpx = None
+
+DEFAULT_TIMEOUT = (VENDOR_PROMO_PROCESSOR_CONNECT_TIMEOUT, VENDOR_PROMO_PROCESSOR_READ_TIMEOUT)
+
+_sessions = {}
+_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def create_session(pool_size=VENDOR_PROMO_PROCESSOR_POOL_SIZE):
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(base_url):
+    """
+    Returns the process' shared session for the base URL.
+    """
+    key = (os.getpid(), base_url)
+    session = _sessions.get(key)
+
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+
+            if session is None:
+                session = _sessions[key] = create_session()
+
+    return session
+
+
+def request(base_url, method, url, **kwargs):
+    """
+    Same as requests.request() through the shared session for the base URL,
+    with the default timeouts unless a timeout is given.
+    """
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return get_session(base_url).request(method, url, **kwargs)
+
+
+class RateLimiter(object):
+    """
+    Spaces out calls made from any number of threads to at most rate calls
+    per second. wait() blocks until the caller's turn. A rate of None does
+    not limit the calls.
+    """
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self.lock:
+            call_time = max(self.next_time, time.monotonic())
+            self.next_time = call_time + self.interval
+
+        delay = call_time - time.monotonic()
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+def close_sessions():
+    """
+    Closes the sessions of this process and their pooled connections.
+    """
+    with _lock:
+        for key in [key for key in _sessions if key[0] == os.getpid()]:
+            _sessions.pop(key).close()
+
+
+def get_async_client(base_url):
+    """
+    Returns the shared httpx.AsyncClient for the base URL on the running
+    event loop. A client can only be used on the loop it was created on.
+    """
+    if httpx is None:
+        raise ImproperlyConfigured("httpx is required for the async promo processor calls, install django-vendor-promo[async]")
+
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+
+    if base_url not in clients:
+        clients[base_url] = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=VENDOR_PROMO_PROCESSOR_ASYNC_POOL_SIZE, max_keepalive_connections=VENDOR_PROMO_PROCESSOR_ASYNC_POOL_SIZE),
+            timeout=httpx.Timeout(VENDOR_PROMO_PROCESSOR_READ_TIMEOUT, connect=VENDOR_PROMO_PROCESSOR_CONNECT_TIMEOUT),
+        )
+
+    return clients[base_url]
+
+
+async def close_async_clients():
+    """
+    Closes the async clients of the running event loop.
+    """
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
@@ -0,0 +1,26 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.processors.stripe_events import apply_events
+
+
+class Command(BaseCommand):
+    help = "Applies the redemptions of the pending Stripe webhook events to the local redemption counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site', type=int, help="Only apply the events of the site with this id.")
+        parser.add_argument('--batch-size', type=int, help="Events applied in one transaction, defaults to VENDOR_PROMO_STRIPE_EVENTS_BATCH_SIZE.")
+        parser.add_argument('--max-batches', type=int, help="Stop after applying this many batches.")
+
+    def handle(self, *args, **options):
+        site = None
+
+        if options['site'] is not None:
+            try:
+                site = Site.objects.get(pk=options['site'])
+            except Site.DoesNotExist:
+                raise CommandError(f"Site {options['site']} does not exist")
+
+        summary = apply_events(site=site, batch_size=options['batch_size'], max_batches=options['max_batches'])
+
+        self.stdout.write(self.style.SUCCESS(f"Applied {summary.events} events to {summary.coupon_codes} coupon codes and {summary.campaigns} campaigns"))
@@ -0,0 +1,46 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.processors.vouchery import VoucheryError, VoucheryProcessor
+
+
+class Command(BaseCommand):
+    help = "Deletes a Vouchery main campaign with its sub-campaigns, rewards and vouchers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign', type=int, help="Id of the Vouchery main campaign.")
+        parser.add_argument('--site', type=int, help="Id of the site whose Vouchery account is used, defaults to the current site.")
+        parser.add_argument('--max-workers', type=int, help="Number of calls made at the same time.")
+        parser.add_argument('--rate-limit', type=float, help="Max calls per second.")
+        parser.add_argument('--retries', type=int, help="Retries of calls that fail with a transient error.")
+
+    def handle(self, *args, **options):
+        try:
+            site = Site.objects.get(pk=options['site']) if options['site'] else Site.objects.get_current()
+        except Site.DoesNotExist:
+            raise CommandError(f"Site {options['site']} does not exist")
+
+        def progress(deleted, failed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{deleted} deleted, {failed} failed")
+
+        try:
+            summary = VoucheryProcessor(site).delete_full_campaign(
+                options['campaign'],
+                max_workers=options['max_workers'],
+                rate_limit=options['rate_limit'],
+                retries=options['retries'],
+                progress=progress,
+            )
+        except VoucheryError as error:
+            raise CommandError(str(error))
+
+        for failure in summary.failed:
+            self.stderr.write(f"Could not delete {failure.kind} {failure.id}: {failure.error}")
+
+        message = f"Deleted {summary.deleted} objects in {summary.seconds:.1f}s with {summary.retries} retries, {len(summary.failed)} failed"
+
+        if summary.result is None:
+            raise CommandError(f"{message}, campaign {options['campaign']} was not deleted")
+
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,26 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Sends the promo processor calls queued in the outbox that are due."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site', type=int, help="Only send the messages of the site with this id.")
+        parser.add_argument('--batch-size', type=int, help="Messages claimed and sent at a time, defaults to VENDOR_PROMO_PROCESSOR_OUTBOX_BATCH_SIZE.")
+        parser.add_argument('--max-batches', type=int, help="Stop after sending this many batches.")
+
+    def handle(self, *args, **options):
+        site = None
+
+        if options['site'] is not None:
+            try:
+                site = Site.objects.get(pk=options['site'])
+            except Site.DoesNotExist:
+                raise CommandError(f"Site {options['site']} does not exist")
+
+        summary = drain(batch_size=options['batch_size'], site=site, max_batches=options['max_batches'])
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {summary.sent} messages, {summary.retried} to retry, {summary.failed} failed"))
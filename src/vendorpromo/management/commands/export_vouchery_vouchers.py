@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.models import PromotionalCampaign
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.processors.vouchery_export import DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Creates Vouchery vouchers for the coupon codes of a promotional campaign, resuming where the last run stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign', type=int, help="Id of the promotional campaign.")
+        parser.add_argument('--vouchery-campaign', help="Id of the Vouchery campaign, defaults to the promotional campaign's campaign id.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Number of codes pushed between checkpoints.")
+        parser.add_argument('--max-workers', type=int, help="Number of calls made at the same time.")
+        parser.add_argument('--rate-limit', type=float, help="Max calls per second.")
+        parser.add_argument('--retries', type=int, help="Retries of calls that fail with a transient error.")
+
+    def handle(self, *args, **options):
+        try:
+            promotional_campaign = PromotionalCampaign.objects.get(pk=options['campaign'])
+        except PromotionalCampaign.DoesNotExist:
+            raise CommandError(f"Promotional campaign {options['campaign']} does not exist")
+
+        def progress(exported, skipped, failed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{exported} exported, {skipped} skipped, {failed} failed")
+
+        try:
+            summary = VoucheryProcessor(promotional_campaign.site).export_coupon_codes(
+                promotional_campaign,
+                options['vouchery_campaign'],
+                chunk_size=options['chunk_size'],
+                max_workers=options['max_workers'],
+                rate_limit=options['rate_limit'],
+                retries=options['retries'],
+                progress=progress,
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        for failure in summary.failed:
+            self.stderr.write(f"Could not export {failure.id}: {failure.error}")
+
+        pushed = summary.exported + summary.skipped + len(summary.failed)
+        throughput = pushed / summary.seconds if summary.seconds else pushed
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {summary.exported} coupon codes in {summary.seconds:.1f}s ({throughput:.0f} codes/sec), "
+            f"skipped {summary.skipped} existing codes, {len(summary.failed)} failed, {summary.retries} retries"
+        ))
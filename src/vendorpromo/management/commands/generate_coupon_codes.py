@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.code_generator import (DEFAULT_ALPHABET, DEFAULT_CHUNK_SIZE,
+                                        DEFAULT_LENGTH, generate_coupon_codes)
+from vendorpromo.models import PromotionalCampaign
+
+
+class Command(BaseCommand):
+    help = "Generates unique coupon codes in bulk for a promotional campaign."
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign', type=int, help="Id of the promotional campaign.")
+        parser.add_argument('count', type=int, help="Number of coupon codes to generate.")
+        parser.add_argument('--length', type=int, default=DEFAULT_LENGTH, help="Number of characters after the prefix.")
+        parser.add_argument('--prefix', default="", help="Prefix added to every code.")
+        parser.add_argument('--alphabet', default=DEFAULT_ALPHABET, help="Characters the codes are made of.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Number of codes written per transaction.")
+        parser.add_argument('--max-redemptions', type=int, default=1, help="Max redemptions of each code, 0 for no limit.")
+
+    def handle(self, *args, **options):
+        try:
+            promotional_campaign = PromotionalCampaign.objects.get(pk=options['campaign'])
+        except PromotionalCampaign.DoesNotExist:
+            raise CommandError(f"Promotional campaign {options['campaign']} does not exist")
+
+        def progress(created):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{created} / {options['count']}")
+
+        try:
+            result = generate_coupon_codes(
+                promotional_campaign,
+                options['count'],
+                alphabet=options['alphabet'],
+                length=options['length'],
+                prefix=options['prefix'],
+                chunk_size=options['chunk_size'],
+                max_redemptions=options['max_redemptions'] or None,
+                progress=progress,
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        throughput = result.created / result.seconds if result.seconds else result.created
+        peak_memory = f"{result.peak_memory / 2 ** 20:.1f} MB" if result.peak_memory is not None else "unknown"
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created} coupon codes in {result.seconds:.1f}s ({throughput:.0f} codes/sec), "
+            f"skipped {result.skipped} existing codes, peak memory {peak_memory}"
+        ))
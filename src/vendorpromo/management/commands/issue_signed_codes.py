@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.models import PromotionalCampaign
+from vendorpromo.signed_codes import issue_signed_codes
+
+
+class Command(BaseCommand):
+    help = "Issues signed codes for a signed code promotional campaign, one per line."
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign', type=int, help="Id of the promotional campaign.")
+        parser.add_argument('count', type=int, help="Number of signed codes to issue.")
+        parser.add_argument('--output', help="File the codes are written to instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            promotional_campaign = PromotionalCampaign.objects.get(pk=options['campaign'])
+        except PromotionalCampaign.DoesNotExist:
+            raise CommandError(f"Promotional campaign {options['campaign']} does not exist")
+
+        try:
+            codes = issue_signed_codes(promotional_campaign, options['count'])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.writelines(f"{code}\n" for code in codes)
+        else:
+            self.stdout.writelines(f"{code}\n" for code in codes)
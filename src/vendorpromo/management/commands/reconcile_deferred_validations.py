@@ -0,0 +1,25 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.fallback import reconcile_deferred_validations
+
+
+class Command(BaseCommand):
+    help = "Checks the codes accepted offline while a promo processor could not be reached with the processor."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site', type=int, help="Only check the codes of the site with this id.")
+        parser.add_argument('--limit', type=int, help="Check at most this many codes.")
+
+    def handle(self, *args, **options):
+        site = None
+
+        if options['site'] is not None:
+            try:
+                site = Site.objects.get(pk=options['site'])
+            except Site.DoesNotExist:
+                raise CommandError(f"Site {options['site']} does not exist")
+
+        result = reconcile_deferred_validations(site=site, limit=options['limit'])
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {result.checked} codes, {result.rejected} rejected, {result.pending} still pending"))
@@ -0,0 +1,24 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.redemptions import reconcile_redemption_counts
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the coupon code and promotional campaign redemption counters from the invoices linked to each coupon code."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--site', type=int, help="Only reconcile the counters of the site with this id.")
+
+    def handle(self, *args, **options):
+        site = None
+
+        if options['site'] is not None:
+            try:
+                site = Site.objects.get(pk=options['site'])
+            except Site.DoesNotExist:
+                raise CommandError(f"Site {options['site']} does not exist")
+
+        coupon_code_count, campaign_count = reconcile_redemption_counts(site=site)
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {coupon_code_count} coupon codes and {campaign_count} promotional campaigns"))
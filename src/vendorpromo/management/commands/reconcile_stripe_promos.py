@@ -0,0 +1,37 @@
+import csv
+
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.processors.stripe import StripePromoProcessor
+from vendorpromo.processors.stripe_reconcile import (DEFAULT_CHUNK_SIZE, Drift,
+                                                     REPAIR_LOCAL,
+                                                     REPAIR_STRIPE)
+
+
+class Command(BaseCommand):
+    help = "Reports the differences between a site's Stripe coupons and promotion codes and its promotional campaigns and coupon codes as CSV, and optionally repairs them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('site', type=int, help="Id of the site.")
+        parser.add_argument('--repair', choices=[REPAIR_LOCAL, REPAIR_STRIPE], help="Side to repair: local sets the local rows to Stripe's values, stripe sets Stripe's to the local ones.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Number of Stripe objects compared at a time.")
+        parser.add_argument('--rate-limit', type=float, help="Max repair calls to Stripe per second.")
+
+    def handle(self, *args, **options):
+        try:
+            site = Site.objects.get(pk=options['site'])
+        except Site.DoesNotExist:
+            raise CommandError(f"Site {options['site']} does not exist")
+
+        writer = csv.writer(self.stdout, lineterminator="\n")
+        writer.writerow(Drift._fields)
+
+        summary = StripePromoProcessor(site).reconcile_with_stripe(
+            writer.writerow,
+            repair=options['repair'],
+            chunk_size=options['chunk_size'],
+            rate_limit=options['rate_limit'],
+        )
+
+        self.stderr.write(self.style.SUCCESS(f"Checked {summary.checked} Stripe objects, found {summary.drift} differences, repaired {summary.repaired}"))
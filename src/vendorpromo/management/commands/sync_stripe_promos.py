@@ -0,0 +1,55 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from vendorpromo.processors.stripe import StripePromoProcessor
+from vendorpromo.processors.stripe_sync import DEFAULT_CHUNK_SIZE, StripeSync
+
+
+class Command(BaseCommand):
+    help = "Creates and updates the Stripe coupons and promotion codes of a site's promotional campaigns and coupon codes, resuming where the last run stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('site', type=int, help="Id of the site.")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the changes the sync would make.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Number of rows pushed between checkpoints.")
+        parser.add_argument('--max-workers', type=int, help="Number of calls made at the same time.")
+        parser.add_argument('--rate-limit', type=float, help="Max calls per second.")
+        parser.add_argument('--retries', type=int, help="Retries of calls that fail with a transient error.")
+
+    def handle(self, *args, **options):
+        try:
+            site = Site.objects.get(pk=options['site'])
+        except Site.DoesNotExist:
+            raise CommandError(f"Site {options['site']} does not exist")
+
+        def progress(created, updated, failed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{created} created, {updated} updated, {failed} failed")
+
+        stripe_sync = StripeSync(
+            StripePromoProcessor(site),
+            chunk_size=options['chunk_size'],
+            max_workers=options['max_workers'],
+            rate_limit=options['rate_limit'],
+            retries=options['retries'],
+            progress=progress,
+        )
+
+        if options['dry_run']:
+            changes = stripe_sync.diff()
+
+            for change in changes:
+                self.stdout.write(f"{change.action} {change.kind} for {change.name} ({change.pk})")
+
+            self.stdout.write(self.style.SUCCESS(f"{len(changes)} changes to sync"))
+            return None
+
+        summary = stripe_sync.run()
+
+        for failure in summary.failed:
+            self.stderr.write(f"Could not sync {failure.kind} {failure.pk}: {failure.error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {summary.created} and updated {summary.updated} Stripe objects in {summary.seconds:.1f}s, "
+            f"{len(summary.failed)} failed, {summary.retries} retries"
+        ))
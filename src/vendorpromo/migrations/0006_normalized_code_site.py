@@ -0,0 +1,36 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import vendorpromo.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('vendorpromo', '0005_alter_couponcode_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='couponcode',
+            name='normalized_code',
+            field=vendorpromo.models.NormalizedCodeField(blank=True, editable=False, max_length=50, null=True, populate_from='code', verbose_name='Normalized Code'),
+        ),
+        migrations.AddField(
+            model_name='couponcode',
+            name='site',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coupon_code', to='sites.site', verbose_name='Site'),
+        ),
+        migrations.AddField(
+            model_name='promo',
+            name='normalized_code',
+            field=vendorpromo.models.NormalizedCodeField(blank=True, editable=False, max_length=80, null=True, populate_from='code', verbose_name='Normalized Code'),
+        ),
+        migrations.AddField(
+            model_name='promo',
+            name='site',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promo', to='sites.site', verbose_name='Site'),
+        ),
+    ]
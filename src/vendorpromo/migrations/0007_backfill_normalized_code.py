@@ -0,0 +1,50 @@
+from django.db import migrations, transaction
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def normalize_code(code):
+    # Copied from vendorpromo.utils so the migration does not change if the helper does.
+    if code is None:
+        return None
+    return str(code).strip().casefold()
+
+
+def backfill_chunks(model, site_field):
+    """
+    Walks the table in primary key order, BACKFILL_CHUNK_SIZE rows at a time,
+    committing each chunk so large tables are not locked in one transaction.
+    """
+    last_pk = 0
+
+    while True:
+        with transaction.atomic():
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'code', site_field)[:BACKFILL_CHUNK_SIZE])
+
+            if not rows:
+                break
+
+            model.objects.bulk_update(
+                [model(pk=pk, normalized_code=normalize_code(code), site_id=site_id) for pk, code, site_id in rows],
+                ['normalized_code', 'site'],
+                batch_size=BACKFILL_CHUNK_SIZE
+            )
+
+        last_pk = rows[-1][0]
+
+
+def backfill_normalized_code(apps, schema_editor):
+    backfill_chunks(apps.get_model('vendorpromo', 'CouponCode'), 'promo__site_id')
+    backfill_chunks(apps.get_model('vendorpromo', 'Promo'), 'offer__site_id')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('vendorpromo', '0006_normalized_code_site'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_normalized_code, migrations.RunPython.noop),
+    ]
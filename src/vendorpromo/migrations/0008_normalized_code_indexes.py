@@ -0,0 +1,40 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:40
+
+import logging
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+logger = logging.getLogger(__name__)
+
+
+def release_duplicate_codes(apps, schema_editor):
+    # Codes that only differ by case or whitespace would break the unique
+    # constraint. The oldest one keeps its normalized code, the others are left
+    # without one, so checkout does not find them, and are reported to be renamed.
+    CouponCode = apps.get_model('vendorpromo', 'CouponCode')
+    duplicates = CouponCode.objects.filter(site__isnull=False, normalized_code__isnull=False).values('site', 'normalized_code').annotate(count=Count('pk'), first_pk=Min('pk')).filter(count__gt=1).order_by()
+
+    for duplicate in duplicates:
+        coupon_codes = CouponCode.objects.filter(site=duplicate['site'], normalized_code=duplicate['normalized_code']).exclude(pk=duplicate['first_pk'])
+        logger.warning(f"Coupon Codes {list(coupon_codes.values_list('pk', flat=True))} of site {duplicate['site']} duplicate Coupon Code {duplicate['first_pk']} ({duplicate['normalized_code']}), rename them to use them again")
+        coupon_codes.update(normalized_code=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0007_backfill_normalized_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promo',
+            index=models.Index(fields=['site', 'normalized_code'], name='vendorpromo_promo_code_idx'),
+        ),
+        migrations.RunPython(release_duplicate_codes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='couponcode',
+            constraint=models.UniqueConstraint(fields=('site', 'normalized_code'), name='vendorpromo_couponcode_unique_code'),
+        ),
+    ]
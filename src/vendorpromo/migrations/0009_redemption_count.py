@@ -0,0 +1,39 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_redemption_counts(apps, schema_editor):
+    # Same as vendorpromo.redemptions.reconcile_redemption_counts on the historical models.
+    CouponCode = apps.get_model('vendorpromo', 'CouponCode')
+    PromotionalCampaign = apps.get_model('vendorpromo', 'PromotionalCampaign')
+    CouponCodeInvoice = CouponCode.invoice.through
+
+    coupon_code_redemptions = CouponCodeInvoice.objects.filter(couponcode=OuterRef('pk')).order_by().values('couponcode').annotate(count=Count('pk')).values('count')
+    campaign_redemptions = CouponCodeInvoice.objects.filter(couponcode__promo=OuterRef('pk')).order_by().values('couponcode__promo').annotate(count=Count('pk')).values('count')
+
+    CouponCode.objects.update(redemption_count=Coalesce(Subquery(coupon_code_redemptions), 0))
+    PromotionalCampaign.objects.update(redemption_count=Coalesce(Subquery(campaign_redemptions), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0008_normalized_code_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='couponcode',
+            name='redemption_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Redemption Count'),
+        ),
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='redemption_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Redemptions reserved by all the campaign's coupon codes", verbose_name='Redemption Count'),
+        ),
+        migrations.RunPython(backfill_redemption_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0009_redemption_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='auto_apply',
+            field=models.BooleanField(default=False, help_text='Apply this campaign to carts with its products without a coupon code', verbose_name='Auto Apply?'),
+        ),
+    ]
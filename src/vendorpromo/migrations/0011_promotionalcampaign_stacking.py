@@ -0,0 +1,23 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0010_promotionalcampaign_auto_apply'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='stack_group',
+            field=models.CharField(blank=True, help_text='Coupon codes from campaigns in the same stack group can be applied together', max_length=80, null=True, verbose_name='Stack Group'),
+        ),
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='stack_limit',
+            field=models.PositiveSmallIntegerField(blank=True, help_text="The most coupon codes that can be applied together with this campaign's codes", null=True, verbose_name='Stack Limit'),
+        ),
+    ]
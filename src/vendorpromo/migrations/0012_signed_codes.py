@@ -0,0 +1,43 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendor', '0043_invoice_global_discount'),
+        ('vendorpromo', '0011_promotionalcampaign_stacking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='code_mode',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Stored Codes'), (1, 'Signed Codes')], default=0, help_text='Stored codes are Coupon Codes, signed codes are validated by their signature and only their redemptions are stored', verbose_name='Code Mode'),
+        ),
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='signed_code_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Signed Codes Issued'),
+        ),
+        migrations.CreateModel(
+            name='SignedCodeRedemption',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial', models.PositiveIntegerField(verbose_name='Serial')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='signed_code_redemption', to='vendor.invoice', verbose_name='Invoice')),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signed_code_redemption', to='vendorpromo.promotionalcampaign', verbose_name='Promotional Campaign')),
+            ],
+            options={
+                'verbose_name': 'Signed Code Redemption',
+                'verbose_name_plural': 'Signed Code Redemptions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='signedcoderedemption',
+            constraint=models.UniqueConstraint(fields=('promo', 'serial'), name='vendorpromo_signedcoderedemption_unique_serial'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0012_signed_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoucheryExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('campaign_id', models.CharField(max_length=80, verbose_name='Vouchery Campaign Identifier')),
+                ('last_coupon_code_pk', models.PositiveBigIntegerField(default=0, verbose_name='Last Coupon Code Exported')),
+                ('exported_count', models.PositiveIntegerField(default=0, verbose_name='Exported')),
+                ('skipped_count', models.PositiveIntegerField(default=0, help_text='Codes Vouchery already had', verbose_name='Skipped')),
+                ('failed_count', models.PositiveIntegerField(default=0, verbose_name='Failed')),
+                ('seconds', models.FloatField(default=0, help_text='Time spent pushing codes over all the runs', verbose_name='Seconds')),
+                ('completed', models.DateTimeField(blank=True, help_text='When the last run reached the end of the codes', null=True, verbose_name='Completed')),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vouchery_export', to='vendorpromo.promotionalcampaign', verbose_name='Promotional Campaign')),
+            ],
+            options={
+                'verbose_name': 'Vouchery Export',
+                'verbose_name_plural': 'Vouchery Exports',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='voucheryexport',
+            constraint=models.UniqueConstraint(fields=('promo', 'campaign_id'), name='vendorpromo_voucheryexport_unique_campaign'),
+        ),
+    ]
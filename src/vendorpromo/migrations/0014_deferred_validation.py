@@ -0,0 +1,40 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendor', '0043_invoice_global_discount'),
+        ('sites', '0002_alter_domain_unique'),
+        ('vendorpromo', '0013_vouchery_export'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeferredValidation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('code', models.CharField(max_length=80, verbose_name='Code')),
+                ('offer_cost', models.FloatField(blank=True, null=True, verbose_name='Offer Cost')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('is_valid', models.BooleanField(blank=True, help_text="The processor's answer once it was checked", null=True, verbose_name='Valid?')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('checked', models.DateTimeField(blank=True, null=True, verbose_name='Checked')),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deferred_validation', to='vendor.invoice', verbose_name='Invoice')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deferred_validation', to='sites.site', verbose_name='Site')),
+            ],
+            options={
+                'verbose_name': 'Deferred Validation',
+                'verbose_name_plural': 'Deferred Validations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='deferredvalidation',
+            index=models.Index(fields=['checked', 'site'], name='vendorpromo_deferred_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('sites', '0002_alter_domain_unique'),
+        ('vendorpromo', '0014_deferred_validation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='last updated')),
+                ('processor', models.CharField(help_text='Path of the processor class in vendorpromo.processors, e.g. stripe.StripePromoProcessor', max_length=120, verbose_name='Processor')),
+                ('action', models.CharField(help_text='Name of the processor method that sends the message', max_length=80, verbose_name='Action')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Object Id')),
+                ('idempotency_key', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Idempotency Key')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Sent'), (2, 'Failed')], default=0, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next Attempt')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('sent', models.DateTimeField(blank=True, null=True, verbose_name='Sent')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Content Type')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_message', to='sites.site', verbose_name='Site')),
+            ],
+            options={
+                'verbose_name': 'Outbox Message',
+                'verbose_name_plural': 'Outbox Messages',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['status', 'next_attempt'], name='vendorpromo_outbox_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        ('vendorpromo', '0015_outbox_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='Event Id')),
+                ('type', models.CharField(max_length=80, verbose_name='Type')),
+                ('data', models.JSONField(default=dict, help_text='The object the event is about', verbose_name='Data')),
+                ('stripe_created', models.DateTimeField(verbose_name='Created in Stripe')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('applied', models.DateTimeField(blank=True, null=True, verbose_name='Applied')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_event', to='sites.site', verbose_name='Site')),
+            ],
+            options={
+                'verbose_name': 'Stripe Event',
+                'verbose_name_plural': 'Stripe Events',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(fields=['applied', 'site'], name='vendorpromo_stripe_event_idx'),
+        ),
+    ]
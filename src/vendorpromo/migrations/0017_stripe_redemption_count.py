@@ -0,0 +1,33 @@
+# Generated by Django 3.2.20 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+def backfill_stripe_redemption_counts(apps, schema_editor):
+    # The webhook kept Stripe's times_redeemed in meta before it had its own field
+    for model_name in ('CouponCode', 'PromotionalCampaign'):
+        model = apps.get_model('vendorpromo', model_name)
+
+        for pk, meta in model.objects.filter(meta__has_key='stripe_times_redeemed').values_list('pk', 'meta').iterator():
+            model.objects.filter(pk=pk).update(stripe_redemption_count=meta['stripe_times_redeemed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0016_stripe_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='couponcode',
+            name='stripe_redemption_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Redemptions of the code's Stripe promotion code, from its webhook events", verbose_name='Stripe Redemption Count'),
+        ),
+        migrations.AddField(
+            model_name='promotionalcampaign',
+            name='stripe_redemption_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Redemptions of the campaign's Stripe coupon, from its webhook events", verbose_name='Stripe Redemption Count'),
+        ),
+        migrations.RunPython(backfill_stripe_redemption_counts, migrations.RunPython.noop),
+    ]
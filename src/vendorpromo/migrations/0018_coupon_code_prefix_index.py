@@ -0,0 +1,17 @@
+# Generated by Django 3.2.20 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0017_stripe_redemption_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='couponcode',
+            index=models.Index(fields=['normalized_code'], name='vendorpromo_coupon_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
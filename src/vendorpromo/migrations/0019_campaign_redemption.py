@@ -0,0 +1,45 @@
+# Generated by Django 3.2.20 on 2026-10-18 13:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_campaign_redemptions(apps, schema_editor):
+    # Auto apply campaigns were counted by the invoices with their offer, keep
+    # the invoices holding the offer without one of the campaign's codes.
+    CampaignRedemption = apps.get_model('vendorpromo', 'CampaignRedemption')
+    PromotionalCampaign = apps.get_model('vendorpromo', 'PromotionalCampaign')
+    OrderItem = apps.get_model('vendor', 'OrderItem')
+
+    for promotional_campaign in PromotionalCampaign.objects.filter(auto_apply=True):
+        invoice_pks = OrderItem.objects.filter(offer=promotional_campaign.applies_to_id).exclude(invoice__coupon_code__promo=promotional_campaign).values_list('invoice', flat=True).distinct()
+        CampaignRedemption.objects.bulk_create([CampaignRedemption(promo=promotional_campaign, invoice_id=invoice_pk) for invoice_pk in invoice_pks], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendor', '0043_invoice_global_discount'),
+        ('vendorpromo', '0018_coupon_code_prefix_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignRedemption',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_redemption', to='vendor.invoice', verbose_name='Invoice')),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_redemption', to='vendorpromo.promotionalcampaign', verbose_name='Promotional Campaign')),
+            ],
+            options={
+                'verbose_name': 'Campaign Redemption',
+                'verbose_name_plural': 'Campaign Redemptions',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='campaignredemption',
+            constraint=models.UniqueConstraint(fields=('promo', 'invoice'), name='vendorpromo_campaignredemption_unique_invoice'),
+        ),
+        migrations.RunPython(backfill_campaign_redemptions, migrations.RunPython.noop),
+    ]
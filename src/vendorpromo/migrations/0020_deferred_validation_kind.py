@@ -0,0 +1,25 @@
+# Generated by Django 3.2.20 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+def backfill_code_checks(apps, schema_editor):
+    # Codes deferred by is_code_valid are the ones stored without an offer cost
+    DeferredValidation = apps.get_model('vendorpromo', 'DeferredValidation')
+    DeferredValidation.objects.filter(offer_cost__isnull=True, checked__isnull=True).update(kind=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendorpromo', '0019_campaign_redemption'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deferredvalidation',
+            name='kind',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Code'), (1, 'Checkout')], default=1, help_text='Code checks only look the code up, checkout checks also create its redemption', verbose_name='Kind'),
+        ),
+        migrations.RunPython(backfill_code_checks, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,8 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
 from vendorpromo.utils import get_site_from_request
 
 class SiteOnRequestFilterMixin:
@@ -5,4 +10,29 @@ class SiteOnRequestFilterMixin:
     def get_queryset(self):
         if hasattr(self.request, 'site'):
             return self.model.objects.filter(site=get_site_from_request(self.request))
-        return self.model.on_site.all()
\ No newline at end of file
+        return self.model.on_site.all()
+
+
+class AsyncLoginRequiredMixin:
+    """
+    LoginRequiredMixin for views with async handlers. Django 3.2 only awaits
+    async function views, so as_view() marks the view function as a coroutine
+    function. The user is loaded in a worker thread since it queries the session.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+
+        response = super().dispatch(request, *args, **kwargs)
+
+        if asyncio.iscoroutine(response):
+            response = await response
+
+        return response
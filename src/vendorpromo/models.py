@@ -1,14 +1,61 @@
 import uuid
-import math
 
 from autoslug import AutoSlugField
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from vendor.models import CustomerProfile, Invoice, Offer
 from vendor.models.choice import InvoiceStatus
 
+from vendorpromo.utils import normalize_code
+
+
+#######################################
+# FIELDS
+class NormalizedCodeField(models.CharField):
+    '''
+    Stores the normalized value of the populate_from field when the model is saved,
+    so code lookups can match an indexed column instead of scanning with iexact.
+    It needs to be declared after the populate_from field so it is populated after it.
+    '''
+    def __init__(self, *args, populate_from=None, **kwargs):
+        self.populate_from = populate_from
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['populate_from'] = self.populate_from
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = normalize_code(getattr(model_instance, self.populate_from))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+#######################################
+# CHOICES
+class CodeMode(models.IntegerChoices):
+    STORED = 0, _("Stored Codes")
+    SIGNED = 1, _("Signed Codes")
+
+
+class ValidationKind(models.IntegerChoices):
+    CODE = 0, _("Code")
+    CHECKOUT = 1, _("Checkout")
+
+
+class OutboxStatus(models.IntegerChoices):
+    PENDING = 0, _("Pending")
+    SENT = 1, _("Sent")
+    FAILED = 2, _("Failed")
+
+
 #######################################
 # ABSTRACT MODELS
 class CreateUpdateModelBase(models.Model):
@@ -39,6 +86,8 @@ class Promo(CreateUpdateModelBase):
     meta = models.JSONField(_("Meta"), default=dict, blank=True, null=True)
     offer = models.ForeignKey(Offer, blank=False, null=False, related_name="promo", on_delete=models.CASCADE)
     slug = AutoSlugField(populate_from='code', unique_with='offer__site__id')
+    normalized_code = NormalizedCodeField(_("Normalized Code"), max_length=80, populate_from='code', blank=True, null=True)
+    site = models.ForeignKey(Site, related_name=("promo"), on_delete=models.CASCADE, blank=True, null=True, editable=False, verbose_name=_("Site"))
 
     objects = models.Manager()
 
@@ -48,13 +97,17 @@ class Promo(CreateUpdateModelBase):
     class Meta:
         verbose_name = "Promo"
         verbose_name_plural = "Promos"
+        indexes = [
+            models.Index(fields=['site', 'normalized_code'], name='vendorpromo_promo_code_idx'),
+        ]
 
     def clean(self):
-        if Promo.objects.filter(code=self.code, offer__site=self.offer.site).exists():
+        if Promo.objects.filter(normalized_code=normalize_code(self.code), site=self.offer.site).exists():
             raise ValidationError(_("Code already exists"))
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        self.site_id = self.offer.site_id
         return super().save(*args, **kwargs)
 
 
@@ -73,7 +126,14 @@ class PromotionalCampaign(CreateUpdateModelBase):
     start_date = models.DateTimeField(_("Start Date"), blank=True, null=True, help_text=_("The date when this promotion is valid from"))
     end_date = models.DateTimeField(_("End Date"), blank=True, null=True, help_text=_("The date when this promotion is no longer valid"))
     is_percent_off = models.BooleanField(_("Percent Off?"), default=False, help_text=_("Fixed Amount or Percent Off"))
+    auto_apply = models.BooleanField(_("Auto Apply?"), default=False, help_text=_("Apply this campaign to carts with its products without a coupon code"))
+    stack_group = models.CharField(_("Stack Group"), max_length=80, blank=True, null=True, help_text=_("Coupon codes from campaigns in the same stack group can be applied together"))
+    stack_limit = models.PositiveSmallIntegerField(_("Stack Limit"), blank=True, null=True, help_text=_("The most coupon codes that can be applied together with this campaign's codes"))
+    code_mode = models.PositiveSmallIntegerField(_("Code Mode"), choices=CodeMode.choices, default=CodeMode.STORED, help_text=_("Stored codes are Coupon Codes, signed codes are validated by their signature and only their redemptions are stored"))
+    signed_code_count = models.PositiveIntegerField(_("Signed Codes Issued"), default=0, editable=False)
     max_redemptions = models.IntegerField(_("Max Redemptions"), blank=True, null=True, help_text=_("The maximum redemptions for the whole promotion"))
+    redemption_count = models.PositiveIntegerField(_("Redemption Count"), default=0, editable=False, help_text=_("Redemptions reserved by all the campaign's coupon codes"))
+    stripe_redemption_count = models.PositiveIntegerField(_("Stripe Redemption Count"), default=0, editable=False, help_text=_("Redemptions of the campaign's Stripe coupon, from its webhook events"))
     applies_to = models.ForeignKey(Offer, related_name=("promo_campaign"), blank=False, null=False, on_delete=models.CASCADE)
     site = models.ForeignKey(Site, related_name=("promo_campaign"), on_delete=models.CASCADE, blank=False, null=False, verbose_name=_("Site"))
     meta = models.JSONField(_("Meta"), default=dict, blank=True, null=True)
@@ -93,20 +153,49 @@ class CouponCode(CreateUpdateModelBase):
     active = models.BooleanField(_("Active"), default=True)
     code = AutoSlugField(unique_with=('promo__site'), editable=True, blank=True, null=True, sep="copy", verbose_name=_("Affiliate Code"))
     max_redemptions = models.IntegerField(_("Max Redemptions"), blank=True, null=True)
+    redemption_count = models.PositiveIntegerField(_("Redemption Count"), default=0, editable=False)
+    stripe_redemption_count = models.PositiveIntegerField(_("Stripe Redemption Count"), default=0, editable=False, help_text=_("Redemptions of the code's Stripe promotion code, from its webhook events"))
     end_date = models.DateTimeField(_("End Date"), blank=True, null=True, help_text=_("When will the code be unavailable"))
     meta = models.JSONField(blank=True, null=True, default=dict)
     promo = models.ForeignKey(PromotionalCampaign, related_name=("coupon_code"), blank=False, null=False, on_delete=models.CASCADE)
     invoice = models.ManyToManyField(Invoice, related_name=("coupon_code"), blank=True)
+    normalized_code = NormalizedCodeField(_("Normalized Code"), max_length=50, populate_from='code', blank=True, null=True)
+    site = models.ForeignKey(Site, related_name=("coupon_code"), on_delete=models.CASCADE, blank=True, null=True, editable=False, verbose_name=_("Site"))
 
     objects = models.Manager()
 
     class Meta:
         verbose_name = "Coupon Code"
         verbose_name_plural = "Coupon Codes"
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'normalized_code'], name='vendorpromo_couponcode_unique_code'),
+        ]
+        indexes = [
+            # Prefix searches, PostgreSQL only uses an index for LIKE with the pattern operator class
+            models.Index(fields=['normalized_code'], name='vendorpromo_coupon_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.code
 
+    def validate_unique(self, exclude=None):
+        """
+        normalized_code is not editable, so model forms skip its unique
+        constraint. Codes are checked here by their normalized code within
+        the campaign's site instead.
+        """
+        super().validate_unique(exclude=exclude)
+
+        if self.code is None or self.promo_id is None or 'code' in (exclude or ()):
+            return None
+
+        if CouponCode.objects.filter(site=self.promo.site_id, normalized_code=normalize_code(self.code)).exclude(pk=self.pk).exists():
+            raise ValidationError({'code': _("Code already exists")})
+
+    def save(self, *args, **kwargs):
+        self.site_id = self.promo.site_id
+        return super().save(*args, **kwargs)
+
     def get_display_code(self):
         return str(self.code).upper()
     
@@ -143,17 +232,169 @@ class CouponCode(CreateUpdateModelBase):
         Returns:
             Decimal: The amount discounted
         """
-        coupon_discount = 0
+        # Imported here because both modules import the models
+        from vendorpromo.coupon_table import coupon_table
+        from vendorpromo.discounts import calculate_discount, get_offer_snapshot
 
-        if self.does_offer_apply(offer):
-            coupon_discount = math.fabs(self.promo.applies_to.current_price())
+        cart_lines = get_offer_snapshot(offer)
+        coupon_discount = calculate_discount(cart_lines, coupon_table.get_compiled_coupon(self))
 
-            if self.promo.is_percent_off:
-                return (offer.current_price() * coupon_discount) / 100
-            else:
-                return coupon_discount
+        return coupon_discount.line_discounts.get(offer.pk, 0)
+
+
+class SignedCodeRedemption(models.Model):
+    '''
+    Redemption of a signed code, keyed by the code's serial number within its campaign.
+    Signed codes have no Coupon Code, so this is the only row stored for them.
+    '''
+    promo = models.ForeignKey(PromotionalCampaign, related_name=("signed_code_redemption"), on_delete=models.CASCADE, verbose_name=_("Promotional Campaign"))
+    serial = models.PositiveIntegerField(_("Serial"))
+    invoice = models.ForeignKey(Invoice, related_name=("signed_code_redemption"), blank=True, null=True, on_delete=models.SET_NULL, verbose_name=_("Invoice"))
+    created = models.DateTimeField("date created", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Signed Code Redemption"
+        verbose_name_plural = "Signed Code Redemptions"
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'serial'], name='vendorpromo_signedcoderedemption_unique_serial'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo_id}:{self.serial}"
+
+
+class CampaignRedemption(models.Model):
+    '''
+    Redemption of a Promotional Campaign applied without a code, like an auto apply campaign, by an invoice.
+    It records which of the campaigns on an offer the invoice reserved, so only that one is released.
+    '''
+    promo = models.ForeignKey(PromotionalCampaign, related_name=("campaign_redemption"), on_delete=models.CASCADE, verbose_name=_("Promotional Campaign"))
+    invoice = models.ForeignKey(Invoice, related_name=("campaign_redemption"), on_delete=models.CASCADE, verbose_name=_("Invoice"))
+    created = models.DateTimeField("date created", auto_now_add=True)
 
-        return 0
+    class Meta:
+        verbose_name = "Campaign Redemption"
+        verbose_name_plural = "Campaign Redemptions"
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'invoice'], name='vendorpromo_campaignredemption_unique_invoice'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo_id}:{self.invoice_id}"
+
+
+class VoucheryExport(CreateUpdateModelBase):
+    '''
+    Checkpoint of the export of a Promotional Campaign's Coupon Codes to a Vouchery campaign. Codes are exported in
+    pk order, so every code up to last_coupon_code_pk has been pushed and a new run carries on from there, starting
+    with the codes that failed.
+    '''
+    promo = models.ForeignKey(PromotionalCampaign, related_name=("vouchery_export"), on_delete=models.CASCADE, verbose_name=_("Promotional Campaign"))
+    campaign_id = models.CharField(_("Vouchery Campaign Identifier"), max_length=80)
+    last_coupon_code_pk = models.PositiveBigIntegerField(_("Last Coupon Code Exported"), default=0)
+    exported_count = models.PositiveIntegerField(_("Exported"), default=0)
+    skipped_count = models.PositiveIntegerField(_("Skipped"), default=0, help_text=_("Codes Vouchery already had"))
+    failed_count = models.PositiveIntegerField(_("Failed"), default=0)
+    seconds = models.FloatField(_("Seconds"), default=0, help_text=_("Time spent pushing codes over all the runs"))
+    completed = models.DateTimeField(_("Completed"), blank=True, null=True, help_text=_("When the last run reached the end of the codes"))
+
+    class Meta:
+        verbose_name = "Vouchery Export"
+        verbose_name_plural = "Vouchery Exports"
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'campaign_id'], name='vendorpromo_voucheryexport_unique_campaign'),
+        ]
+
+    def __str__(self):
+        return f"{self.promo_id}:{self.campaign_id}"
+
+    @property
+    def throughput(self):
+        '''
+        Codes pushed per second over all the runs.
+        '''
+        pushed = self.exported_count + self.skipped_count + self.failed_count
+        return pushed / self.seconds if self.seconds else 0
+
+
+class DeferredValidation(CreateUpdateModelBase):
+    '''
+    Code accepted on checkout from the local data while the site's promo processor could not be reached. It is checked
+    with the processor once it is back by the reconcile_deferred_validations command, with the same kind of check.
+    '''
+    site = models.ForeignKey(Site, related_name=("deferred_validation"), on_delete=models.CASCADE, verbose_name=_("Site"))
+    code = models.CharField(_("Code"), max_length=80)
+    invoice = models.ForeignKey(Invoice, related_name=("deferred_validation"), blank=True, null=True, on_delete=models.SET_NULL, verbose_name=_("Invoice"))
+    offer_cost = models.FloatField(_("Offer Cost"), blank=True, null=True)
+    kind = models.PositiveSmallIntegerField(_("Kind"), choices=ValidationKind.choices, default=ValidationKind.CHECKOUT, help_text=_("Code checks only look the code up, checkout checks also create its redemption"))
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    is_valid = models.BooleanField(_("Valid?"), blank=True, null=True, help_text=_("The processor's answer once it was checked"))
+    error = models.TextField(_("Error"), blank=True, null=True)
+    checked = models.DateTimeField(_("Checked"), blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Deferred Validation"
+        verbose_name_plural = "Deferred Validations"
+        indexes = [
+            models.Index(fields=['checked', 'site'], name='vendorpromo_deferred_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.site_id}:{self.code}"
+
+
+class OutboxMessage(CreateUpdateModelBase):
+    '''
+    Call to a promo processor's external service queued in the same transaction as the change of the object it is
+    about. The drain_promo_outbox command sends it by calling the processor's action method with the object. The
+    idempotency key is sent with every attempt so the service can drop the ones it already handled.
+    '''
+    site = models.ForeignKey(Site, related_name=("outbox_message"), on_delete=models.CASCADE, verbose_name=_("Site"))
+    processor = models.CharField(_("Processor"), max_length=120, help_text=_("Path of the processor class in vendorpromo.processors, e.g. stripe.StripePromoProcessor"))
+    action = models.CharField(_("Action"), max_length=80, help_text=_("Name of the processor method that sends the message"))
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, verbose_name=_("Content Type"))
+    object_id = models.PositiveIntegerField(_("Object Id"))
+    content_object = GenericForeignKey('content_type', 'object_id')
+    idempotency_key = models.UUIDField(_("Idempotency Key"), default=uuid.uuid4, editable=False, unique=True)
+    status = models.PositiveSmallIntegerField(_("Status"), choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    next_attempt = models.DateTimeField(_("Next Attempt"), default=timezone.now)
+    error = models.TextField(_("Error"), blank=True, null=True)
+    sent = models.DateTimeField(_("Sent"), blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'], name='vendorpromo_outbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.processor}.{self.action}:{self.object_id}"
+
+
+class StripeEvent(models.Model):
+    '''
+    Stripe webhook event received for a site, stored once per event id so events Stripe sends again are dropped. The
+    redemptions in its object are applied to the local counters in batches, applied is set once they were.
+    '''
+    site = models.ForeignKey(Site, related_name=("stripe_event"), on_delete=models.CASCADE, verbose_name=_("Site"))
+    event_id = models.CharField(_("Event Id"), max_length=255, unique=True)
+    type = models.CharField(_("Type"), max_length=80)
+    data = models.JSONField(_("Data"), default=dict, help_text=_("The object the event is about"))
+    stripe_created = models.DateTimeField(_("Created in Stripe"))
+    created = models.DateTimeField("date created", auto_now_add=True)
+    applied = models.DateTimeField(_("Applied"), blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Stripe Event"
+        verbose_name_plural = "Stripe Events"
+        indexes = [
+            models.Index(fields=['applied', 'site'], name='vendorpromo_stripe_event_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type}:{self.event_id}"
 
 
 class Affiliate(CreateUpdateModelBase):
@@ -0,0 +1,169 @@
+"""
+Outbox of the promo processors' calls to their external services.
+
+With VENDOR_PROMO_PROCESSOR_OUTBOX on, the processors save the objects they
+create and enqueue() an OutboxMessage in the same transaction, instead of
+calling the service during the request. drain() sends the due messages in
+batches. Each batch is claimed first, so concurrent workers skip it, then
+every message is sent by calling its processor's action method with its
+object and idempotency key. A message that fails is retried with an
+exponential backoff until it fails VENDOR_PROMO_PROCESSOR_OUTBOX_MAX_ATTEMPTS
+times.
+
+An action method returns once the object is in the external service and
+raises OutboxError otherwise, with retry False if trying again can not help.
+Any other error is logged and the message is retried.
+"""
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from vendorpromo.config import (VENDOR_PROMO_PROCESSOR_OUTBOX_BACKOFF,
+                                VENDOR_PROMO_PROCESSOR_OUTBOX_BATCH_SIZE,
+                                VENDOR_PROMO_PROCESSOR_OUTBOX_MAX_ATTEMPTS)
+from vendorpromo.fallback import UNAVAILABLE_ERRORS
+from vendorpromo.models import OutboxMessage, OutboxStatus
+from vendorpromo.processors import get_processor_class
+
+logger = logging.getLogger(__name__)
+
+# Time a claimed message is hidden from other workers, after which it is sent again if its worker died
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+DrainSummary = namedtuple('DrainSummary', ['sent', 'retried', 'failed'])
+
+
+class OutboxError(Exception):
+
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+
+def get_processor_path(processor):
+    """
+    Returns the path of the processor's class the way the site configs store
+    it, e.g. stripe.StripePromoProcessor.
+    """
+    processor_class = processor.__class__
+    return f"{processor_class.__module__.rsplit('.', 1)[-1]}.{processor_class.__name__}"
+
+
+def enqueue(processor, action, instance):
+    """
+    Queues the call of the processor's action method with the instance. Call
+    it in the transaction that saves the instance.
+    """
+    return OutboxMessage.objects.create(site=processor.site, processor=get_processor_path(processor), action=action, content_object=instance)
+
+
+def claim(batch_size, site=None):
+    """
+    Returns the next due messages, oldest first, after moving their next
+    attempt past the CLAIM_TIMEOUT so other workers skip them.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        messages = OutboxMessage.objects.select_for_update(skip_locked=True).filter(status=OutboxStatus.PENDING, next_attempt__lte=now)
+
+        if site is not None:
+            messages = messages.filter(site=site)
+
+        messages = list(messages.select_related('site').order_by('pk')[:batch_size])
+        OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(next_attempt=now + CLAIM_TIMEOUT)
+
+    return messages
+
+
+def get_processor(message, processors):
+    """
+    Returns the message's processor for its site, one instance per batch.
+    """
+    key = (message.site_id, message.processor)
+
+    if key not in processors:
+        try:
+            processors[key] = get_processor_class(message.processor)(message.site)
+        except (ImportError, ImproperlyConfigured, ValueError) as error:
+            raise OutboxError(f"The processor could not be set up: {error}")
+
+    return processors[key]
+
+
+def send(message, processors):
+    """
+    Sends the message and returns its new status.
+    """
+    message.attempts += 1
+
+    try:
+        if message.content_object is None:
+            raise OutboxError(f"The {message.content_type} {message.object_id} was deleted", retry=False)
+
+        getattr(get_processor(message, processors), message.action)(message.content_object, idempotency_key=str(message.idempotency_key))
+    except UNAVAILABLE_ERRORS as error:
+        return fail(message, OutboxError(str(error)))
+    except OutboxError as error:
+        return fail(message, error)
+    except Exception as error:
+        logger.exception(f"outbox.send: {message} raised an error")
+        return fail(message, OutboxError(f"{error.__class__.__name__}: {error}"))
+
+    message.status = OutboxStatus.SENT
+    message.sent = timezone.now()
+    message.error = None
+    message.save()
+
+    return message.status
+
+
+def fail(message, error):
+    message.error = str(error)
+
+    if error.retry and message.attempts < VENDOR_PROMO_PROCESSOR_OUTBOX_MAX_ATTEMPTS:
+        message.next_attempt = timezone.now() + timedelta(seconds=VENDOR_PROMO_PROCESSOR_OUTBOX_BACKOFF * 2 ** (message.attempts - 1))
+    else:
+        message.status = OutboxStatus.FAILED
+        logger.warning(f"outbox.send: {message} failed after {message.attempts} attempts: {error}")
+
+    message.save()
+
+    return message.status
+
+
+def drain(batch_size=None, site=None, max_batches=None):
+    """
+    Sends the due messages, batch by batch, until there are none left or
+    max_batches were sent. Messages retried in the meantime wait for the
+    next drain.
+    """
+    batch_size = batch_size or VENDOR_PROMO_PROCESSOR_OUTBOX_BATCH_SIZE
+    sent, retried, failed = 0, 0, 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        messages = claim(batch_size, site)
+
+        if not messages:
+            break
+
+        processors = {}
+
+        for message in messages:
+            status = send(message, processors)
+
+            if status == OutboxStatus.SENT:
+                sent += 1
+            elif status == OutboxStatus.FAILED:
+                failed += 1
+            else:
+                retried += 1
+
+        batches += 1
+
+    return DrainSummary(sent, retried, failed)
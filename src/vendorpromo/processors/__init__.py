@@ -1,9 +1,114 @@
+import threading
+import uuid
+from functools import lru_cache
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.utils.module_loading import import_string
-from django.core.exceptions import ObjectDoesNotExist
+
+from vendorpromo.caches import SiteTable
 from vendorpromo.config import PromoProcessorSiteConfig
-from siteconfigs.models import SiteConfigModel
+
+# SiteConfigModel key of the promo processor configs
+PROCESSOR_CONFIG_KEY = f"{PromoProcessorSiteConfig.__module__}.{PromoProcessorSiteConfig.__name__}"
+
+
+class ProcessorTable(SiteTable):
+    """
+    Promo processor configuration of each site, so resolving a site's
+    processor does not query SiteConfigModel on every request. It is
+    invalidated by vendorpromo.signals when the site's config is saved.
+    """
+    name = 'processor'
+
+    def compile(self, site_id):
+        return dict(PromoProcessorSiteConfig(Site.objects.get(pk=site_id)).get_key_value())
+
+
+processor_table = ProcessorTable()
+
+
+@lru_cache(maxsize=None)
+def get_processor_class(path):
+    """
+    Returns the processor class of a path in vendorpromo.processors, e.g.
+    stripe.StripePromoProcessor.
+    """
+    return import_string(f"vendorpromo.processors.{path}")
 
 
 def get_site_promo_processor(site):
-    site_processor = PromoProcessorSiteConfig(site)
-    return import_string(f"vendorpromo.processors.{site_processor.get_key_value('promo_processor')}")
+    if site is None:
+        site = Site.objects.get_current()
+
+    site_processor = processor_table.get(site.pk)
+    return get_processor_class(site_processor.get('promo_processor', PromoProcessorSiteConfig.default['promo_processor']))
+
+
+class ProcessorPool(object):
+    """
+    Processor instances of each site, created once with their credentials
+    and reused by the requests after. Instances are kept per thread, since
+    the processors hold state between the calls of a request. Each site has
+    a version key in the cache, invalidate() drops it so every process
+    creates the site's processors again on their next use.
+    """
+    timeout = None
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get_version_key(self, site_id):
+        return f"vendorpromo.processor_pool.{site_id}.version"
+
+    def get_version(self, site_id):
+        version = cache.get(self.get_version_key(site_id))
+
+        if version is None:
+            cache.add(self.get_version_key(site_id), uuid.uuid4().hex, self.timeout)
+            version = cache.get(self.get_version_key(site_id))
+
+        return version
+
+    def get(self, site, processor_class):
+        """
+        Returns the site's instance of the processor class.
+        """
+        if not hasattr(self._local, 'sites'):
+            self._local.sites = {}
+
+        version = self.get_version(site.pk)
+        local_version, instances = self._local.sites.get(site.pk, (None, {}))
+
+        if version != local_version:
+            instances = {}
+            self._local.sites[site.pk] = (version, instances)
+
+        if processor_class not in instances:
+            instances[processor_class] = processor_class(site)
+
+        return instances[processor_class]
+
+    def invalidate(self, site_id):
+        cache.delete(self.get_version_key(site_id))
+
+        if hasattr(self._local, 'sites'):
+            self._local.sites.pop(site_id, None)
+
+    def clear(self):
+        for site_id in list(getattr(self._local, 'sites', {}).keys()):
+            self.invalidate(site_id)
+
+
+processor_pool = ProcessorPool()
+
+
+def get_site_promo_processor_instance(site):
+    """
+    Returns the shared instance of the site's promo processor. Pass the
+    invoice to the calls that need one instead of binding it.
+    """
+    if site is None:
+        site = Site.objects.get_current()
+
+    return processor_pool.get(site, get_site_promo_processor(site))
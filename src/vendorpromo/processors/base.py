@@ -1,8 +1,14 @@
 import math
 
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 from vendor.models import Offer, Price
 
+from vendorpromo.circuit_breaker import (FALLBACK_LOCAL, CircuitBreaker,
+                                         get_policy)
+from vendorpromo.fallback import defer_validation, is_code_valid_locally
+from vendorpromo.models import ValidationKind
+
 
 #############
 # BASE CLASS
@@ -11,6 +17,7 @@ class PromoProcessorBase(object):
     promo = None
     invoice = None
     redeemed = False
+    breaker_name = None  # Processors that call an external service name their circuit breaker
 
     response = None
     response_content = None
@@ -19,6 +26,8 @@ class PromoProcessorBase(object):
     is_request_success = False
 
     def __init__(self, site, invoice=None):
+        # Binding the invoice is kept for compatibility, shared instances from
+        # get_site_promo_processor_instance() get it passed to each call.
         self.site = site
         if invoice is not None:
             self.invoice = invoice
@@ -32,22 +41,34 @@ class PromoProcessorBase(object):
         self.response_message = None
         self.is_request_success = False
 
-    def set_promo_invoice_vendor_notes(self, code):
-        if self.invoice is None:
+    def get_invoice(self, invoice=None):
+        """
+        Returns the invoice passed to the call, or the one the processor was
+        created with.
+        """
+        return invoice if invoice is not None else self.invoice
+
+    def get_circuit_breaker(self):
+        return CircuitBreaker(self.breaker_name, self.site.pk)
+
+    def set_promo_invoice_vendor_notes(self, code, invoice=None):
+        invoice = self.get_invoice(invoice)
+
+        if invoice is None:
             # TODO: Should this raise an exception, probably.
             return None
 
-        if not self.invoice.vendor_notes:
-            self.invoice.vendor_notes = {}
-            self.invoice.vendor_notes['promos'] = {}
+        if not invoice.vendor_notes:
+            invoice.vendor_notes = {}
+            invoice.vendor_notes['promos'] = {}
 
-        if 'promos' in self.invoice.vendor_notes.keys():
-            if code not in self.invoice.vendor_notes['promos'].keys():
-                self.invoice.vendor_notes['promos'][code] = False
+        if 'promos' in invoice.vendor_notes.keys():
+            if code not in invoice.vendor_notes['promos'].keys():
+                invoice.vendor_notes['promos'][code] = False
         else:
-            self.invoice.vendor_notes['promos'] = {code: False}
+            invoice.vendor_notes['promos'] = {code: False}
 
-        self.invoice.save()
+        invoice.save()
 
     def create_promo_offer(self, promo_campaign, products, cost):
         now = timezone.now()
@@ -147,13 +168,43 @@ class PromoProcessorBase(object):
 
     ################
     # Processor Functions
-    def is_code_valid(self, code):
+    def is_code_valid(self, code, invoice=None):
         """
         Overwrite funtion to call external promo services.
         Eg. call Vouchary.io API to see if the code entered is valid.
         """
         return True
 
+    def check_code(self, code, invoice=None):
+        """
+        Checks the code with the external promo service. Unlike is_code_valid
+        it raises the error if the service can not be reached, it is used to
+        check the deferred validations.
+        """
+        return self.is_code_valid(code, invoice=invoice)
+
+    def check_code_on_checkout(self, code, offer_cost, invoice=None):
+        """
+        Checks the code with the external promo service. Unlike
+        is_code_valid_on_checkout it raises the error if the service can not be
+        reached, it is used to check the deferred validations.
+        """
+        return self.is_code_valid_on_checkout(code, offer_cost, invoice=invoice)
+
+    def validate_code_offline(self, code, offer_cost=None, invoice=None, kind=ValidationKind.CHECKOUT):
+        """
+        Validates the code from the local Coupon Code, Promotional Campaign and
+        Promo data when the external promo service can not be reached, if the
+        site's circuit breaker policy falls back to it. Accepted codes are
+        queued to be checked with the service once it is back, with the kind
+        of check they stand in for.
+        """
+        if get_policy(self.site.pk).fallback != FALLBACK_LOCAL or not is_code_valid_locally(self.site.pk, code):
+            return False
+
+        defer_validation(self.site, code, self.get_invoice(invoice), offer_cost, kind)
+        return True
+
     def redeem_code(self, code):
         """
         Overwrite funtion to call external promo services to redeem code.
@@ -170,6 +221,21 @@ class PromoProcessorBase(object):
         coupon_code.invoice = invoice
         coupon_code.save()
 
+    ################
+    # Async Processor Functions
+    async def ais_code_valid(self, code, invoice=None):
+        """
+        Async version of is_code_valid. It runs is_code_valid in a worker
+        thread unless the processor overrides it with native async calls.
+        """
+        return await sync_to_async(self.is_code_valid)(code, invoice=invoice)
+
+    async def ais_code_valid_on_checkout(self, code, offer_cost, invoice=None):
+        """
+        Async version of is_code_valid_on_checkout, see ais_code_valid.
+        """
+        return await sync_to_async(self.is_code_valid_on_checkout)(code, offer_cost, invoice=invoice)
+
     def process_promo(self, offer, promo_code):
         '''
         Function used to check if the promo code is valid through external
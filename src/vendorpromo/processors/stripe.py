@@ -1,6 +1,11 @@
 import math
+from django.db import transaction
 from vendor.config import DEFAULT_CURRENCY
+from vendorpromo.config import VENDOR_PROMO_PROCESSOR_OUTBOX
+from vendorpromo.outbox import OutboxError, enqueue
 from vendorpromo.processors.base import PromoProcessorBase
+from vendorpromo.processors.stripe_reconcile import StripeReconciliation
+from vendorpromo.processors.stripe_sync import StripeSync
 from vendor.processors.stripe import StripeProcessor as StripeBuilder
 
 
@@ -10,6 +15,8 @@ class StripePromoProcessor(PromoProcessorBase):
     def __init__(self, site, invoice=None):
         super().__init__(site, invoice)
         self.stripe_builder = StripeBuilder(self.site)
+        # The builder sets the site's key on the stripe module, which other sites' processors change, so each call passes it
+        self.api_key = self.stripe_builder.stripe.api_key
 
     # Stripe Object Builders
     ##########
@@ -42,8 +49,29 @@ class StripePromoProcessor(PromoProcessorBase):
 
         return promotion_code_data
 
-    def create_stripe_coupon(self, promotional_campaign):
+    def build_coupon_update(self, promotional_campaign):
+        # Stripe only lets a coupon's name and metadata change once it is created
         coupon_data = self.build_coupon(promotional_campaign)
+
+        return {'name': coupon_data['name'], 'metadata': coupon_data['metadata']}
+
+    def build_promotion_code_update(self, coupon_code):
+        promotion_code_data = self.build_promotion_code(coupon_code)
+        del(promotion_code_data['coupon'])
+        del(promotion_code_data['code'])
+        del(promotion_code_data['metadata'])
+        del(promotion_code_data['expires_at'])
+        del(promotion_code_data['max_redemptions'])
+
+        return promotion_code_data
+
+    def create_stripe_coupon(self, promotional_campaign, idempotency_key=None):
+        coupon_data = self.build_coupon(promotional_campaign)
+
+        if idempotency_key:
+            coupon_data['idempotency_key'] = idempotency_key
+
+        coupon_data['api_key'] = self.api_key
         stripe_coupon = self.stripe_builder.stripe_create_object(self.stripe_builder.stripe.Coupon, coupon_data)
 
         if not stripe_coupon:
@@ -56,18 +84,27 @@ class StripePromoProcessor(PromoProcessorBase):
         return promotional_campaign
 
     def update_stripe_coupon(self, promotional_campaign):
-        coupon_data = self.build_coupon(promotional_campaign)
-        del(coupon_data['amount_off'])
-        del(coupon_data['percent_off'])
-        del(coupon_data['currency'])
+        # Campaigns not in Stripe yet are created with their current values
+        if not promotional_campaign.meta.get('stripe_id'):
+            return None
+
+        coupon_data = self.build_coupon_update(promotional_campaign)
+        coupon_data['api_key'] = self.api_key
 
         stripe_coupon = self.stripe_builder.stripe_update_object(self.stripe_builder.stripe.Coupon, promotional_campaign.meta['stripe_id'], coupon_data)
 
         if not stripe_coupon:
             return None  # Think about returning an error
 
-    def create_stripe_promotion_code(self, coupon_code):
+        return stripe_coupon
+
+    def create_stripe_promotion_code(self, coupon_code, idempotency_key=None):
         promotion_code_data = self.build_promotion_code(coupon_code)
+
+        if idempotency_key:
+            promotion_code_data['idempotency_key'] = idempotency_key
+
+        promotion_code_data['api_key'] = self.api_key
         stripe_promotion_code = self.stripe_builder.stripe_create_object(self.stripe_builder.stripe.PromotionCode, promotion_code_data)
 
         if not stripe_promotion_code:
@@ -79,12 +116,11 @@ class StripePromoProcessor(PromoProcessorBase):
         return coupon_code
 
     def update_stripe_promotion_code(self, coupon_code):
-        promotion_code_data = self.build_promotion_code(coupon_code)
-        del(promotion_code_data['coupon'])
-        del(promotion_code_data['code'])
-        del(promotion_code_data['metadata'])
-        del(promotion_code_data['expires_at'])
-        del(promotion_code_data['max_redemptions'])
+        if not coupon_code.meta.get('stripe_id'):
+            return None
+
+        promotion_code_data = self.build_promotion_code_update(coupon_code)
+        promotion_code_data['api_key'] = self.api_key
 
         stripe_coupon = self.stripe_builder.stripe_update_object(self.stripe_builder.stripe.PromotionCode, coupon_code.meta['stripe_id'], promotion_code_data)
 
@@ -94,6 +130,9 @@ class StripePromoProcessor(PromoProcessorBase):
         return stripe_coupon
 
     def set_active_stripe_promotion_code(self, coupon_code, is_active):
+        if not coupon_code.meta.get('stripe_id'):
+            return None
+
         promotion_code_data = self.build_promotion_code(coupon_code)
         promotion_code_data['active'] = is_active
         del(promotion_code_data['coupon'])
@@ -101,19 +140,75 @@ class StripePromoProcessor(PromoProcessorBase):
         del(promotion_code_data['metadata'])
         del(promotion_code_data['expires_at'])
         del(promotion_code_data['max_redemptions'])
+        promotion_code_data['api_key'] = self.api_key
 
         stripe_coupon = self.stripe_builder.stripe_update_object(self.stripe_builder.stripe.PromotionCode, coupon_code.meta['stripe_id'], promotion_code_data)
 
         if not stripe_coupon:
             return None  # Think about returning an error
 
+        return stripe_coupon
+
+    def get_stripe_error(self):
+        return self.stripe_builder.transaction_info.get('errors') or "The Stripe call failed"
+
+    ################
+    # Outbox Actions
+    def send_stripe_coupon(self, promotional_campaign, idempotency_key=None):
+        if promotional_campaign.meta.get('stripe_id'):
+            return promotional_campaign
+
+        if not self.create_stripe_coupon(promotional_campaign, idempotency_key):
+            raise OutboxError(self.get_stripe_error())
+
+        return promotional_campaign
+
+    def send_stripe_promotion_code(self, coupon_code, idempotency_key=None):
+        if coupon_code.meta.get('stripe_id'):
+            return coupon_code
+
+        if 'stripe_id' not in coupon_code.promo.meta:
+            raise OutboxError(f"The Stripe coupon of {coupon_code.promo} was not created yet")
+
+        if not self.create_stripe_promotion_code(coupon_code, idempotency_key):
+            raise OutboxError(self.get_stripe_error())
+
+        return coupon_code
+
+    # Updates send the object's values when the message is sent, so they wait for the create message before them
+    def send_stripe_coupon_update(self, promotional_campaign, idempotency_key=None):
+        if 'stripe_id' not in promotional_campaign.meta:
+            raise OutboxError(f"The Stripe coupon of {promotional_campaign} was not created yet")
+
+        if not self.update_stripe_coupon(promotional_campaign):
+            raise OutboxError(self.get_stripe_error())
+
+        return promotional_campaign
+
+    def send_stripe_promotion_code_update(self, coupon_code, idempotency_key=None):
+        if 'stripe_id' not in coupon_code.meta:
+            raise OutboxError(f"The Stripe promotion code of {coupon_code} was not created yet")
+
+        if not self.update_stripe_promotion_code(coupon_code):
+            raise OutboxError(self.get_stripe_error())
+
+        return coupon_code
+
     ################
     # Promotion Management
     def create_promo(self, promo_form):
         '''
         Override if you need to do additional steps when creating a Promo instance,
         such as creating the promo code in an external service if needed.
+        With VENDOR_PROMO_PROCESSOR_OUTBOX on the Stripe coupon is created by the outbox.
         '''
+        if VENDOR_PROMO_PROCESSOR_OUTBOX:
+            with transaction.atomic():
+                promo_campaign = super().create_promo(promo_form)
+                enqueue(self, 'send_stripe_coupon', promo_campaign)
+
+            return promo_campaign
+
         promo_campaign = super().create_promo(promo_form)
         self.create_stripe_coupon(promo_campaign)
         
@@ -123,7 +218,15 @@ class StripePromoProcessor(PromoProcessorBase):
         '''
         Override if you need to do additional steps when updating a Promo instance,
         such as editing the promo code in an external service if needed.
+        With VENDOR_PROMO_PROCESSOR_OUTBOX on the Stripe coupon is updated by the outbox.
         '''
+        if VENDOR_PROMO_PROCESSOR_OUTBOX:
+            with transaction.atomic():
+                promo_campaign = super().update_promo(promo_form)
+                enqueue(self, 'send_stripe_coupon_update', promo_campaign)
+
+            return promo_campaign
+
         promo_campaign = super().update_promo(promo_form)
         self.update_stripe_coupon(promo_campaign)
 
@@ -137,33 +240,72 @@ class StripePromoProcessor(PromoProcessorBase):
         stripe_id = promo_campaign.meta.get('stripe_id')
         
         if stripe_id:
-            self.stripe_builder.stripe_delete_object(self.stripe_builder.stripe.Coupon, stripe_id)
+            self.stripe_builder.stripe_call(self.stripe_builder.stripe.Coupon.delete, {'sid': stripe_id, 'api_key': self.api_key})
         
         super().delete_promo(promo_campaign)
 
     ################
     # Coupon Code Management
     def create_coupon_code(self, coupon_form):
+        if VENDOR_PROMO_PROCESSOR_OUTBOX:
+            with transaction.atomic():
+                coupon_code = super().create_coupon_code(coupon_form)
+                enqueue(self, 'send_stripe_promotion_code', coupon_code)
+
+            return coupon_code
+
         coupon_code = super().create_coupon_code(coupon_form)
         self.create_stripe_promotion_code(coupon_code)
 
         return coupon_code
 
     def update_coupon_code(self, coupon_form):
+        if VENDOR_PROMO_PROCESSOR_OUTBOX:
+            with transaction.atomic():
+                coupon_code = super().update_coupon_code(coupon_form)
+                enqueue(self, 'send_stripe_promotion_code_update', coupon_code)
+
+            return coupon_code
+
         coupon_code = super().update_coupon_code(coupon_form)
         self.update_stripe_promotion_code(coupon_code)
 
         return coupon_code
 
     def set_active_coupon_code(self, coupon_code, is_active):
+        if VENDOR_PROMO_PROCESSOR_OUTBOX:
+            with transaction.atomic():
+                super().set_active_coupon_code(coupon_code, is_active)
+                enqueue(self, 'send_stripe_promotion_code_update', coupon_code)
+
+            return coupon_code
+
         super().set_active_coupon_code(coupon_code, is_active)
         self.set_active_stripe_promotion_code(coupon_code, is_active)
 
         return coupon_code
 
+    ################
+    # Bulk Sync
+    def sync_to_stripe(self, **options):
+        '''
+        Creates the Stripe coupons and promotion codes of the site's campaigns and
+        coupon codes that have none, and updates the ones that changed since they
+        were synced. Returns a SyncSummary, see StripeSync.
+        '''
+        return StripeSync(self, **options).run()
+
+    def reconcile_with_stripe(self, report=None, **options):
+        '''
+        Compares the site's Stripe coupons and promotion codes with the campaigns and
+        coupon codes, calling report(drift) with each difference, and repairs them if
+        repair is given. Returns a ReconcileSummary, see StripeReconciliation.
+        '''
+        return StripeReconciliation(self, **options).run(report)
+
     ################
     # Processor Functions
-    def is_code_valid(self, coupon_code):
+    def is_code_valid(self, coupon_code, invoice=None):
         if 'stripe_id' not in coupon_code.meta:
             return False
         
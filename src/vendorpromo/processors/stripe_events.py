@@ -0,0 +1,208 @@
+"""
+Redemptions made in Stripe applied to the Stripe redemption counters.
+
+The webhook stores each promotion_code.*, coupon.* and invoice.paid event of
+a site once, keyed by its Stripe event id, so the events Stripe sends again
+are dropped. apply_events() then claims the pending events in batches and
+applies each batch in one transaction: the events' redemptions are added up
+per Coupon Code and Promotional Campaign first, and each row gets a single
+UPDATE of its stripe_redemption_count.
+
+stripe_redemption_count is kept apart from redemption_count, which counts
+the redemptions reserved at checkout and is rebuilt from the invoices by
+reconcile_promo_redemptions. A Promotion Code or Coupon event carries
+Stripe's times_redeemed, the count moves up to it, so the first event brings
+in the redemptions made before and an event received late or twice changes
+nothing. A paid invoice adds one redemption for each of its discounts, which
+a later Promotion Code or Coupon event with the same times_redeemed does not
+add again.
+"""
+import datetime
+from collections import namedtuple
+
+import stripe
+from django.db import transaction
+from django.utils import timezone
+
+from vendorpromo.config import (VENDOR_PROMO_STRIPE_EVENTS_BATCH_SIZE,
+                                VENDOR_PROMO_STRIPE_WEBHOOK_SECRET)
+from vendorpromo.models import CouponCode, PromotionalCampaign, StripeEvent
+from vendorpromo.processors.stripe_sync import COUPON, PROMOTION_CODE
+
+INVOICE_PAID = 'invoice.paid'
+
+# Invoices of a subscription's later periods keep its discount, Stripe only redeems it once
+RENEWAL_BILLING_REASONS = ('subscription_cycle', 'subscription_threshold', 'subscription_update')
+
+ApplySummary = namedtuple('ApplySummary', ['events', 'coupon_codes', 'campaigns'])
+
+
+def is_handled_event(event_type):
+    return event_type == INVOICE_PAID or event_type.split('.', 1)[0] in (COUPON, PROMOTION_CODE)
+
+
+def get_webhook_secret(site):
+    if isinstance(VENDOR_PROMO_STRIPE_WEBHOOK_SECRET, dict):
+        return VENDOR_PROMO_STRIPE_WEBHOOK_SECRET.get(site.pk)
+
+    return VENDOR_PROMO_STRIPE_WEBHOOK_SECRET
+
+
+def construct_event(payload, signature, site):
+    """
+    Returns the stripe.Event of the payload. Raises
+    stripe.error.SignatureVerificationError if the signature header does not
+    match the site's webhook secret and ValueError if there is no secret or
+    the payload is not an event.
+    """
+    secret = get_webhook_secret(site)
+
+    if not secret:
+        raise ValueError(f"There is no Stripe webhook secret for site {site.pk}")
+
+    return stripe.Webhook.construct_event(payload, signature, secret)
+
+
+def record_event(site, event):
+    """
+    Stores the event and returns it, or None if it was already received.
+    """
+    stripe_event, created = StripeEvent.objects.get_or_create(event_id=event['id'], defaults={
+        'site': site,
+        'type': event['type'],
+        'data': event['data']['object'].to_dict_recursive(),
+        'stripe_created': datetime.datetime.fromtimestamp(event['created'], tz=timezone.utc),
+    })
+
+    return stripe_event if created else None
+
+
+def get_id(value):
+    # Expandable fields are the object's id or the object itself
+    return value.get('id') if isinstance(value, dict) else value
+
+
+def get_invoice_discounts(invoice):
+    if invoice.get('billing_reason') in RENEWAL_BILLING_REASONS:
+        return []
+
+    discounts = {}
+
+    for discount in [invoice.get('discount')] + list(invoice.get('discounts') or []):
+        if isinstance(discount, dict):
+            discounts[discount.get('id')] = discount
+
+    return list(discounts.values())
+
+
+class RedemptionTally(object):
+    """
+    Redemptions of a batch added up per row of the model, keyed by the site
+    and Stripe id of the rows.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.stripe_ids = set()
+        self.changes = []
+
+    def add(self, site_id, stripe_id, times_redeemed):
+        if stripe_id:
+            self.stripe_ids.add(stripe_id)
+            self.changes.append((site_id, stripe_id, times_redeemed))
+
+    def observe(self, site_id, stripe_id, times_redeemed):
+        """
+        Moves the count up to Stripe's times_redeemed.
+        """
+        if times_redeemed is not None:
+            self.add(site_id, stripe_id, times_redeemed)
+
+    def redeem(self, site_id, stripe_id):
+        """
+        Adds one redemption.
+        """
+        self.add(site_id, stripe_id, None)
+
+    def apply(self):
+        """
+        Locks the rows, sets their Stripe redemption counts and returns the
+        number of rows updated.
+        """
+        if not self.changes:
+            return 0
+
+        rows = {
+            (instance.site_id, instance.meta['stripe_id']): instance
+            for instance in self.model.objects.select_for_update().filter(meta__stripe_id__in=self.stripe_ids)
+        }
+        counts = {}
+
+        for site_id, stripe_id, times_redeemed in self.changes:
+            instance = rows.get((site_id, stripe_id))
+
+            if instance is None:
+                continue
+
+            count = counts.get(instance.pk, instance.stripe_redemption_count)
+            counts[instance.pk] = count + 1 if times_redeemed is None else max(count, times_redeemed)
+
+        for pk, count in counts.items():
+            # update() leaves updated alone, so the bulk sync does not push the rows again
+            self.model.objects.filter(pk=pk).update(stripe_redemption_count=count)
+
+        return len(counts)
+
+
+def apply_batch(batch_size, site=None):
+    """
+    Applies the next pending events in one transaction and returns their
+    ApplySummary. Events claimed by another worker are skipped.
+    """
+    promotion_codes, coupons = RedemptionTally(CouponCode), RedemptionTally(PromotionalCampaign)
+
+    with transaction.atomic():
+        events = StripeEvent.objects.select_for_update(skip_locked=True).filter(applied__isnull=True)
+
+        if site is not None:
+            events = events.filter(site=site)
+
+        events = list(events.order_by('stripe_created', 'pk')[:batch_size])
+
+        for event in events:
+            if event.type == INVOICE_PAID:
+                for discount in get_invoice_discounts(event.data):
+                    promotion_codes.redeem(event.site_id, get_id(discount.get('promotion_code')))
+                    coupons.redeem(event.site_id, get_id(discount.get('coupon')))
+            elif event.type.startswith(f"{PROMOTION_CODE}."):
+                promotion_codes.observe(event.site_id, event.data.get('id'), event.data.get('times_redeemed'))
+            elif event.type.startswith(f"{COUPON}."):
+                coupons.observe(event.site_id, event.data.get('id'), event.data.get('times_redeemed'))
+
+        summary = ApplySummary(len(events), promotion_codes.apply(), coupons.apply())
+        StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(applied=timezone.now())
+
+    return summary
+
+
+def apply_events(site=None, batch_size=None, max_batches=None):
+    """
+    Applies the pending events, batch by batch, until there are none left or
+    max_batches were applied. Returns the ApplySummary of all of them.
+    """
+    batch_size = batch_size or VENDOR_PROMO_STRIPE_EVENTS_BATCH_SIZE
+    events, coupon_codes, campaigns = 0, 0, 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        summary = apply_batch(batch_size, site)
+
+        if not summary.events:
+            break
+
+        events += summary.events
+        coupon_codes += summary.coupon_codes
+        campaigns += summary.campaigns
+        batches += 1
+
+    return ApplySummary(events, coupon_codes, campaigns)
@@ -0,0 +1,254 @@
+"""
+Reconciliation of a site's Promotional Campaigns and Coupon Codes with their
+Stripe Coupons and Promotion Codes.
+
+The Stripe objects are streamed with the list calls' auto-pagination and
+compared in chunks of chunk_size with the local rows that have their
+meta['stripe_id'], so only a chunk of objects and rows is in memory at a
+time, plus the ids of the Stripe objects seen. Each difference is a Drift:
+a field whose values differ, a Stripe object of the site without a local
+row, or a local row whose Stripe object is gone.
+
+With repair=REPAIR_LOCAL the local fields are set to Stripe's values and
+rows whose Stripe object is gone lose their Stripe id, so the bulk sync
+creates it again. With repair=REPAIR_STRIPE the fields Stripe lets us
+change are set to the local values. Stripe's times_redeemed is compared with
+the stripe_redemption_count the webhook keeps, redemption_count is rebuilt
+from the invoices by reconcile_promo_redemptions.
+"""
+import datetime
+from collections import namedtuple
+
+import stripe
+from django.db import transaction
+from django.utils import timezone
+
+from vendorpromo.campaign_index import campaign_index
+from vendorpromo.config import (VENDOR_PROMO_PROCESSOR_RATE_LIMIT,
+                                VENDOR_PROMO_STRIPE_RATE_LIMIT)
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.http_sessions import RateLimiter
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.processors.stripe_sync import COUPON, PROMOTION_CODE
+
+DEFAULT_CHUNK_SIZE = 1000
+PAGE_SIZE = 100  # The most Stripe returns per list call
+
+REPAIR_LOCAL, REPAIR_STRIPE = 'local', 'stripe'
+
+# Fields that differ, Stripe objects of the site without a local row and local rows without a Stripe object
+FIELD, MISSING_LOCAL, MISSING_STRIPE = 'field', 'missing_local', 'missing_stripe'
+
+# Local field and Stripe field compared for each kind of object
+COMPARED_FIELDS = {
+    COUPON: (
+        ('max_redemptions', 'max_redemptions'),
+        ('end_date', 'redeem_by'),
+        ('stripe_redemption_count', 'times_redeemed'),
+    ),
+    PROMOTION_CODE: (
+        ('active', 'active'),
+        ('max_redemptions', 'max_redemptions'),
+        ('end_date', 'expires_at'),
+        ('stripe_redemption_count', 'times_redeemed'),
+    ),
+}
+
+# Stripe fields that can be changed after the object is created
+STRIPE_UPDATABLE_FIELDS = {
+    COUPON: (),
+    PROMOTION_CODE: ('active',),
+}
+
+# Local fields set to Stripe's values by REPAIR_LOCAL
+LOCAL_REPAIRABLE_FIELDS = {
+    COUPON: ('max_redemptions', 'end_date', 'stripe_redemption_count'),
+    PROMOTION_CODE: ('active', 'max_redemptions', 'end_date', 'stripe_redemption_count'),
+}
+
+Drift = namedtuple('Drift', ['kind', 'type', 'stripe_id', 'pk', 'field', 'local', 'stripe', 'repaired'])
+ReconcileSummary = namedtuple('ReconcileSummary', ['checked', 'drift', 'repaired'])
+
+
+def to_stripe_value(value):
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+
+    return value
+
+
+def to_local_value(field, value):
+    if field == 'end_date' and value is not None:
+        return datetime.datetime.fromtimestamp(value, tz=timezone.utc)
+
+    return value
+
+
+def refresh_repaired(kind, site_id, pks):
+    """
+    Recompiles the checkout tables for the rows repaired with bulk_update,
+    which does not send the post_save signals that usually do it.
+    """
+    if kind == COUPON:
+        coupon_table.refresh_campaigns(site_id, pks)
+        campaign_index.refresh_campaigns(site_id, pks)
+    else:
+        coupon_table.refresh_coupon_codes(site_id, pks)
+
+
+class StripeReconciliation(object):
+    """
+    Compares the Stripe objects of a StripePromoProcessor's site with the
+    local rows. iter_drift() yields each Drift as it is found, run() goes
+    through all of them and returns a ReconcileSummary.
+    """
+
+    def __init__(self, processor, repair=None, chunk_size=DEFAULT_CHUNK_SIZE, rate_limit=None):
+        if repair not in (None, REPAIR_LOCAL, REPAIR_STRIPE):
+            raise ValueError(f"repair must be {REPAIR_LOCAL} or {REPAIR_STRIPE}")
+
+        self.processor = processor
+        self.repair = repair
+        self.chunk_size = chunk_size
+        self.rate_limiter = RateLimiter(rate_limit if rate_limit is not None else VENDOR_PROMO_PROCESSOR_RATE_LIMIT or VENDOR_PROMO_STRIPE_RATE_LIMIT)
+        self.checked = 0
+        self.repaired = 0
+
+    def get_kinds(self):
+        return (
+            (COUPON, stripe.Coupon, PromotionalCampaign.objects.filter(site=self.processor.site)),
+            (PROMOTION_CODE, stripe.PromotionCode, CouponCode.objects.filter(site=self.processor.site)),
+        )
+
+    def iter_stripe_chunks(self, stripe_class):
+        chunk = []
+
+        for stripe_object in stripe_class.list(limit=PAGE_SIZE, api_key=self.processor.api_key).auto_paging_iter():
+            chunk.append(stripe_object)
+
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def is_site_object(self, stripe_object):
+        return (stripe_object.get('metadata') or {}).get('site') == str(self.processor.site)
+
+    def compare(self, kind, stripe_object, instance):
+        """
+        Returns the Drift of each compared field whose values differ.
+        """
+        return [
+            Drift(kind, FIELD, stripe_object.id, instance.pk, field, getattr(instance, field), stripe_object.get(stripe_field), False)
+            for field, stripe_field in COMPARED_FIELDS[kind]
+            if to_stripe_value(getattr(instance, field)) != stripe_object.get(stripe_field)
+        ]
+
+    def repair_fields(self, kind, stripe_class, instance, drift):
+        """
+        Repairs the field drift of the instance and returns it with repaired
+        set on the ones that were.
+        """
+        if self.repair == REPAIR_LOCAL:
+            fields = [item.field for item in drift if item.field in LOCAL_REPAIRABLE_FIELDS[kind]]
+
+            for item in drift:
+                if item.field in fields:
+                    setattr(instance, item.field, to_local_value(item.field, item.stripe))
+        else:
+            fields = [item.field for item in drift if item.field in STRIPE_UPDATABLE_FIELDS[kind]]
+
+            if fields:
+                self.rate_limiter.wait()
+
+                try:
+                    stripe_class.modify(drift[0].stripe_id, api_key=self.processor.api_key, **{field: to_stripe_value(getattr(instance, field)) for field in fields})
+                except stripe.error.StripeError:
+                    fields = []
+
+        self.repaired += len(fields)
+
+        return [item._replace(repaired=item.field in fields) for item in drift]
+
+    def reconcile_chunk(self, kind, stripe_class, queryset, chunk):
+        instances = {(instance.meta or {}).get('stripe_id'): instance for instance in queryset.filter(meta__stripe_id__in=[stripe_object.id for stripe_object in chunk])}
+        repaired_instances = []
+
+        for stripe_object in chunk:
+            instance = instances.get(stripe_object.id)
+
+            if instance is None:
+                if self.is_site_object(stripe_object):
+                    yield Drift(kind, MISSING_LOCAL, stripe_object.id, None, None, None, None, False)
+                continue
+
+            self.checked += 1
+            drift = self.compare(kind, stripe_object, instance)
+
+            if drift and self.repair:
+                drift = self.repair_fields(kind, stripe_class, instance, drift)
+
+                if self.repair == REPAIR_LOCAL and any(item.repaired for item in drift):
+                    repaired_instances.append(instance)
+
+            yield from drift
+
+        if repaired_instances:
+            # bulk_update leaves updated alone, so the bulk sync does not push the repaired rows back
+            queryset.model.objects.bulk_update(repaired_instances, LOCAL_REPAIRABLE_FIELDS[kind])
+            site_id, pks = self.processor.site.pk, [instance.pk for instance in repaired_instances]
+            transaction.on_commit(lambda: refresh_repaired(kind, site_id, pks))
+
+    def iter_missing_stripe(self, kind, queryset, seen):
+        """
+        Yields the Drift of the local rows whose Stripe id was not listed.
+        """
+        last_pk = 0
+
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk, meta__has_key='stripe_id').order_by('pk')[:self.chunk_size])
+
+            if not chunk:
+                break
+
+            missing = [instance for instance in chunk if instance.meta['stripe_id'] not in seen]
+
+            for instance in missing:
+                stripe_id = instance.meta['stripe_id']
+
+                if self.repair == REPAIR_LOCAL:
+                    instance.meta = {key: value for key, value in instance.meta.items() if key not in ('stripe_id', 'stripe_synced')}
+
+                yield Drift(kind, MISSING_STRIPE, stripe_id, instance.pk, None, None, None, self.repair == REPAIR_LOCAL)
+
+            if missing and self.repair == REPAIR_LOCAL:
+                queryset.model.objects.bulk_update(missing, ['meta'])
+                self.repaired += len(missing)
+
+            last_pk = chunk[-1].pk
+
+    def iter_drift(self):
+        for kind, stripe_class, queryset in self.get_kinds():
+            seen = set()
+
+            for chunk in self.iter_stripe_chunks(stripe_class):
+                seen.update(stripe_object.id for stripe_object in chunk)
+                yield from self.reconcile_chunk(kind, stripe_class, queryset, chunk)
+
+            yield from self.iter_missing_stripe(kind, queryset, seen)
+
+    def run(self, report=None):
+        """
+        Reconciles every object and calls report(drift) with each Drift found.
+        """
+        drift_count = 0
+
+        for drift in self.iter_drift():
+            drift_count += 1
+
+            if report:
+                report(drift)
+
+        return ReconcileSummary(self.checked, drift_count, self.repaired)
@@ -0,0 +1,217 @@
+"""
+Bulk sync of a site's Promotional Campaigns and Coupon Codes to Stripe.
+
+A campaign without meta['stripe_id'] is created as a Stripe Coupon, and one
+that changed since its last sync, meta['stripe_synced'], is updated. Coupon
+Codes are synced to Promotion Codes the same way, after the campaigns so new
+codes have their coupon. Rows are read in pk chunks and the calls of a chunk
+are made by up to max_workers threads, spaced out by a RateLimiter, with
+rate limited and connection failures retried with exponential backoff.
+
+The Stripe ids of each chunk are stored before the next chunk is pushed, so
+an interrupted sync resumes by running it again. Each call's idempotency key
+comes from the row, and for updates its version, so a call repeated after an
+interruption gets Stripe's first answer instead of creating a duplicate.
+The calls pass the processor's API key, since other sites' processors
+change the stripe module's key.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+
+from vendorpromo.config import (VENDOR_PROMO_PROCESSOR_MAX_WORKERS,
+                                VENDOR_PROMO_PROCESSOR_RATE_LIMIT,
+                                VENDOR_PROMO_PROCESSOR_RETRIES,
+                                VENDOR_PROMO_STRIPE_RATE_LIMIT)
+from vendorpromo.http_sessions import RateLimiter
+from vendorpromo.models import CouponCode, PromotionalCampaign
+
+DEFAULT_CHUNK_SIZE = 100
+BACKOFF = 0.5  # Seconds before the first retry, doubled on each one after
+
+# Errors worth retrying, Stripe answered 429 or 5xx or could not be reached
+TRANSIENT_ERRORS = (stripe.error.RateLimitError, stripe.error.APIConnectionError, stripe.error.APIError)
+
+COUPON, PROMOTION_CODE = 'coupon', 'promotion_code'
+CREATE, UPDATE = 'create', 'update'
+
+SyncChange = namedtuple('SyncChange', ['kind', 'action', 'pk', 'name'])
+SyncFailure = namedtuple('SyncFailure', ['kind', 'pk', 'error'])
+SyncSummary = namedtuple('SyncSummary', ['created', 'updated', 'failed', 'retries', 'seconds'])
+
+
+def get_version(instance):
+    return instance.updated.isoformat()
+
+
+def get_action(instance):
+    """
+    Returns what the sync has to do with the instance in Stripe, or None if
+    it is up to date.
+    """
+    meta = instance.meta or {}
+
+    if not meta.get('stripe_id'):
+        return CREATE
+
+    if meta.get('stripe_synced') != get_version(instance):
+        return UPDATE
+
+    return None
+
+
+class StripeSync(object):
+    """
+    Creates and updates the Stripe objects of a StripePromoProcessor's site.
+    progress(created, updated, failed) is called after each chunk.
+    """
+
+    def __init__(self, processor, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None, rate_limit=None, retries=None, progress=None, backoff=BACKOFF):
+        self.processor = processor
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers or VENDOR_PROMO_PROCESSOR_MAX_WORKERS
+        self.rate_limiter = RateLimiter(rate_limit if rate_limit is not None else VENDOR_PROMO_PROCESSOR_RATE_LIMIT or VENDOR_PROMO_STRIPE_RATE_LIMIT)
+        self.retries = VENDOR_PROMO_PROCESSOR_RETRIES if retries is None else retries
+        self.progress = progress
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.retried = 0
+
+    def get_querysets(self):
+        return (
+            (COUPON, PromotionalCampaign.objects.filter(site=self.processor.site).select_related('applies_to')),
+            (PROMOTION_CODE, CouponCode.objects.filter(promo__site=self.processor.site).select_related('promo')),
+        )
+
+    def iter_chunks(self, queryset):
+        last_pk = 0
+
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:self.chunk_size])
+
+            if not chunk:
+                break
+
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def diff(self):
+        """
+        Returns the SyncChanges a run would make, without calling Stripe.
+        """
+        changes = []
+
+        for kind, queryset in self.get_querysets():
+            for chunk in self.iter_chunks(queryset):
+                for instance in chunk:
+                    action = get_action(instance)
+
+                    if action:
+                        changes.append(SyncChange(kind, action, instance.pk, str(instance)))
+
+        return changes
+
+    def get_call(self, kind, action, instance):
+        """
+        Returns the Stripe call for the change as the function and its kwargs.
+        Raises ValueError if the instance can not be synced yet.
+        """
+        key = f"vendorpromo-{kind}-{instance.uuid}-{action}"
+        api_key = self.processor.api_key
+
+        if kind == COUPON and action == CREATE:
+            return stripe.Coupon.create, {**self.processor.build_coupon(instance), 'idempotency_key': key, 'api_key': api_key}
+
+        if kind == COUPON:
+            return stripe.Coupon.modify, {**self.processor.build_coupon_update(instance), 'sid': instance.meta['stripe_id'], 'idempotency_key': f"{key}-{get_version(instance)}", 'api_key': api_key}
+
+        if not (instance.promo.meta or {}).get('stripe_id'):
+            raise ValueError(f"The Stripe coupon of {instance.promo} was not created")
+
+        if action == CREATE:
+            return stripe.PromotionCode.create, {**self.processor.build_promotion_code(instance), 'idempotency_key': key, 'api_key': api_key}
+
+        return stripe.PromotionCode.modify, {**self.processor.build_promotion_code_update(instance), 'sid': instance.meta['stripe_id'], 'idempotency_key': f"{key}-{get_version(instance)}", 'api_key': api_key}
+
+    def push(self, call):
+        """
+        Makes the call, retrying transient failures, and returns the Stripe
+        object and the error if it failed.
+        """
+        function, kwargs = call
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            self.rate_limiter.wait()
+
+            try:
+                return function(**kwargs), None
+            except TRANSIENT_ERRORS as error:
+                if attempt == self.retries:
+                    return None, str(error)
+            except stripe.error.StripeError as error:
+                return None, str(error)
+
+    def sync_chunk(self, kind, chunk, executor):
+        """
+        Pushes the changes of the chunk and stores the Stripe ids. Returns the
+        created and updated counts and the failures.
+        """
+        changes, calls, failed = [], [], []
+
+        for instance in chunk:
+            action = get_action(instance)
+
+            if not action:
+                continue
+
+            try:
+                calls.append(self.get_call(kind, action, instance))
+            except ValueError as error:
+                failed.append(SyncFailure(kind, instance.pk, str(error)))
+                continue
+
+            changes.append((instance, action))
+
+        counts = {CREATE: 0, UPDATE: 0}
+        synced = []
+
+        for (instance, action), (stripe_object, error) in zip(changes, executor.map(self.push, calls)):
+            if error:
+                failed.append(SyncFailure(kind, instance.pk, error))
+                continue
+
+            instance.meta = {**(instance.meta or {}), 'stripe_id': stripe_object.id, 'stripe_synced': get_version(instance)}
+            synced.append(instance)
+            counts[action] += 1
+
+        if synced:
+            # bulk_update leaves updated alone, so the rows stay at the version that was synced
+            synced[0].__class__.objects.bulk_update(synced, ['meta'])
+
+        return counts[CREATE], counts[UPDATE], failed
+
+    def run(self):
+        start_time = time.perf_counter()
+        created, updated = 0, 0
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for kind, queryset in self.get_querysets():
+                for chunk in self.iter_chunks(queryset):
+                    chunk_created, chunk_updated, chunk_failed = self.sync_chunk(kind, chunk, executor)
+                    created += chunk_created
+                    updated += chunk_updated
+                    failed.extend(chunk_failed)
+
+                    if self.progress:
+                        self.progress(created, updated, len(failed))
+
+        return SyncSummary(created, updated, failed, self.retried, time.perf_counter() - start_time)
@@ -1,12 +1,90 @@
-import requests
 import json
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
 from django.utils.translation import gettext_lazy as _
+from vendor.models import Offer
 
-from vendorpromo.config import VENDOR_PROMO_PROCESSOR_URL, VENDOR_PROMO_PROCESSOR_BARRER_KEY
+from vendorpromo.config import VENDOR_PROMO_PROCESSOR_URL, VENDOR_PROMO_PROCESSOR_BARRER_KEY, VENDOR_PROMO_PROCESSOR_PAGE_SIZE, VENDOR_PROMO_PROCESSOR_OUTBOX
+from vendorpromo.fallback import UNAVAILABLE_ERRORS
+from vendorpromo.http_sessions import httpx, request
 from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.models import ValidationKind
+from vendorpromo.outbox import OutboxError, enqueue
 from vendorpromo.processors.base import PromoProcessorBase
+from vendorpromo.processors.vouchery_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+VoucheryResponse = namedtuple('VoucheryResponse', ['status_code', 'content', 'is_success', 'message', 'error'])
+
+# Key of the Offer.meta entry with the offer's resolved Vouchery campaign tree
+CAMPAIGN_TREE_META_KEY = 'vouchery'
+
+
+def is_available(status_code):
+    """
+    Whether a response with the status code counts as a successful call for
+    the circuit breaker. Client errors like an unknown code are answers too.
+    """
+    return status_code < 500 and status_code != 429
+
+
+def parse_response(status_code, body):
+    """
+    Returns the VoucheryResponse for a Vouchery API response, with the same
+    rules process_response() applies to the processor's attributes.
+    """
+    if body in (b'[]', b'') and 200 <= status_code < 300:
+        return VoucheryResponse(status_code, None, True, None, None)
+
+    content = json.loads(body)
+
+    if isinstance(content, list):
+        return VoucheryResponse(status_code, content, status_code == 200, None, None)
+
+    if content.get('type') == "Error":
+        error = content.get("error") if "error" in content else content.get("errors")
+        return VoucheryResponse(status_code, content, False, content.get('message'), error)
+
+    return VoucheryResponse(status_code, content, True, content.get('message'), None)
+
+
+class VoucheryError(Exception):
+    """
+    Raised by the iterators when a page of a Vouchery list can not be
+    fetched. The failed VoucheryResponse is kept in result.
+    """
+    def __init__(self, result):
+        super().__init__(f"Vouchery request failed with status {result.status_code}: {result.message or result.error}")
+        self.result = result
+
+
+class LastResponseAttribute(object):
+    """
+    Compatibility shim for the processor attributes that hold the last
+    response. Values are kept per thread, so threads sharing a processor do
+    not see each other's responses. New code should use the VoucheryResponse
+    returned by each call instead.
+    """
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(instance._last_response, self.name, self.default)
+
+    def __set__(self, instance, value):
+        setattr(instance._last_response, self.name, value)
 
 
 class VoucheryProcessor(PromoProcessorBase):
@@ -26,6 +104,18 @@ class VoucheryProcessor(PromoProcessorBase):
             ]
         },
     ]
+
+    Every API call returns an immutable VoucheryResponse. The response,
+    response_content, response_message, response_error and is_request_success
+    attributes are still set for existing callers, per thread, so a processor
+    can be shared between threads.
+
+    The iter_* methods page through the list endpoints lazily instead of
+    loading the whole list in one response.
+
+    Read calls other than get_redeem, which checks a checkout's redemption,
+    go through the response_cache, and write calls invalidate the resources
+    they change.
     """
     BASE_URL = None
     BARRER_KEY = None
@@ -33,6 +123,7 @@ class VoucheryProcessor(PromoProcessorBase):
     REWARDS_URL = 'rewards'
     VOUCHER_URL = 'vouchers'
     REDEMPTION_URL = 'redemptions'
+    PAGE_SIZE = VENDOR_PROMO_PROCESSOR_PAGE_SIZE
 
     CAMPAIGN_PARAMS = {
         "type": "MainCampaign",
@@ -46,14 +137,28 @@ class VoucheryProcessor(PromoProcessorBase):
         "triggers_on": "redemption",
         "status": "active"
     }
+    VOUCHER_PARAMS = {
+        "type": "Voucher",
+        "active": True,
+        "status": "active"
+    }
     REWARD_PARAMS = {
         "type": "SetDiscount",
         "discount_type": "percentage",
         "discount_value": 0  # The actual discount is set in the Offer instance.
     }
     credentials = None
+    response_cache = ResponseCache()
+    breaker_name = 'vouchery'
+
+    response = LastResponseAttribute()
+    response_content = LastResponseAttribute()
+    response_error = LastResponseAttribute()
+    response_message = LastResponseAttribute()
+    is_request_success = LastResponseAttribute(False)
 
     def __init__(self, site, invoice=None):
+        self._last_response = threading.local()
         super().__init__(site, invoice)
         self.set_credentials(site)
 
@@ -81,75 +186,188 @@ class VoucheryProcessor(PromoProcessorBase):
         After creation, a user can login to Vouchery and change the campaigns, and
         sub-campaigns name if desired. They should not change the promo code as it
         needs to be sent from vendor-promo
+        The resolved campaign tree is kept in the offer's meta, so the next promo
+        for the offer only needs the create_voucher call. The kept tree is checked
+        against Vouchery in the background after the promo is saved.
         '''
         promo = promo_form.save(commit=False)
         promo.campaign_name = promo.offer.site.name
 
-        self.get_campaigns(**{'name_cont': promo.campaign_name})
-        self.process_response()
+        campaign_tree = self.get_offer_campaign_tree(promo.offer)
+        resolved = campaign_tree is None
 
-        if not self.is_request_success:
-            raise Exception(f"Create Promo Automate Failed: errors: {self.response_error}")
-        
-        self.is_request_success = False # Reset response flag
+        if resolved:
+            campaign_tree = self.resolve_campaign_tree(promo)
+
+        result = self.create_voucher(promo.code, campaign_tree['sub_campaign_id'])
+
+        # The kept sub-campaign was deleted in Vouchery since it was resolved
+        if not result.is_success and result.status_code == 404 and not resolved:
+            resolved = True
+            campaign_tree = self.resolve_campaign_tree(promo)
+            result = self.create_voucher(promo.code, campaign_tree['sub_campaign_id'])
+
+        if not result.is_success:
+            raise Exception(_("Create Voucher Failed"))
+
+        promo.campaign_id = campaign_tree['campaign_id']
+        promo.save()
+
+        if resolved:
+            self.set_offer_campaign_tree(promo.offer, campaign_tree)
+        else:
+            transaction.on_commit(lambda: self.verify_offer_campaign_tree_in_background(promo.offer, campaign_tree))
+
+    def resolve_campaign_tree(self, promo):
+        '''
+        Finds or creates the main campaign, sub-campaign and reward for the promo's
+        offer and returns their ids.
+        '''
+        result = self.get_campaigns(**{'name_cont': promo.campaign_name})
+
+        if not result.is_success:
+            raise Exception(f"Create Promo Automate Failed: errors: {result.error}")
 
         # Checks if the Main Campaign already exists
-        if not self.response_content:
-            self.create_campaign(promo.campaign_name, **self.CAMPAIGN_PARAMS)
-            if not self.is_request_success:
+        if not result.content:
+            result = self.create_campaign(promo.campaign_name, **self.CAMPAIGN_PARAMS)
+            if not result.is_success:
                 raise Exception(_("Create Campaing Failed"))
-            promo.campaign_id = str(self.response_content['id'])
+            campaign_id = str(result.content['id'])
         else:
-            promo.campaign_id = str(self.response_content[0]['id'])
+            campaign_id = str(result.content[0]['id'])
 
-        self.clear_response_variables()
-        self.get_sub_campaigns(**{'name_cont': promo.offer.name})
+        result = self.get_sub_campaigns(**{'name_cont': promo.offer.name})
 
         # Checks if a SubCampaign already exists.
-        if not self.response_content:
-            self.SUBCAMPAIGN_PARAMS['parent_id'] = promo.campaign_id
-            self.clear_response_variables()
-            self.create_campaign(promo.offer.name, **self.SUBCAMPAIGN_PARAMS)
-            del(self.SUBCAMPAIGN_PARAMS['parent_id'])
-            if not self.is_request_success:
+        if not result.content:
+            result = self.create_campaign(promo.offer.name, **{**self.SUBCAMPAIGN_PARAMS, 'parent_id': campaign_id})
+            if not result.is_success:
                 raise Exception(_("Create Sub-Campaing Failed"))
-            subcampaign_id = str(self.response_content['id'])
-            parent_id = str(self.response_content['parent_id'])
+            subcampaign_id = str(result.content['id'])
+            parent_id = str(result.content['parent_id'])
         else:
-            parent_id = str(self.response_content[0]['parent_id'])
-            subcampaign_id = str(self.response_content[0]['id'])
+            parent_id = str(result.content[0]['parent_id'])
+            subcampaign_id = str(result.content[0]['id'])
 
         # Check that the SubCampaign is has the correct MainCampaing (Parent Campaign)
-        if parent_id != promo.campaign_id:
-            self.update_campaign(self.response_content[0]['id'], **{'parent_id': promo.campaign_id})
-
-        self.get_campaign(subcampaign_id)
-        if not self.response_content.get('rewards'):
-            self.clear_response_variables()
-            self.create_reward(subcampaign_id, **self.REWARD_PARAMS)
-            if not self.is_request_success:
+        if parent_id != campaign_id:
+            self.update_campaign(subcampaign_id, **{'parent_id': campaign_id})
+
+        result = self.get_campaign(subcampaign_id)
+        rewards = result.content.get('rewards')
+        if not rewards:
+            result = self.create_reward(subcampaign_id, **self.REWARD_PARAMS)
+            if not result.is_success:
                 raise Exception(_("Create Reward Failed"))
+            reward_id = str(result.content['id'])
+        else:
+            reward_id = str(rewards[0]['id'])
 
-        self.clear_response_variables()
-        self.create_voucher(promo.code, subcampaign_id)
+        return {'client_url': self.BASE_URL, 'campaign_id': campaign_id, 'sub_campaign_id': subcampaign_id, 'reward_id': reward_id}
 
-        if not self.is_request_success:
-            raise Exception(_("Create Voucher Failed"))
+    def get_offer_campaign_tree(self, offer):
+        '''
+        Returns the campaign tree kept in the offer's meta if it was resolved
+        with the current Vouchery account.
+        '''
+        campaign_tree = (offer.meta or {}).get(CAMPAIGN_TREE_META_KEY)
 
-        promo.save()
+        if not campaign_tree or campaign_tree.get('client_url') != self.BASE_URL:
+            return None
+
+        return campaign_tree
+
+    def set_offer_campaign_tree(self, offer, campaign_tree):
+        '''
+        Keeps the campaign tree in the offer's meta, or removes it if None.
+        Only the meta entry is written, so it does not overwrite other changes
+        to the offer.
+        '''
+        with transaction.atomic():
+            meta = Offer.objects.select_for_update().values_list('meta', flat=True).get(pk=offer.pk) or {}
+
+            if campaign_tree is None:
+                meta.pop(CAMPAIGN_TREE_META_KEY, None)
+            else:
+                meta[CAMPAIGN_TREE_META_KEY] = campaign_tree
+
+            Offer.objects.filter(pk=offer.pk).update(meta=meta)
+
+        offer.meta = meta
+
+    def verify_offer_campaign_tree(self, offer, campaign_tree):
+        '''
+        Checks the kept campaign tree against Vouchery, bypassing the response
+        cache, and forgets it if the sub-campaign is gone, has another parent or
+        lost the reward. Returns whether the tree is still valid.
+        '''
+        result = self.call("GET", self.assemble_url([self.CAMPAIGN_URL, str(campaign_tree['sub_campaign_id'])]))
+
+        if not result.is_success and result.status_code != 404:
+            return True  # Can not tell, the next check will
+
+        valid = (
+            result.is_success
+            and str(result.content.get('parent_id')) == campaign_tree['campaign_id']
+            and campaign_tree['reward_id'] in [str(reward['id']) for reward in result.content.get('rewards') or []]
+        )
+
+        if not valid:
+            logger.warning(f"VoucheryProcessor: the Vouchery campaigns of offer {offer.pk} changed, they will be resolved again")
+            self.set_offer_campaign_tree(offer, None)
+
+        return valid
+
+    def verify_offer_campaign_tree_in_background(self, offer, campaign_tree):
+        def run():
+            try:
+                self.verify_offer_campaign_tree(offer, campaign_tree)
+            except Exception as error:
+                logger.error(f"VoucheryProcessor.verify_offer_campaign_tree: {error}")
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
 
     def create_promo(self, promo_form):
         '''
         Before saving the promo model instance form the form it calls
         Vouchery.io API to create it and checks if it was successful. If
-        it was it will save the promo instance record.
+        it was it will save the promo instance record. With
+        VENDOR_PROMO_PROCESSOR_OUTBOX on it is saved right away and the
+        voucher is created by the outbox.
         '''
         promo = promo_form.save(commit=False)
-        self.create_voucher(promo.code, promo.campaign_id)
-        if not self.is_request_success:
+
+        if VENDOR_PROMO_PROCESSOR_OUTBOX:
+            with transaction.atomic():
+                promo.save()
+                enqueue(self, 'send_voucher', promo)
+
+            return promo
+
+        if not self.create_voucher(promo.code, promo.campaign_id).is_success:
             return None
         promo.save()
 
+    def send_voucher(self, promo, idempotency_key=None):
+        """
+        Outbox action of create_promo. Vouchery has no idempotency keys, a
+        voucher that already exists is taken as created by an earlier attempt.
+        """
+        from vendorpromo.processors.vouchery_batch import TRANSIENT_STATUS_CODES  # The batch jobs import this module
+        from vendorpromo.processors.vouchery_export import ALREADY_EXISTS_STATUS_CODES
+
+        result = self.create_voucher(promo.code, promo.campaign_id)
+
+        if not result.is_success and result.status_code not in ALREADY_EXISTS_STATUS_CODES:
+            raise OutboxError(result.message or result.error or f"Vouchery answered {result.status_code}", retry=result.status_code in TRANSIENT_STATUS_CODES)
+
+        return promo
+
     def update_promo(self, promo_form):
         '''
         Before updateing the promo record it calls Vouchery.io API to
@@ -169,32 +387,26 @@ class VoucheryProcessor(PromoProcessorBase):
         Override if you need to do additional steps when deleting a Promo instance,
         such as editing the promo code in an external service if needed.
         '''
-        self.delete_voucher(promo.code)
-        if not self.is_request_success and (self.response.status_code != 404 or self.response.status_code < 300):
+        result = self.delete_voucher(promo.code)
+        if not result.is_success and (result.status_code != 404 or result.status_code < 300):
             return None
         promo.delete()
 
     ############################
     # Utils
     def process_response(self):
-        # TODO: God aweful code that needs to be cleaned up.
-        if (b'[]' == self.response.content or b'' == self.response.content) and (self.response.status_code >= 200 and self.response.status_code < 300):
-            self.is_request_success = True
-            return None
-        self.response_content = json.loads(self.response.content)
-        if not isinstance(self.response_content, list):
-            self.response_message = self.response_content.get('message')
-            if self.response_content.get('type') == "Error":
-                if "error" in self.response_content:
-                    self.response_error = self.response_content.get("error")
-                else:
-                    self.response_error = self.response_content.get("errors")
-                self.is_request_success = False
-            else:
-                self.is_request_success = True
-        else:
-            if self.response.status_code == 200:
-                self.is_request_success = True
+        """
+        Parses self.response into a VoucheryResponse and sets the last
+        response attributes from it.
+        """
+        return self.set_last_response(parse_response(self.response.status_code, self.response.content))
+
+    def set_last_response(self, result):
+        self.response_content = result.content
+        self.response_message = result.message
+        self.response_error = result.error
+        self.is_request_success = result.is_success
+        return result
 
     def get_headers(self):
         return {
@@ -203,6 +415,72 @@ class VoucheryProcessor(PromoProcessorBase):
             "Authorization": f"Bearer {self.BARRER_KEY}"
         }
 
+    def request(self, method, url, **kwargs):
+        """
+        Makes the call through the process' pooled session for the BASE_URL,
+        which keeps the connection to Vouchery alive between calls, and the
+        site's circuit breaker, which raises CircuitOpenError instead while
+        Vouchery is failing.
+        """
+        return self.get_circuit_breaker().call(lambda: request(self.BASE_URL, method, url, **kwargs), lambda response: is_available(response.status_code))
+
+    def call(self, method, url, **kwargs):
+        """
+        Calls the Vouchery API and returns its VoucheryResponse.
+        """
+        self.response = self.request(method, url, headers=self.get_headers(), **kwargs)
+
+        if method != "GET":
+            self.response_cache.invalidate(self.site.pk, url)
+
+        return self.process_response()
+
+    def cached_call(self, url, **kwargs):
+        """
+        Same as a GET call() but through the response_cache.
+        """
+        return self.set_last_response(self.response_cache.get(self.site.pk, url, kwargs.get('params'), lambda: self.call("GET", url, **kwargs)))
+
+    def get_page(self, path_route, page, per_page=None, **querystring):
+        """
+        Calls a Vouchery list endpoint for one page of its items.
+        """
+        url = self.assemble_url(list(path_route))
+
+        return self.cached_call(url, params={**querystring, 'page': page, 'per_page': per_page or self.PAGE_SIZE})
+
+    def iterate(self, path_route, per_page=None, start_page=1, **querystring):
+        """
+        Generator that yields the items of a Vouchery list endpoint, following
+        its pages until one comes back short. While the caller goes through a
+        page the next one is requested in a background thread, so at most two
+        pages are in memory. Raises VoucheryError if a page fails.
+        """
+        per_page = per_page or self.PAGE_SIZE
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        try:
+            page = start_page
+            next_page = executor.submit(self.get_page, path_route, page, per_page, **querystring)
+
+            while next_page is not None:
+                result = next_page.result()
+
+                if not result.is_success:
+                    raise VoucheryError(result)
+
+                items = result.content or []
+                next_page = None
+
+                if len(items) >= per_page:
+                    page += 1
+                    next_page = executor.submit(self.get_page, path_route, page, per_page, **querystring)
+
+                yield from items
+        finally:
+            # A caller that stops early does not wait for the prefetched page
+            executor.shutdown(wait=False)
+
     def assemble_url(self, path_route):
         """
         Function returns the full url to make the api call to vouchery's
@@ -231,8 +509,7 @@ class VoucheryProcessor(PromoProcessorBase):
         }
         payload = {**base_payload, **optional_params}
 
-        self.response = requests.request("POST", url, json=payload, headers=self.get_headers())
-        self.process_response()
+        return self.call("POST", url, json=payload)
 
     def get_campaigns(self, **querystring):
         url = self.assemble_url([self.CAMPAIGN_URL])
@@ -240,8 +517,10 @@ class VoucheryProcessor(PromoProcessorBase):
         if not querystring:
             querystring = None
 
-        self.response = requests.request("GET", url, headers=self.get_headers(), params=querystring)
-        self.process_response()
+        return self.cached_call(url, params=querystring)
+
+    def iter_campaigns(self, per_page=None, start_page=1, **querystring):
+        return self.iterate([self.CAMPAIGN_URL], per_page, start_page, **querystring)
 
     def get_sub_campaigns(self, **querystring):
         url = self.assemble_url([self.CAMPAIGN_URL, 'sub'])
@@ -249,20 +528,20 @@ class VoucheryProcessor(PromoProcessorBase):
         if not querystring:
             querystring = None
 
-        self.response = requests.request("GET", url, headers=self.get_headers(), params=querystring)
-        self.process_response()
+        return self.cached_call(url, params=querystring)
+
+    def iter_sub_campaigns(self, per_page=None, start_page=1, **querystring):
+        return self.iterate([self.CAMPAIGN_URL, 'sub'], per_page, start_page, **querystring)
 
     def get_campaign(self, campaign_id):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id)])
 
-        self.response = requests.request("GET", url, headers=self.get_headers())
-        self.process_response()
+        return self.cached_call(url)
 
     def update_campaign(self, campaign_id, **optional_params):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id)])
 
-        self.response = requests.request("PATCH", url, json=optional_params, headers=self.get_headers())
-        self.process_response()
+        return self.call("PATCH", url, json=optional_params)
 
     def delete_campaign(self, campaign_id):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id)])
@@ -270,44 +549,40 @@ class VoucheryProcessor(PromoProcessorBase):
         if not campaign_id:
             raise ValueError(_("campaign_id is required to delete a campaign"))
 
-        self.response = requests.request("DELETE", url, headers=self.get_headers())
-        self.process_response()
-
-    def delete_full_campaign(self, campaign_id):
-        self.get_campaign(campaign_id)
-
-        sub_campaigns = [sub_campaign for sub_campaign in self.response_content['children'] if sub_campaign['type'] == 'SubCampaign']
-        for sub_campaign in sub_campaigns:
-            self.clear_response_variables()
-            self.get_campaign(sub_campaign['id'])
-            rewards = self.response_content['rewards']
-            self.clear_response_variables()
-            self.get_vouchers(sub_campaign['id'])
-            if self.response_content:
-                for voucher in self.response_content:
-                    self.clear_response_variables()
-                    self.delete_voucher(voucher['code'])
-            for reward in rewards:
-                self.clear_response_variables()
-                self.delete_reward(reward['id'])
-            self.delete_campaign(sub_campaign['id'])
-
-        self.clear_response_variables()
-        self.delete_campaign(campaign_id)
+        return self.call("DELETE", url)
+
+    def delete_full_campaign(self, campaign_id, max_workers=None, rate_limit=None, retries=None, progress=None):
+        """
+        Deletes the campaign with its sub-campaigns and their rewards and
+        vouchers, making up to max_workers calls at a time and at most
+        rate_limit calls per second. Returns a TeardownSummary, see
+        CampaignTeardown for the details.
+        """
+        from vendorpromo.processors.vouchery_teardown import CampaignTeardown  # The teardown imports this module
+
+        return CampaignTeardown(self, max_workers, rate_limit, retries, progress).run(campaign_id)
+
+    def export_coupon_codes(self, promotional_campaign, campaign_id=None, **options):
+        """
+        Creates a voucher in the Vouchery campaign, by default the promotional
+        campaign's campaign_id, for each of the promotional campaign's Coupon
+        Codes not exported yet. Returns an ExportSummary, see VoucherExport.
+        """
+        from vendorpromo.processors.vouchery_export import VoucherExport  # The export imports this module
+
+        return VoucherExport(self, promotional_campaign, campaign_id, **options).run()
 
     #############
     # Reward
     def create_reward(self, campaign_id, **reward_params):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id), self.REWARDS_URL])
 
-        self.response = requests.request("POST", url, json=reward_params, headers=self.get_headers())
-        self.process_response()
+        return self.call("POST", url, json=reward_params)
 
     def get_reward(self, reward_id):
         url = self.assemble_url([self.REWARDS_URL, str(reward_id)])
 
-        self.response = requests.request('GET', url, headers=self.get_headers())
-        self.process_response()
+        return self.cached_call(url)
 
     def update_reward(self):
         raise NotImplementedError
@@ -315,29 +590,22 @@ class VoucheryProcessor(PromoProcessorBase):
     def delete_reward(self, reward_id):
         url = self.assemble_url([self.REWARDS_URL, str(reward_id)])
 
-        self.response = requests.request("DELETE", url, headers=self.get_headers())
-        self.process_response()
+        return self.call("DELETE", url)
 
     #############
     # Voucher
     def create_voucher(self, code, campaign_id):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id), self.VOUCHER_URL])
 
-        payload = {
-            "type": "Voucher",
-            "active": True,
-            "code": code,
-            "status": "active"
-        }
-
-        self.response = requests.request("POST", url, json=payload, headers=self.get_headers())
-        self.process_response()
+        return self.call("POST", url, json={**self.VOUCHER_PARAMS, "code": code})
 
     def get_vouchers(self, campaign_id, **kwargs):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id), self.VOUCHER_URL])
 
-        self.response = requests.request("GET", url, headers=self.get_headers())
-        self.process_response()
+        return self.cached_call(url)
+
+    def iter_vouchers(self, campaign_id, per_page=None, start_page=1, **querystring):
+        return self.iterate([self.CAMPAIGN_URL, str(campaign_id), self.VOUCHER_URL], per_page, start_page, **querystring)
 
     def get_voucher(self, code, **querystring):
         url = self.assemble_url([self.VOUCHER_URL, str(code)])
@@ -345,8 +613,7 @@ class VoucheryProcessor(PromoProcessorBase):
         if not querystring:
             querystring = None
 
-        self.response = requests.request("GET", url, headers=self.get_headers(), params=querystring)
-        self.process_response()
+        return self.cached_call(url, params=querystring)
 
     def update_voucher(self):
         '''
@@ -357,8 +624,7 @@ class VoucheryProcessor(PromoProcessorBase):
     def delete_voucher(self, code):
         url = self.assemble_url([self.VOUCHER_URL, code])
 
-        self.response = requests.request("DELETE", url, headers=self.get_headers())
-        self.process_response()
+        return self.call("DELETE", url)
 
     #############
     # Redeem
@@ -370,14 +636,15 @@ class VoucheryProcessor(PromoProcessorBase):
             "total_transaction_cost": total_cost
         }
 
-        self.response = requests.request("POST", url, json=payload, headers=self.get_headers())
-        self.process_response()
+        return self.call("POST", url, json=payload)
 
     def get_redeems(self, campaign_id):
         url = self.assemble_url([self.CAMPAIGN_URL, str(campaign_id), self.REDEMPTION_URL])
 
-        self.response = requests.request("GET", url, headers=self.get_headers())
-        self.process_response()
+        return self.cached_call(url)
+
+    def iter_redeems(self, campaign_id, per_page=None, start_page=1, **querystring):
+        return self.iterate([self.CAMPAIGN_URL, str(campaign_id), self.REDEMPTION_URL], per_page, start_page, **querystring)
 
     def get_redeem(self, voucher_code, transaction_id):
         url = self.assemble_url([self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL])
@@ -386,8 +653,7 @@ class VoucheryProcessor(PromoProcessorBase):
             "transaction_id": transaction_id
         }
 
-        self.response = requests.request("GET", url, params=querystring, headers=self.get_headers())
-        self.process_response()
+        return self.call("GET", url, params=querystring)
 
     def delete_redeem(self, voucher_code, transaction_id):
         url = self.assemble_url([self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL])
@@ -396,8 +662,7 @@ class VoucheryProcessor(PromoProcessorBase):
             "transaction_id": transaction_id
         }
 
-        self.response = requests.request("DELETE", url, params=querystring, headers=self.get_headers())
-        self.process_response()
+        return self.call("DELETE", url, params=querystring)
 
     def confirm_redeem(self, voucher_code, transaction_id):
         url = self.assemble_url([self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL])
@@ -406,37 +671,111 @@ class VoucheryProcessor(PromoProcessorBase):
             "transaction_id": transaction_id
         }
 
-        self.response = requests.request("PATCH", url, params=querystring, headers=self.get_headers())
-        self.process_response()
+        return self.call("PATCH", url, params=querystring)
 
     ################
     # Processor Functions
-    def is_code_valid(self, code):
+    def is_code_valid(self, code, invoice=None):
         """
-        Vouchery.io create_redeem validates the code. If it is valid
-        it will create a redemption recode to be confirmed after payment.
+        Checks that Vouchery.io has a voucher for the code, a Coupon Code or
+        its code. The redemption is only created on checkout, see
+        is_code_valid_on_checkout. If Vouchery can not be reached the code is
+        validated offline, see validate_code_offline.
         """
-        self.create_redeem(code)
-        if self.is_request_success:
-            return True
-        return False
+        code = getattr(code, 'code', code)
+
+        try:
+            return self.check_code(code, invoice=invoice)
+        except UNAVAILABLE_ERRORS as error:
+            logger.warning(f"VoucheryProcessor.is_code_valid: {error}")
+
+        return self.validate_code_offline(code, invoice=invoice, kind=ValidationKind.CODE)
+
+    def check_code(self, code, invoice=None):
+        return self.call("GET", self.assemble_url([self.VOUCHER_URL, str(getattr(code, 'code', code))])).is_success
+
+    async def ais_code_valid(self, code, invoice=None):
+        """
+        Same as is_code_valid but awaits the Vouchery call instead of running
+        it in the thread shared by the sync code.
+        """
+        if httpx is None:
+            return await super().ais_code_valid(code, invoice=invoice)
+
+        from vendorpromo.processors.vouchery_async import AsyncVoucheryClient  # The client imports this module
 
-    def is_code_valid_on_checkout(self, code, offer_cost):
+        code = getattr(code, 'code', code)
+
+        try:
+            return (await AsyncVoucheryClient.from_processor(self).get_voucher(code)).is_success
+        except (*UNAVAILABLE_ERRORS, httpx.HTTPError) as error:
+            logger.warning(f"VoucheryProcessor.ais_code_valid: {error}")
+
+        return await sync_to_async(self.validate_code_offline)(code, invoice=invoice, kind=ValidationKind.CODE)
+
+    def is_code_valid_on_checkout(self, code, offer_cost, invoice=None):
         """
         Vouchery.io create_redeem validates the code. If it is valid
         it will create a redemption recode to be confirmed after payment.
+        If Vouchery can not be reached the code is validated offline, see
+        validate_code_offline.
         """
+        try:
+            return self.check_code_on_checkout(code, offer_cost, invoice=invoice)
+        except UNAVAILABLE_ERRORS as error:
+            logger.warning(f"VoucheryProcessor.is_code_valid_on_checkout: {error}")
+
+        if not self.validate_code_offline(code, offer_cost, invoice=invoice):
+            return False
+
+        self.set_promo_invoice_vendor_notes(code, invoice)
+        return True
+
+    def check_code_on_checkout(self, code, offer_cost, invoice=None):
         # Checks to see if there is already a redemption that has not been confirmed.
-        transaction_id = str(self.invoice.uuid) + f"__{code}"
-        self.get_redeem(code, transaction_id)
-        if self.is_request_success:
-            self.set_promo_invoice_vendor_notes(code)
-            return True
-        self.create_redeem(code, transaction_id, offer_cost)
-        if self.is_request_success:
-            self.set_promo_invoice_vendor_notes(code)
-            return True
-        return False
+        transaction_id = str(self.get_invoice(invoice).uuid) + f"__{code}"
+        result = self.get_redeem(code, transaction_id)
+
+        if not result.is_success:
+            result = self.create_redeem(code, transaction_id, offer_cost)
+
+        if not result.is_success:
+            return False
+
+        self.set_promo_invoice_vendor_notes(code, invoice)
+        return True
+
+    async def ais_code_valid_on_checkout(self, code, offer_cost, invoice=None):
+        """
+        Same as is_code_valid_on_checkout but awaits the Vouchery calls
+        instead of blocking a worker during the round trips.
+        """
+        if httpx is None:
+            return await super().ais_code_valid_on_checkout(code, offer_cost, invoice=invoice)
+
+        from vendorpromo.processors.vouchery_async import AsyncVoucheryClient  # The client imports this module
+
+        client = AsyncVoucheryClient.from_processor(self)
+        transaction_id = str(self.get_invoice(invoice).uuid) + f"__{code}"
+
+        try:
+            # Checks to see if there is already a redemption that has not been confirmed.
+            result = await client.get_redeem(code, transaction_id)
+
+            if not result.is_success:
+                result = await client.create_redeem(code, transaction_id, offer_cost)
+        except (*UNAVAILABLE_ERRORS, httpx.HTTPError) as error:
+            logger.warning(f"VoucheryProcessor.ais_code_valid_on_checkout: {error}")
+            result = None
+
+            if not await sync_to_async(self.validate_code_offline)(code, offer_cost, invoice=invoice):
+                return False
+
+        if result is not None and not result.is_success:
+            return False
+
+        await sync_to_async(self.set_promo_invoice_vendor_notes)(code, invoice)
+        return True
 
     def redeem_code(self, code):
         """
@@ -451,8 +790,7 @@ class VoucheryProcessor(PromoProcessorBase):
         confirm that the promo code was used.
         """
         super().confirm_redeemed_code(coupon_code, invoice)
-        response = self.confirm_redeem(coupon_code)
-        self.process_response(response)
+        return self.confirm_redeem(coupon_code)
 
     def process_promo(self, promo_code):
         '''
@@ -0,0 +1,135 @@
+"""
+asyncio client for the Vouchery.io API.
+
+It mirrors the API calls of VoucheryProcessor, but every call returns a
+VoucheryResponse instead of storing the response on the instance, so one
+client can be shared by concurrent tasks. Requires httpx, installed with
+the async extra. Reads are not cached, but writes invalidate the
+processor's cached responses of the client's site. Calls go through the
+site's circuit breaker, like the processor's.
+"""
+from asgiref.sync import sync_to_async
+
+from vendorpromo.circuit_breaker import CircuitBreaker
+from vendorpromo.http_sessions import get_async_client
+from vendorpromo.processors.vouchery import (VoucheryProcessor, is_available,
+                                             parse_response)
+
+
+class AsyncVoucheryClient(object):
+    CAMPAIGN_URL = VoucheryProcessor.CAMPAIGN_URL
+    REWARDS_URL = VoucheryProcessor.REWARDS_URL
+    VOUCHER_URL = VoucheryProcessor.VOUCHER_URL
+    REDEMPTION_URL = VoucheryProcessor.REDEMPTION_URL
+
+    def __init__(self, base_url, barrer_key, site_id=None):
+        self.base_url = base_url
+        self.barrer_key = barrer_key
+        self.site_id = site_id
+
+    @classmethod
+    def from_processor(cls, processor):
+        return cls(processor.BASE_URL, processor.BARRER_KEY, processor.site.pk)
+
+    ############################
+    # Utils
+    def get_headers(self):
+        return {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.barrer_key}"
+        }
+
+    def assemble_url(self, path_route):
+        return "/".join([self.base_url] + path_route)
+
+    async def request(self, method, path_route, **kwargs):
+        url = self.assemble_url(path_route)
+
+        async def send():
+            return await get_async_client(self.base_url).request(method, url, headers=self.get_headers(), **kwargs)
+
+        if self.site_id is None:
+            response = await send()
+        else:
+            response = await CircuitBreaker(VoucheryProcessor.breaker_name, self.site_id).acall(send, lambda response: is_available(response.status_code))
+
+        if method != "GET" and self.site_id is not None:
+            await sync_to_async(VoucheryProcessor.response_cache.invalidate)(self.site_id, url)
+
+        return parse_response(response.status_code, response.content)
+
+    ############################
+    # VOUCHERY API CALLS
+    #############
+    # Campaigns
+    async def create_campaign(self, name, **optional_params):
+        if not name:
+            raise ValueError("name is required to create a campaign")
+
+        return await self.request("POST", [self.CAMPAIGN_URL], json={"name": name, **optional_params})
+
+    async def get_campaigns(self, **querystring):
+        return await self.request("GET", [self.CAMPAIGN_URL], params=querystring or None)
+
+    async def get_sub_campaigns(self, **querystring):
+        return await self.request("GET", [self.CAMPAIGN_URL, 'sub'], params=querystring or None)
+
+    async def get_campaign(self, campaign_id):
+        return await self.request("GET", [self.CAMPAIGN_URL, str(campaign_id)])
+
+    async def update_campaign(self, campaign_id, **optional_params):
+        return await self.request("PATCH", [self.CAMPAIGN_URL, str(campaign_id)], json=optional_params)
+
+    async def delete_campaign(self, campaign_id):
+        if not campaign_id:
+            raise ValueError("campaign_id is required to delete a campaign")
+
+        return await self.request("DELETE", [self.CAMPAIGN_URL, str(campaign_id)])
+
+    #############
+    # Reward
+    async def create_reward(self, campaign_id, **reward_params):
+        return await self.request("POST", [self.CAMPAIGN_URL, str(campaign_id), self.REWARDS_URL], json=reward_params)
+
+    async def get_reward(self, reward_id):
+        return await self.request("GET", [self.REWARDS_URL, str(reward_id)])
+
+    async def delete_reward(self, reward_id):
+        return await self.request("DELETE", [self.REWARDS_URL, str(reward_id)])
+
+    #############
+    # Voucher
+    async def create_voucher(self, code, campaign_id):
+        return await self.request("POST", [self.CAMPAIGN_URL, str(campaign_id), self.VOUCHER_URL], json={**VoucheryProcessor.VOUCHER_PARAMS, "code": code})
+
+    async def get_vouchers(self, campaign_id):
+        return await self.request("GET", [self.CAMPAIGN_URL, str(campaign_id), self.VOUCHER_URL])
+
+    async def get_voucher(self, code, **querystring):
+        return await self.request("GET", [self.VOUCHER_URL, str(code)], params=querystring or None)
+
+    async def delete_voucher(self, code):
+        return await self.request("DELETE", [self.VOUCHER_URL, str(code)])
+
+    #############
+    # Redeem
+    async def create_redeem(self, voucher_code, transaction_id, total_cost):
+        payload = {
+            "transaction_id": transaction_id,
+            "total_transaction_cost": total_cost
+        }
+
+        return await self.request("POST", [self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL], json=payload)
+
+    async def get_redeems(self, campaign_id):
+        return await self.request("GET", [self.CAMPAIGN_URL, str(campaign_id), self.REDEMPTION_URL])
+
+    async def get_redeem(self, voucher_code, transaction_id):
+        return await self.request("GET", [self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL], params={"transaction_id": transaction_id})
+
+    async def delete_redeem(self, voucher_code, transaction_id):
+        return await self.request("DELETE", [self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL], params={"transaction_id": transaction_id})
+
+    async def confirm_redeem(self, voucher_code, transaction_id):
+        return await self.request("PATCH", [self.VOUCHER_URL, str(voucher_code), self.REDEMPTION_URL], params={"transaction_id": transaction_id})
@@ -0,0 +1,73 @@
+"""
+Shared parts of the Vouchery batch jobs, which make many calls to Vouchery
+from a bounded thread pool.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from vendorpromo.config import (VENDOR_PROMO_PROCESSOR_MAX_WORKERS,
+                                VENDOR_PROMO_PROCESSOR_RATE_LIMIT,
+                                VENDOR_PROMO_PROCESSOR_RETRIES)
+from vendorpromo.fallback import UNAVAILABLE_ERRORS
+from vendorpromo.http_sessions import RateLimiter
+from vendorpromo.processors.vouchery import VoucheryError
+
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+BACKOFF = 0.5  # Seconds before the first retry, doubled on each one after
+
+# Errors raised by a call that never got a Vouchery response
+CALL_ERRORS = UNAVAILABLE_ERRORS
+
+BatchFailure = namedtuple('BatchFailure', ['kind', 'id', 'error'])
+
+
+class VoucheryBatch(object):
+    """
+    Base for the batch jobs. Calls are spaced out by a RateLimiter shared by
+    the job's threads, and calls that fail to connect or come back with a
+    transient status are retried with exponential backoff.
+    """
+
+    def __init__(self, processor, max_workers=None, rate_limit=None, retries=None, progress=None, backoff=BACKOFF):
+        self.processor = processor
+        self.max_workers = max_workers or VENDOR_PROMO_PROCESSOR_MAX_WORKERS
+        self.rate_limiter = RateLimiter(VENDOR_PROMO_PROCESSOR_RATE_LIMIT if rate_limit is None else rate_limit)
+        self.retries = VENDOR_PROMO_PROCESSOR_RETRIES if retries is None else retries
+        self.progress = progress
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.retried = 0
+
+    def call(self, method, path_route, **kwargs):
+        """
+        Returns the VoucheryResponse of the call, retrying transient failures.
+        Raises the error of the last attempt if none got a response.
+        """
+        url = self.processor.assemble_url(list(path_route))
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            self.rate_limiter.wait()
+
+            try:
+                result = self.processor.call(method, url, **kwargs)
+            except CALL_ERRORS:
+                if attempt == self.retries:
+                    raise
+                continue
+
+            if result.status_code not in TRANSIENT_STATUS_CODES or attempt == self.retries:
+                return result
+
+    def get(self, path_route, **kwargs):
+        result = self.call("GET", path_route, **kwargs)
+
+        if not result.is_success:
+            raise VoucheryError(result)
+
+        return result.content
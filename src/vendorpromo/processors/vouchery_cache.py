@@ -0,0 +1,124 @@
+"""
+Read-through cache of Vouchery GET calls.
+
+Responses are stored in Django's cache per site and request, with a timeout
+per resource (campaigns, rewards, vouchers, redemptions) from
+VENDOR_PROMO_PROCESSOR_CACHE_TIMEOUTS. After the timeout a response is still
+served for VENDOR_PROMO_PROCESSOR_CACHE_STALE_TIMEOUT seconds while one
+background thread fetches it again, so a page load only waits on Vouchery
+when nothing is cached. Only successful responses are cached.
+
+Each site and resource has a generation key that is part of the response
+keys. A write call replaces the generations of the resources it changes,
+which makes every cached response of those resources unreachable at once.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+
+from vendorpromo.config import (VENDOR_PROMO_PROCESSOR_CACHE_STALE_TIMEOUT,
+                                VENDOR_PROMO_PROCESSOR_CACHE_TIMEOUTS)
+
+logger = logging.getLogger(__name__)
+
+# Resources whose cached responses a write to the resource changes. Rewards are part of their campaign's
+# response and redemptions change the voucher's.
+AFFECTED_RESOURCES = {
+    'campaigns': ('campaigns',),
+    'rewards': ('rewards', 'campaigns'),
+    'vouchers': ('vouchers',),
+    'redemptions': ('redemptions', 'vouchers'),
+}
+
+
+def get_resource(url):
+    """
+    Returns the resource of the url, the last of its path segments that is a
+    resource name, e.g. vouchers for /campaigns/7/vouchers.
+    """
+    for segment in reversed(urlsplit(url).path.split("/")):
+        if segment in AFFECTED_RESOURCES:
+            return segment
+
+    return None
+
+
+class ResponseCache(object):
+    """
+    Cache of the VoucheryResponses of one kind of processor, shared by its
+    instances.
+    """
+
+    def __init__(self, timeouts=None, stale_timeout=None):
+        self.timeouts = VENDOR_PROMO_PROCESSOR_CACHE_TIMEOUTS if timeouts is None else timeouts
+        self.stale_timeout = VENDOR_PROMO_PROCESSOR_CACHE_STALE_TIMEOUT if stale_timeout is None else stale_timeout
+
+    def get_generation_key(self, site_id, resource):
+        return f"vendorpromo.vouchery.{site_id}.{resource}.generation"
+
+    def get_generation(self, site_id, resource):
+        return cache.get_or_set(self.get_generation_key(site_id, resource), uuid.uuid4().hex, None)
+
+    def get_cache_key(self, site_id, resource, url, params):
+        request_hash = hashlib.sha256(json.dumps([url, params], sort_keys=True, default=str).encode()).hexdigest()
+        return f"vendorpromo.vouchery.{site_id}.{resource}.{self.get_generation(site_id, resource)}.{request_hash}"
+
+    def get(self, site_id, url, params, fetch):
+        """
+        Returns the cached VoucheryResponse of the request, or the one
+        returned by fetch() if there is none. Returns a stale response and
+        refreshes it in the background if it is within the stale timeout.
+        """
+        resource = get_resource(url)
+        timeout = self.timeouts.get(resource)
+
+        if not timeout:
+            return fetch()
+
+        key = self.get_cache_key(site_id, resource, url, params)
+        fetched, result = cache.get(key, (None, None))
+
+        if result is not None:
+            if time.time() - fetched > timeout:
+                self.refresh(key, timeout, fetch)
+            return result
+
+        return self.store(key, timeout, fetch())
+
+    def store(self, key, timeout, result):
+        if result.is_success:
+            cache.set(key, (time.time(), result), timeout + self.stale_timeout)
+        return result
+
+    def refresh(self, key, timeout, fetch):
+        """
+        Fetches the response again in a background thread, unless another
+        thread or process is already doing it.
+        """
+        if not cache.add(f"{key}.refresh", True, timeout):
+            return None
+
+        def run():
+            try:
+                self.store(key, timeout, fetch())
+            except Exception as error:
+                logger.warning(f"ResponseCache.refresh: {error}")
+            finally:
+                cache.delete(f"{key}.refresh")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, site_id, url):
+        """
+        Drops the cached responses of the resources a write to the url changes.
+        """
+        resources = AFFECTED_RESOURCES.get(get_resource(url), ())
+        cache.set_many({self.get_generation_key(site_id, resource): uuid.uuid4().hex for resource in resources}, None)
@@ -0,0 +1,116 @@
+"""
+Bulk export of Coupon Codes to Vouchery.
+
+Vouchery has no bulk voucher endpoint, so each code is still one call, but
+the calls are made concurrently over the pooled session with the rate limit
+and retries of VoucheryBatch. Codes are read from the database in chunks in
+pk order, without loading the campaign's codes at once, and the
+VoucheryExport checkpoint is saved after each chunk. An interrupted run
+resumes after the last saved chunk and a later run only pushes the codes
+created since. A chunk with failed codes only moves the checkpoint up to
+its first failed code and ends the run, so the next run pushes them again.
+"""
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.utils import timezone
+
+from vendorpromo.models import CouponCode, VoucheryExport
+from vendorpromo.processors.vouchery_batch import (CALL_ERRORS, BatchFailure,
+                                                   VoucheryBatch)
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Codes of an interrupted chunk are pushed again, Vouchery rejects the ones it already has with these
+ALREADY_EXISTS_STATUS_CODES = (409, 422)
+
+EXPORTED, SKIPPED, FAILED = 'exported', 'skipped', 'failed'
+
+ExportSummary = namedtuple('ExportSummary', ['exported', 'skipped', 'failed', 'retries', 'seconds'])
+
+
+class VoucherExport(VoucheryBatch):
+    """
+    Creates a voucher in a Vouchery campaign for each Coupon Code of a
+    promotional campaign. progress(exported, skipped, failed) is called
+    after each chunk. run() returns an ExportSummary for the run, the
+    totals over all runs are kept in the VoucheryExport.
+    """
+
+    def __init__(self, processor, promotional_campaign, campaign_id=None, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        super().__init__(processor, **kwargs)
+        self.promotional_campaign = promotional_campaign
+        self.campaign_id = campaign_id or promotional_campaign.campaign_id
+        self.chunk_size = chunk_size
+
+        if not self.campaign_id:
+            raise ValueError("The Vouchery campaign to export the codes to is required")
+
+    def push(self, code):
+        """
+        Returns the outcome of creating the voucher for the code and the error
+        if it failed.
+        """
+        try:
+            result = self.call("POST", [self.processor.CAMPAIGN_URL, str(self.campaign_id), self.processor.VOUCHER_URL], json={**self.processor.VOUCHER_PARAMS, "code": code})
+        except CALL_ERRORS as error:
+            return FAILED, str(error)
+
+        if result.is_success:
+            return EXPORTED, None
+
+        if result.status_code in ALREADY_EXISTS_STATUS_CODES:
+            return SKIPPED, None
+
+        return FAILED, result.message or result.error or result.status_code
+
+    def run(self):
+        start_time = time.perf_counter()
+        export, _ = VoucheryExport.objects.get_or_create(promo=self.promotional_campaign, campaign_id=str(self.campaign_id))
+        coupon_codes = CouponCode.objects.filter(promo=self.promotional_campaign).order_by('pk').values_list('pk', 'code')
+        counts = {EXPORTED: 0, SKIPPED: 0}
+        failed = []
+        completed = True
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                chunk = list(coupon_codes.filter(pk__gt=export.last_coupon_code_pk)[:self.chunk_size])
+
+                if not chunk:
+                    break
+
+                chunk_start = time.perf_counter()
+                chunk_counts = {EXPORTED: 0, SKIPPED: 0, FAILED: 0}
+                last_coupon_code_pk = chunk[-1][0]
+
+                for (pk, code), (outcome, error) in zip(chunk, executor.map(self.push, [code for pk, code in chunk])):
+                    chunk_counts[outcome] += 1
+
+                    if outcome == FAILED:
+                        failed.append(BatchFailure('voucher', code, error))
+                        last_coupon_code_pk = min(last_coupon_code_pk, pk - 1)
+
+                # Codes after the first failed one are pushed again and skipped by Vouchery
+                export.last_coupon_code_pk = max(last_coupon_code_pk, export.last_coupon_code_pk)
+                export.exported_count += chunk_counts[EXPORTED]
+                export.skipped_count += chunk_counts[SKIPPED]
+                export.failed_count += chunk_counts[FAILED]
+                export.seconds += time.perf_counter() - chunk_start
+                export.save()
+
+                counts[EXPORTED] += chunk_counts[EXPORTED]
+                counts[SKIPPED] += chunk_counts[SKIPPED]
+
+                if self.progress:
+                    self.progress(counts[EXPORTED], counts[SKIPPED], len(failed))
+
+                if chunk_counts[FAILED]:
+                    completed = False
+                    break
+
+        if completed:
+            export.completed = timezone.now()
+            export.save()
+
+        return ExportSummary(counts[EXPORTED], counts[SKIPPED], failed, self.retried, time.perf_counter() - start_time)
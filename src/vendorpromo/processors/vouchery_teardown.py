@@ -0,0 +1,116 @@
+"""
+Concurrent teardown of a Vouchery main campaign.
+
+The sub-campaigns are listed first, then their vouchers and rewards are
+deleted from a bounded thread pool, with the rate limit and retries of
+VoucheryBatch. A sub-campaign is only deleted once all its vouchers and
+rewards are, and the main campaign once all its sub-campaigns are, so running
+it again after a failure deletes what is left.
+"""
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from vendorpromo.processors.vouchery import VoucheryError
+from vendorpromo.processors.vouchery_batch import (CALL_ERRORS, BatchFailure,
+                                                   VoucheryBatch)
+
+TeardownSummary = namedtuple('TeardownSummary', ['deleted', 'failed', 'retries', 'seconds', 'result'])
+
+
+class CampaignTeardown(VoucheryBatch):
+    """
+    Deletes a main campaign with its sub-campaigns, rewards and vouchers.
+    progress(deleted, failed) is called after each delete, from the worker
+    threads. run() returns a TeardownSummary, its result is the
+    VoucheryResponse of the main campaign's delete or None if it was not
+    deleted.
+    """
+
+    def __init__(self, processor, *args, **kwargs):
+        super().__init__(processor, *args, **kwargs)
+        self.deleted = 0
+        self.failed = []
+
+    def fail(self, kind, object_id, error):
+        with self.lock:
+            self.failed.append(BatchFailure(kind, object_id, error))
+
+    def delete(self, kind, object_id, path_route):
+        """
+        Returns the VoucheryResponse if the object was deleted, or was already
+        gone, and None if it failed.
+        """
+        try:
+            result = self.call("DELETE", path_route)
+            error = None if result.is_success or result.status_code == 404 else (result.message or result.error or result.status_code)
+        except CALL_ERRORS as exception:
+            result, error = None, str(exception)
+
+        with self.lock:
+            if error is None:
+                self.deleted += 1
+            else:
+                self.failed.append(BatchFailure(kind, object_id, error))
+            deleted, failed = self.deleted, len(self.failed)
+
+        if self.progress:
+            self.progress(deleted, failed)
+
+        return result if error is None else None
+
+    def get_voucher_codes(self, sub_campaign_id):
+        """
+        Lists every voucher code before any is deleted, deleting while paging
+        would shift the later pages.
+        """
+        path_route = [self.processor.CAMPAIGN_URL, str(sub_campaign_id), self.processor.VOUCHER_URL]
+        per_page = self.processor.PAGE_SIZE
+        codes, page = [], 1
+
+        while True:
+            vouchers = self.get(path_route, params={'page': page, 'per_page': per_page}) or []
+            codes.extend(voucher['code'] for voucher in vouchers)
+
+            if len(vouchers) < per_page:
+                return codes
+
+            page += 1
+
+    def collect(self, sub_campaign_id):
+        rewards = self.get([self.processor.CAMPAIGN_URL, str(sub_campaign_id)])['rewards']
+        return [reward['id'] for reward in rewards], self.get_voucher_codes(sub_campaign_id)
+
+    def run(self, campaign_id):
+        start_time = time.perf_counter()
+        campaign = self.get([self.processor.CAMPAIGN_URL, str(campaign_id)])
+        sub_campaign_ids = [sub_campaign['id'] for sub_campaign in campaign['children'] if sub_campaign['type'] == 'SubCampaign']
+        result = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            collected = {sub_campaign_id: executor.submit(self.collect, sub_campaign_id) for sub_campaign_id in sub_campaign_ids}
+            children = {}
+
+            for sub_campaign_id, future in collected.items():
+                try:
+                    reward_ids, codes = future.result()
+                except (VoucheryError, *CALL_ERRORS) as error:
+                    self.fail('sub-campaign', sub_campaign_id, str(error))
+                    continue
+
+                children[sub_campaign_id] = [
+                    executor.submit(self.delete, 'voucher', code, [self.processor.VOUCHER_URL, code]) for code in codes
+                ] + [
+                    executor.submit(self.delete, 'reward', reward_id, [self.processor.REWARDS_URL, str(reward_id)]) for reward_id in reward_ids
+                ]
+
+            sub_campaigns = [
+                executor.submit(self.delete, 'sub-campaign', sub_campaign_id, [self.processor.CAMPAIGN_URL, str(sub_campaign_id)])
+                for sub_campaign_id, futures in children.items()
+                if all([future.result() for future in futures])
+            ]
+
+            if len(sub_campaigns) == len(sub_campaign_ids) and all([future.result() for future in sub_campaigns]):
+                result = self.delete('campaign', campaign_id, [self.processor.CAMPAIGN_URL, str(campaign_id)])
+
+        return TeardownSummary(self.deleted, self.failed, self.retried, time.perf_counter() - start_time, result)
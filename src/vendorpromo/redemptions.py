@@ -0,0 +1,198 @@
+"""
+Denormalized redemption counters for coupon codes and their campaigns.
+
+A redemption is reserved with a single conditional UPDATE per row that checks
+max_redemptions and increments redemption_count, so two checkouts racing for
+the last redemption of a code can not both succeed. The updates run in their
+own short transaction and the row locks are released as soon as it commits,
+concurrent checkouts on a hot code only wait on each other for the duration
+of the two UPDATE statements.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
+
+from vendorpromo.models import (CampaignRedemption, CodeMode, CouponCode,
+                                PromotionalCampaign, SignedCodeRedemption)
+from vendorpromo.signed_codes import parse_code
+
+
+def available_redemptions_filter():
+    return Q(max_redemptions__isnull=True) | Q(redemption_count__lt=F('max_redemptions'))
+
+
+def increment_redemption_count(model, pk):
+    return bool(model.objects.filter(available_redemptions_filter(), pk=pk).update(redemption_count=F('redemption_count') + 1))
+
+
+def decrement_redemption_count(model, pk):
+    model.objects.filter(pk=pk, redemption_count__gt=0).update(redemption_count=F('redemption_count') - 1)
+
+
+def reserve_redemption(coupon_code):
+    """
+    Increments the redemption count of the coupon code and its campaign if
+    neither has reached max_redemptions. Returns True if the redemption was
+    reserved.
+    """
+    with transaction.atomic():
+        if not increment_redemption_count(CouponCode, coupon_code.pk):
+            return False
+
+        if not increment_redemption_count(PromotionalCampaign, coupon_code.promo_id):
+            # Give the coupon code reservation back instead of rolling back
+            # a savepoint, the caller may already be inside a transaction.
+            decrement_redemption_count(CouponCode, coupon_code.pk)
+            return False
+
+    return True
+
+
+def reserve_campaign_redemption(promotional_campaign_pk, invoice):
+    """
+    Stores the redemption of a campaign applied to the invoice without a
+    coupon code and increments its redemption count if it has not reached
+    max_redemptions. Returns True if the redemption was reserved or the
+    invoice already holds it.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                CampaignRedemption.objects.create(promo_id=promotional_campaign_pk, invoice=invoice)
+        except IntegrityError:
+            return True
+
+        if not increment_redemption_count(PromotionalCampaign, promotional_campaign_pk):
+            CampaignRedemption.objects.filter(promo_id=promotional_campaign_pk, invoice=invoice).delete()
+            return False
+
+    return True
+
+
+def reserve_signed_redemption(signed_code, invoice):
+    """
+    Stores the redemption of the signed code's serial for the invoice and
+    increments its campaign's redemption count. Returns True if the
+    redemption was reserved or the invoice already holds it.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                SignedCodeRedemption.objects.create(promo_id=signed_code.campaign_pk, serial=signed_code.serial, invoice=invoice)
+        except IntegrityError:
+            return SignedCodeRedemption.objects.filter(promo_id=signed_code.campaign_pk, serial=signed_code.serial, invoice=invoice).exists()
+
+        if not increment_redemption_count(PromotionalCampaign, signed_code.campaign_pk):
+            SignedCodeRedemption.objects.filter(promo_id=signed_code.campaign_pk, serial=signed_code.serial).delete()
+            return False
+
+    return True
+
+
+def release_signed_redemption(signed_code, invoice):
+    """
+    Gives back a redemption reserved by the invoice with reserve_signed_redemption().
+    """
+    with transaction.atomic():
+        deleted, _ = SignedCodeRedemption.objects.filter(promo_id=signed_code.campaign_pk, serial=signed_code.serial, invoice=invoice).delete()
+
+        if deleted:
+            decrement_redemption_count(PromotionalCampaign, signed_code.campaign_pk)
+
+
+def release_redemption(coupon_code):
+    """
+    Gives back a redemption reserved with reserve_redemption().
+    """
+    with transaction.atomic():
+        decrement_redemption_count(CouponCode, coupon_code.pk)
+        decrement_redemption_count(PromotionalCampaign, coupon_code.promo_id)
+
+
+def release_invoice_redemptions(invoice, compiled_coupons):
+    """
+    Unlinks the compiled coupons' codes from the invoice and gives back the
+    redemptions they reserved. Signed codes, which have no pk, release the
+    redemption of their serial. Codes no longer linked to the invoice were
+    already released and are skipped.
+    """
+    with transaction.atomic():
+        coupon_code_invoices = CouponCode.invoice.through.objects.filter(invoice=invoice, couponcode__in=[compiled_coupon.pk for compiled_coupon in compiled_coupons if compiled_coupon.pk is not None])
+        linked_pks = set(coupon_code_invoices.values_list('couponcode', flat=True))
+        coupon_code_invoices.delete()
+
+        for compiled_coupon in compiled_coupons:
+            if compiled_coupon.pk is None:
+                release_signed_redemption(parse_code(compiled_coupon.code), invoice)
+                continue
+
+            if compiled_coupon.pk not in linked_pks:
+                continue
+
+            decrement_redemption_count(CouponCode, compiled_coupon.pk)
+            decrement_redemption_count(PromotionalCampaign, compiled_coupon.campaign_pk)
+
+
+def release_offer_redemptions(invoice, offer_pk):
+    """
+    Gives back the redemptions the invoice reserved for a promotional offer
+    once its order item is removed. The coupon codes of the offer's campaigns
+    are unlinked from the invoice, signed codes release their serial and
+    campaigns redeemed without a code, like auto apply campaigns, release the
+    CampaignRedemption of the invoice. Campaigns on the offer the invoice did
+    not reserve are left alone.
+    """
+    with transaction.atomic():
+        coupon_codes = list(CouponCode.objects.filter(invoice=invoice, promo__applies_to=offer_pk).values_list('pk', 'promo_id'))
+        signed_code_redemptions = list(SignedCodeRedemption.objects.filter(invoice=invoice, promo__applies_to=offer_pk))
+        campaign_redemptions = list(CampaignRedemption.objects.filter(invoice=invoice, promo__applies_to=offer_pk))
+
+        CouponCode.invoice.through.objects.filter(invoice=invoice, couponcode__in=[pk for pk, _promo_id in coupon_codes]).delete()
+
+        for coupon_code_pk, promotional_campaign_pk in coupon_codes:
+            decrement_redemption_count(CouponCode, coupon_code_pk)
+            decrement_redemption_count(PromotionalCampaign, promotional_campaign_pk)
+
+        for signed_code_redemption in signed_code_redemptions:
+            signed_code_redemption.delete()
+            decrement_redemption_count(PromotionalCampaign, signed_code_redemption.promo_id)
+
+        for campaign_redemption in campaign_redemptions:
+            campaign_redemption.delete()
+            decrement_redemption_count(PromotionalCampaign, campaign_redemption.promo_id)
+
+
+def reconcile_redemption_counts(site=None):
+    """
+    Rebuilds the redemption counters from the same rows the reservations
+    keep: every invoice linked through the CouponCode.invoice relation, carts
+    included, since a code reserves its redemption when it is added to the
+    cart and gives it back when it is removed. vendor has no abandoned or void
+    invoice status, carts that are deleted drop their links. Campaigns also
+    count their CampaignRedemption rows, for the invoices they were applied to
+    without a code, and signed code campaigns count their SignedCodeRedemption
+    rows instead. Each model is updated with one
+    UPDATE ... SET redemption_count = (SELECT COUNT ...).
+    Returns the number of coupon codes and campaigns updated.
+    """
+    CouponCodeInvoice = CouponCode.invoice.through
+    coupon_codes = CouponCode.objects.all()
+    promotional_campaigns = PromotionalCampaign.objects.all()
+
+    if site is not None:
+        coupon_codes = coupon_codes.filter(site=site)
+        promotional_campaigns = promotional_campaigns.filter(site=site)
+
+    coupon_code_redemptions = CouponCodeInvoice.objects.filter(couponcode=OuterRef('pk')).order_by().values('couponcode').annotate(count=Count('pk')).values('count')
+    campaign_redemptions = CouponCodeInvoice.objects.filter(couponcode__promo=OuterRef('pk')).order_by().values('couponcode__promo').annotate(count=Count('pk')).values('count')
+    signed_code_redemptions = SignedCodeRedemption.objects.filter(promo=OuterRef('pk')).order_by().values('promo').annotate(count=Count('pk')).values('count')
+    codeless_redemptions = CampaignRedemption.objects.filter(promo=OuterRef('pk')).order_by().values('promo').annotate(count=Count('pk')).values('count')
+
+    with transaction.atomic():
+        coupon_code_count = coupon_codes.update(redemption_count=Coalesce(Subquery(coupon_code_redemptions), 0))
+        campaign_count = promotional_campaigns.update(redemption_count=Case(
+            When(code_mode=CodeMode.SIGNED, then=Coalesce(Subquery(signed_code_redemptions), 0)),
+            default=Coalesce(Subquery(campaign_redemptions), 0) + Coalesce(Subquery(codeless_redemptions), 0),
+        ))
+
+    return coupon_code_count, campaign_count
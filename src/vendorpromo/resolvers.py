@@ -0,0 +1,107 @@
+"""
+Resolvers load everything the checkout views need for a coupon code and an
+invoice up front, so the number of queries stays the same no matter how many
+items are in the cart. Helpers in this module only read from the prefetched
+relations and never hit the database on their own.
+"""
+from django.utils import timezone
+from vendor.config import DEFAULT_CURRENCY
+from vendor.models import Invoice, OrderItem
+
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.utils import normalize_code
+
+
+def get_coupon_code_queryset():
+    """
+    CouponCode queryset that joins the campaign and its offer and prefetches
+    the offer's products and prices (3 queries).
+    """
+    return CouponCode.objects.select_related(
+        'promo',
+        'promo__applies_to'
+    ).prefetch_related(
+        'promo__applies_to__products',
+        'promo__applies_to__prices'
+    )
+
+
+def get_promotional_campaign_queryset():
+    """
+    PromotionalCampaign queryset that joins the offer and prefetches its
+    products and prices (3 queries).
+    """
+    return PromotionalCampaign.objects.select_related('applies_to').prefetch_related('applies_to__products', 'applies_to__prices')
+
+
+def get_invoice_queryset():
+    return Invoice.objects.select_related('site', 'profile')
+
+
+def get_order_item_queryset(invoice):
+    """
+    OrderItem queryset for the invoice that joins the offer and prefetches
+    its products and prices (3 queries).
+    """
+    return OrderItem.objects.filter(invoice=invoice).select_related('offer').prefetch_related('offer__products', 'offer__prices')
+
+
+def resolve_coupon_code(code, site):
+    """
+    Returns the CouponCode for the code on the site or raises CouponCode.DoesNotExist.
+    """
+    return get_coupon_code_queryset().get(normalized_code=normalize_code(code), site=site)
+
+
+def resolve_order_items(invoice):
+    """
+    Returns the invoice's order items as a list so the prefetched relations
+    are not tied to the invoice instance, which vendor keeps updating while
+    offers are added or removed.
+    """
+    return list(get_order_item_queryset(invoice))
+
+
+def get_product_ids(offer):
+    return frozenset(product.pk for product in offer.products.all())
+
+
+def get_order_items_product_ids(order_items):
+    return frozenset(product.pk for order_item in order_items for product in order_item.offer.products.all())
+
+
+def get_current_price(offer, currency=DEFAULT_CURRENCY):
+    """
+    Same as Offer.current_price but reads from the prefetched prices.
+    """
+    now = timezone.now()
+    prices = [price for price in offer.prices.all()
+              if (price.start_date is None or price.start_date <= now)
+              and (price.end_date is None or price.end_date >= now)
+              and price.currency == currency]
+
+    if not prices:
+        return offer.get_msrp(currency)
+
+    price = max(prices, key=lambda price: price.priority or 0)
+
+    if price.cost is None:
+        return offer.get_msrp(currency)
+
+    return price.cost
+
+
+def get_order_item_price(order_item):
+    """
+    Same as OrderItem.price but reads from the prefetched offer relations.
+    """
+    msrp = order_item.offer.get_msrp()
+
+    if msrp:
+        return msrp
+
+    return get_current_price(order_item.offer)
+
+
+def get_order_item_total(order_item):
+    return order_item.quantity * get_order_item_price(order_item)
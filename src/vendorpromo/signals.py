@@ -0,0 +1,152 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from integrations.models import Credential
+from siteconfigs.models import SiteConfigModel
+from vendor.models import Invoice, Offer, OrderItem, Price
+from vendor.models.choice import InvoiceStatus
+from vendor.models.base import get_product_model
+
+from vendorpromo.campaign_index import campaign_index
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.processors import (PROCESSOR_CONFIG_KEY, processor_pool,
+                                    processor_table)
+from vendorpromo.redemptions import release_offer_redemptions
+
+
+##########
+# Utils
+##########
+def get_offer_pks_from_m2m_changed(instance, action, pk_set):
+    if isinstance(instance, Offer):
+        return {instance.pk}
+
+    if action == 'pre_clear':
+        return set(instance.offers.values_list('pk', flat=True))
+
+    return set(pk_set or [])
+
+
+def refresh_offer_campaigns(offer_pks):
+    site_campaigns = defaultdict(list)
+
+    for campaign_pk, site_id in PromotionalCampaign.objects.filter(applies_to__in=offer_pks).values_list('pk', 'site_id'):
+        site_campaigns[site_id].append(campaign_pk)
+
+    for site_id, campaign_pks in site_campaigns.items():
+        refresh_campaigns(site_id, campaign_pks)
+
+
+def refresh_campaigns(site_id, campaign_pks):
+    coupon_table.refresh_campaigns(site_id, campaign_pks)
+    campaign_index.refresh_campaigns(site_id, campaign_pks)
+
+
+def remove_campaigns(site_id, campaign_pks):
+    coupon_table.remove_campaigns(site_id, campaign_pks)
+    campaign_index.remove_campaigns(site_id, campaign_pks)
+
+
+##########
+# Coupon Table and Campaign Index
+##########
+# Changes are applied once the transaction commits so other processes never
+# see a table compiled from data that could still be rolled back.
+@receiver(post_save, sender=CouponCode)
+def coupon_code_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return None
+
+    transaction.on_commit(lambda: coupon_table.refresh_coupon_code(instance))
+
+
+@receiver(post_delete, sender=CouponCode)
+def coupon_code_deleted(sender, instance, **kwargs):
+    site_id = instance.site_id
+    coupon_code_pk = instance.pk  # Deleted instances lose their pk before the transaction commits
+    transaction.on_commit(lambda: coupon_table.remove(site_id, [coupon_code_pk]))
+
+
+@receiver(post_save, sender=PromotionalCampaign)
+def promotional_campaign_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return None
+
+    transaction.on_commit(lambda: refresh_campaigns(instance.site_id, [instance.pk]))
+
+
+@receiver(post_delete, sender=PromotionalCampaign)
+def promotional_campaign_deleted(sender, instance, **kwargs):
+    site_id, campaign_pk = instance.site_id, instance.pk
+    transaction.on_commit(lambda: remove_campaigns(site_id, [campaign_pk]))
+
+
+@receiver(m2m_changed, sender=get_product_model().offers.through)
+def offer_products_changed(sender, instance, action, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return None
+
+    if action == 'pre_clear' and isinstance(instance, Offer):
+        return None
+
+    if action == 'post_clear' and not isinstance(instance, Offer):
+        return None
+
+    offer_pks = get_offer_pks_from_m2m_changed(instance, action, pk_set)
+    transaction.on_commit(lambda: refresh_offer_campaigns(offer_pks))
+
+
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def offer_price_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return None
+
+    transaction.on_commit(lambda: refresh_offer_campaigns([instance.offer_id]))
+
+
+##########
+# Redemptions
+##########
+# Redemptions are reserved when a promotion is applied to the cart, removing
+# its offer before the checkout completes gives them back.
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, **kwargs):
+    invoice = Invoice.objects.filter(pk=instance.invoice_id).exclude(status=InvoiceStatus.COMPLETE).first()
+
+    if invoice is None or not Offer.objects.filter(pk=instance.offer_id, is_promotional=True).exists():
+        return None
+
+    release_offer_redemptions(invoice, instance.offer_id)
+
+
+##########
+# Promo Processor
+##########
+def invalidate_site_processor(site_id):
+    processor_table.invalidate(site_id)
+    processor_pool.invalidate(site_id)
+
+
+# Invalidated right away and again once the transaction commits, so a process
+# that read the old config in between does not keep it.
+@receiver(post_save, sender=SiteConfigModel)
+@receiver(post_delete, sender=SiteConfigModel)
+def site_config_changed(sender, instance, **kwargs):
+    if instance.key != PROCESSOR_CONFIG_KEY:
+        return None
+
+    invalidate_site_processor(instance.site_id)
+    transaction.on_commit(lambda: invalidate_site_processor(instance.site_id))
+
+
+# Processors are created with the site's credentials, VoucheryIntegration.save
+# and vendor's StripeIntegration store them as a Credential.
+@receiver(post_save, sender=Credential)
+@receiver(post_delete, sender=Credential)
+def credential_changed(sender, instance, **kwargs):
+    processor_pool.invalidate(instance.site_id)
+    transaction.on_commit(lambda: processor_pool.invalidate(instance.site_id))
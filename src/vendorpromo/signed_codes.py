@@ -0,0 +1,121 @@
+"""
+Self-validating signed coupon codes.
+
+Campaigns in the signed code mode have no CouponCode rows. Each code packs
+the campaign id and a serial number with a truncated HMAC-SHA256 tag of
+both into 15 bytes, written as 24 base32 characters in groups of 4. Checking
+a code only takes the HMAC, so mistyped or forged codes are rejected without
+a query, and only redemptions are stored, one SignedCodeRedemption per serial.
+
+Serials are handed out in increasing order by issue_signed_codes() from the
+campaign's signed_code_count, so a serial is never issued twice.
+"""
+import base64
+import binascii
+import hmac
+import struct
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+
+from vendorpromo.config import VENDOR_PROMO_SIGNED_CODE_SECRET
+from vendorpromo.coupon_table import CompiledCoupon, compile_campaign
+from vendorpromo.models import CodeMode, PromotionalCampaign
+from vendorpromo.resolvers import get_promotional_campaign_queryset
+from vendorpromo.utils import normalize_code
+
+SignedCode = namedtuple('SignedCode', ['campaign_pk', 'serial'])
+
+PAYLOAD = struct.Struct('>II')  # Campaign id and serial
+TAG_SIZE = 7
+CODE_LENGTH = 24  # base32 of the payload and tag, without padding
+GROUP_SIZE = 4
+MAX_SERIAL = 2 ** 32 - 1
+
+
+def get_tag(payload):
+    return salted_hmac("vendorpromo.signed_codes", payload, secret=VENDOR_PROMO_SIGNED_CODE_SECRET, algorithm='sha256').digest()[:TAG_SIZE]
+
+
+def sign_code(campaign_pk, serial):
+    """
+    Returns the signed code for the serial of the campaign, e.g. ABCD-EFGH-...
+    """
+    payload = PAYLOAD.pack(campaign_pk, serial)
+    code = base64.b32encode(payload + get_tag(payload)).decode()
+
+    return "-".join(code[index:index + GROUP_SIZE] for index in range(0, CODE_LENGTH, GROUP_SIZE))
+
+
+def parse_code(code):
+    """
+    Returns the SignedCode in the code or None if the code is not a signed
+    code or its signature does not match.
+    """
+    code = normalize_code(code)
+
+    if code is None:
+        return None
+
+    code = code.replace("-", "").replace(" ", "").upper()
+
+    if len(code) != CODE_LENGTH:
+        return None
+
+    try:
+        data = base64.b32decode(code)
+    except (binascii.Error, ValueError):
+        return None
+
+    payload, tag = data[:PAYLOAD.size], data[PAYLOAD.size:]
+
+    if not hmac.compare_digest(tag, get_tag(payload)):
+        return None
+
+    return SignedCode(*PAYLOAD.unpack(payload))
+
+
+def resolve_signed_code(site_id, code):
+    """
+    Returns a CompiledCoupon for a valid signed code of a signed code campaign
+    on the site or None. The CompiledCoupon has no pk since there is no
+    Coupon Code behind it, and no stack group, signed codes are applied on
+    their own.
+    """
+    signed_code = parse_code(code)
+
+    if signed_code is None:
+        return None
+
+    promotional_campaign = get_promotional_campaign_queryset().filter(pk=signed_code.campaign_pk, site=site_id, code_mode=CodeMode.SIGNED).first()
+
+    if promotional_campaign is None or signed_code.serial >= promotional_campaign.signed_code_count:
+        return None
+
+    return CompiledCoupon(pk=None, code=sign_code(*signed_code), active=True, **dict(compile_campaign(promotional_campaign), stack_group=None, stack_limit=None))
+
+
+def issue_signed_codes(promotional_campaign, count):
+    """
+    Reserves the next count serials of the campaign and returns a generator
+    with their signed codes.
+    """
+    if promotional_campaign.code_mode != CodeMode.SIGNED:
+        raise ValueError("The campaign does not use signed codes")
+
+    # Lowering the count would take back serials already issued and issue them again
+    if count <= 0:
+        raise ValueError(f"Can not issue {count} codes, the count must be positive")
+
+    with transaction.atomic():
+        PromotionalCampaign.objects.filter(pk=promotional_campaign.pk).update(signed_code_count=F('signed_code_count') + count)
+        end = PromotionalCampaign.objects.values_list('signed_code_count', flat=True).get(pk=promotional_campaign.pk)
+
+        if end - 1 > MAX_SERIAL:
+            raise ValueError(f"Can not issue {count} codes, the campaign can have at most {MAX_SERIAL + 1} signed codes")
+
+    promotional_campaign.signed_code_count = end
+
+    return (sign_code(promotional_campaign.pk, serial) for serial in range(end - count, end))
@@ -0,0 +1,178 @@
+"""
+Stacking several coupon codes on one invoice.
+
+Campaigns opt in with a stack group: codes can only be applied together when
+all their campaigns share the same stack group, and never more of them than
+the lowest stack limit among those campaigns. The discounts of a stack add
+up per cart line, capped at the line total, so two coupons on the same line
+never discount more than the line is worth.
+
+The solver picks the subset of the candidate codes that saves the most with
+a branch and bound search. Candidates are explored from the highest to the
+lowest standalone saving, and a branch is cut as soon as the current saving
+plus the standalone savings of the best remaining candidates that still fit
+in the stack can not beat the best stack found so far.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+from vendor.models import Offer
+
+from vendorpromo.campaign_index import is_campaign_running
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.discounts import calculate_discount
+from vendorpromo.models import CouponCode
+
+
+def get_applied_coupons(invoice, order_items):
+    """
+    Returns (compiled_coupons, offer_pks) with the CompiledCoupon of the coupon
+    codes applied to the invoice that are still active and within their dates,
+    and the promotional offers in the cart that were not added by a coupon
+    code, like auto apply campaigns. The offers of codes that lapsed since they
+    were applied are in neither, so write_stack removes them.
+    """
+    promotional_offer_pks = set(order_item.offer_id for order_item in order_items if order_item.offer.is_promotional)
+
+    if not promotional_offer_pks:
+        return [], set()
+
+    now = timezone.now()
+    compiled_coupons, coupon_offer_pks = [], set()
+    for pk, code in CouponCode.objects.filter(invoice=invoice, promo__applies_to__in=promotional_offer_pks).values_list('pk', 'normalized_code'):
+        compiled_coupon = coupon_table.lookup(invoice.site_id, code)
+
+        if compiled_coupon is None or compiled_coupon.pk != pk:
+            continue
+
+        coupon_offer_pks.add(compiled_coupon.offer_pk)
+
+        if compiled_coupon.active and is_campaign_running(compiled_coupon, now):
+            compiled_coupons.append(compiled_coupon)
+
+    return compiled_coupons, promotional_offer_pks - coupon_offer_pks
+
+
+def can_stack(compiled_coupons):
+    """
+    Returns True if the coupons share a stack group, regardless of the stack
+    limits. A single coupon can always be applied on its own.
+    """
+    stack_groups = set(compiled_coupon.stack_group for compiled_coupon in compiled_coupons)
+
+    return len(compiled_coupons) <= 1 or (len(stack_groups) == 1 and None not in stack_groups)
+
+
+def get_stack_limit(compiled_coupons):
+    stack_limits = [compiled_coupon.stack_limit for compiled_coupon in compiled_coupons if compiled_coupon.stack_limit]
+
+    return min(stack_limits) if stack_limits else None
+
+
+def get_stack_total(cart_lines, coupon_discounts, subtotal=None):
+    """
+    Returns the amount saved by the discounts together. Line discounts are
+    capped at each line total and global discounts at what is left of the
+    subtotal.
+    """
+    line_totals = {cart_line.pk: cart_line.total for cart_line in cart_lines}
+    line_discounts = defaultdict(int)
+    global_discount = 0
+
+    if subtotal is None:
+        subtotal = sum(line_totals.values())
+
+    for coupon_discount in coupon_discounts:
+        if coupon_discount.line_discounts:
+            for pk, line_discount in coupon_discount.line_discounts.items():
+                line_discounts[pk] += line_discount
+        else:
+            global_discount += coupon_discount.total
+
+    lines_total = sum(min(line_discount, line_totals[pk]) for pk, line_discount in line_discounts.items())
+
+    return lines_total + min(global_discount, max(subtotal - lines_total, 0))
+
+
+def solve_stack(cart_lines, compiled_coupons, subtotal=None):
+    """
+    Returns (stack, total) where stack is a list of (CompiledCoupon, CouponDiscount)
+    for the combination of the coupons that saves the most on the cart.
+    """
+    candidates = []
+
+    for compiled_coupon in {compiled_coupon.pk: compiled_coupon for compiled_coupon in compiled_coupons}.values():
+        coupon_discount = calculate_discount(cart_lines, compiled_coupon, subtotal)
+
+        if coupon_discount.total > 0:
+            candidates.append((compiled_coupon, coupon_discount))
+
+    candidates.sort(key=lambda candidate: (-candidate[1].total, candidate[0].pk))
+
+    best = {'stack': [], 'total': 0}
+
+    def search(start, stack, total):
+        if total > best['total']:
+            best['stack'], best['total'] = list(stack), total
+
+        stack_limit = get_stack_limit([compiled_coupon for compiled_coupon, _ in stack])
+
+        for index in range(start, len(candidates)):
+            compiled_coupon, coupon_discount = candidates[index]
+            next_stack = stack + [candidates[index]]
+            next_coupons = [next_compiled_coupon for next_compiled_coupon, _ in next_stack]
+
+            if not can_stack(next_coupons):
+                continue
+
+            next_limit = get_stack_limit(next_coupons)
+
+            if next_limit is not None and len(next_stack) > next_limit:
+                continue
+
+            # Candidates are sorted, so no later branch can do better than
+            # the best coupons left that still fit in the stack.
+            room = len(candidates) if stack_limit is None else stack_limit - len(stack)
+            bound = total + sum(candidate_discount.total for _, candidate_discount in candidates[index:index + room])
+
+            if bound <= best['total']:
+                break
+
+            search(index + 1, next_stack, get_stack_total(cart_lines, [next_discount for _, next_discount in next_stack], subtotal))
+
+    search(0, [], 0)
+
+    return best['stack'], best['total']
+
+
+def write_stack(invoice, order_items, stack, total):
+    """
+    Replaces the promotional order items of the invoice with the offers of the
+    stack and sets the global discount, in one transaction. New offers are
+    added with invoice.add_offer so vendor's bookkeeping runs as for any other
+    offer, the global discount it resets is set last. Fixed amount coupons are
+    written as the quantity of their order item and everything else the stack
+    saves goes to the global discount.
+    """
+    quantities = {
+        compiled_coupon.offer_pk: 1 if coupon_discount.coupon_quantity is None else coupon_discount.coupon_quantity
+        for compiled_coupon, coupon_discount in stack
+    }
+    fixed_total = sum(coupon_discount.total for compiled_coupon, coupon_discount in stack if not compiled_coupon.is_percent_off)
+    promotional_order_items = {order_item.offer_id: order_item for order_item in order_items if order_item.offer.is_promotional}
+
+    with transaction.atomic():
+        invoice.order_items.filter(offer__is_promotional=True).exclude(offer__in=list(quantities)).delete()
+        new_offers = Offer.objects.in_bulk([offer_pk for offer_pk in quantities if offer_pk not in promotional_order_items])
+
+        for offer_pk, quantity in quantities.items():
+            order_item = promotional_order_items.get(offer_pk) or invoice.add_offer(new_offers[offer_pk])
+
+            if order_item.quantity != quantity:
+                order_item.quantity = quantity
+                order_item.save()
+
+        invoice.global_discount = max(total - fixed_total, 0)
+        invoice.update_totals()
+        invoice.save()
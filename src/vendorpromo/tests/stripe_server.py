@@ -0,0 +1,211 @@
+"""
+Local stand in for the Stripe API used by the Stripe processor tests. Point
+the stripe library at it with use(). It keeps the objects created through it
+per resource, e.g. coupons or promotion_codes, answers retrieve, update,
+delete and list calls from them, with list pagination by limit and
+starting_after, and replays the response of a create call made again with
+the same Idempotency-Key like Stripe does. Params Stripe stores as numbers
+or booleans are stored typed, and created objects start with Stripe's
+defaults. Updates with params Stripe does not let change are rejected.
+add_failures() makes the next calls to a path fail.
+"""
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import stripe
+
+# Object name of each resource's objects
+OBJECT_NAMES = {
+    'coupons': 'coupon',
+    'promotion_codes': 'promotion_code',
+}
+
+ID_PREFIXES = {
+    'coupons': 'co',
+    'promotion_codes': 'promo',
+}
+
+# Fields a created object starts with
+DEFAULTS = {
+    'coupons': {'times_redeemed': 0, 'valid': True},
+    'promotion_codes': {'times_redeemed': 0, 'active': True},
+}
+
+# Params an update can change
+UPDATABLE_PARAMS = {
+    'coupons': ('metadata', 'name'),
+    'promotion_codes': ('active', 'metadata', 'restrictions'),
+}
+
+# Params that Stripe stores as a number or boolean
+TYPED_PARAMS = {
+    'active': lambda value: value.lower() == "true",
+    'amount_off': int,
+    'duration_in_months': int,
+    'expires_at': int,
+    'max_redemptions': int,
+    'percent_off': float,
+    'redeem_by': int,
+}
+
+
+def parse_params(query):
+    """
+    Returns the nested dict of Stripe's form encoded params, e.g.
+    metadata[site]=1 becomes {'metadata': {'site': '1'}}.
+    """
+    params = {}
+
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        keys = re.findall(r"[^\[\]]+", key)
+        parent = params
+
+        for name in keys[:-1]:
+            parent = parent.setdefault(name, {})
+
+        parent[keys[-1]] = TYPED_PARAMS[key](value) if key in TYPED_PARAMS and value != "" else value
+
+    return params
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def handle_api(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        url = urlsplit(self.path)
+        params = parse_params(body or url.query)
+        idempotency_key = self.headers.get('Idempotency-Key')
+
+        with self.server.lock:
+            self.server.requests.append((self.command, url.path, params, idempotency_key))
+            status, content = self.server.get_response(self.command, url.path, params, idempotency_key)
+
+        content = json.dumps(content).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_DELETE = handle_api
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeStripeHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.objects = {resource: {} for resource in OBJECT_NAMES}
+        self.idempotent_responses = {}
+        self.failures = {}
+        self.count = 0
+        self.thread = None
+        self.api_base = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_failures(self, method, path, count, status=500):
+        self.failures[(method, path)] = (count, status)
+
+    def add_object(self, resource, **fields):
+        """
+        Stores an object as if it had been created in Stripe before and
+        returns it.
+        """
+        self.count += 1
+        stripe_object = {'id': f"{ID_PREFIXES[resource]}_{self.count}", 'object': OBJECT_NAMES[resource], 'metadata': {}, **DEFAULTS[resource], **fields}
+        self.objects[resource][stripe_object['id']] = stripe_object
+        return stripe_object
+
+    def get_requests(self, method, path):
+        return [request for request in self.requests if request[:2] == (method, path)]
+
+    def get_error(self, status, message, error_type="invalid_request_error"):
+        return (status, {'error': {'type': error_type, 'message': message}})
+
+    def get_response(self, method, path, params, idempotency_key=None):
+        count, status = self.failures.get((method, path), (0, None))
+
+        if count:
+            self.failures[(method, path)] = (count - 1, status)
+            return self.get_error(status, "Unavailable", "api_error")
+
+        if method == "POST" and idempotency_key in self.idempotent_responses:
+            return self.idempotent_responses[idempotency_key]
+
+        segments = path.strip("/").split("/")[1:]
+        resource = segments[0] if segments else None
+
+        if resource not in self.objects:
+            return self.get_error(404, f"Unrecognized request URL ({method}: {path})")
+
+        if len(segments) == 1:
+            if method == "POST":
+                response = (200, self.add_object(resource, **params))
+
+                if idempotency_key:
+                    self.idempotent_responses[idempotency_key] = response
+
+                return response
+
+            return (200, self.list_objects(resource, path, params))
+
+        stripe_object = self.objects[resource].get(segments[1])
+
+        if stripe_object is None:
+            return self.get_error(404, f"No such {OBJECT_NAMES[resource]}: '{segments[1]}'")
+
+        if method == "POST":
+            unknown_params = sorted(set(params) - set(UPDATABLE_PARAMS[resource]))
+
+            if unknown_params:
+                return self.get_error(400, f"Received unknown parameter: {unknown_params[0]}")
+
+            stripe_object.update(params)
+        elif method == "DELETE":
+            del self.objects[resource][segments[1]]
+            return (200, {'id': segments[1], 'object': OBJECT_NAMES[resource], 'deleted': True})
+
+        return (200, stripe_object)
+
+    def list_objects(self, resource, path, params):
+        stripe_objects = list(self.objects[resource].values())
+        limit = int(params.get('limit') or 10)
+
+        if params.get('starting_after'):
+            ids = [stripe_object['id'] for stripe_object in stripe_objects]
+            stripe_objects = stripe_objects[ids.index(params['starting_after']) + 1:]
+
+        return {'object': 'list', 'url': path, 'data': stripe_objects[:limit], 'has_more': len(stripe_objects) > limit}
+
+    def use(self):
+        """
+        Sends the stripe library's calls to the server until stop().
+        """
+        self.api_base = stripe.api_base
+        stripe.api_base = self.url
+        return self
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self.thread.start()
+        return self.use()
+
+    def stop(self):
+        stripe.api_base = self.api_base
+        self.shutdown()
+        self.server_close()
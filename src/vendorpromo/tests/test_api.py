@@ -1,10 +1,14 @@
 import math
+from urllib.parse import urlencode
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import AsyncClient, Client, TestCase
 from django.urls import reverse
+from django.utils import timezone
 from vendor.models import CustomerProfile, Invoice, Receipt, Offer
 
+from vendorpromo.coupon_table import coupon_table
 from vendorpromo.models import CouponCode
 
 User = get_user_model()
@@ -85,6 +89,54 @@ class ValidateCouponCodeCheckoutProcessAPIViewTest(TestCase):
         self.assertNotEquals(current_total, self.existing_invoice.total)
         self.assertEquals(current_subtotal - (should_be_coupon_discount + current_discount), self.existing_invoice.total)
 
+    def test_apply_coupon_max_redemptions_reached(self):
+        Receipt.objects.filter(pk__gte=0).delete()
+        coupon_code = CouponCode.objects.get(pk=4)
+        CouponCode.objects.filter(pk=coupon_code.pk).update(max_redemptions=1, redemption_count=1)
+
+        response = self.client.post(self.url, {'promo_code': coupon_code.code})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("maximum redemptions", str(response.content))
+        self.assertFalse(coupon_code.invoice.filter(pk=self.existing_invoice.pk).exists())
+
+    def test_remove_coupon_offer_releases_redemption(self):
+        Receipt.objects.filter(pk__gte=0).delete()
+        coupon_code = CouponCode.objects.get(pk=4)
+
+        self.client.post(self.url, {'promo_code': coupon_code.code})
+        coupon_code.refresh_from_db()
+        self.assertEqual(coupon_code.redemption_count, 1)
+
+        self.existing_invoice.refresh_from_db()
+        self.existing_invoice.remove_offer(coupon_code.promo.applies_to, clear=True)
+
+        coupon_code.refresh_from_db()
+        self.assertEqual(coupon_code.redemption_count, 0)
+        self.assertFalse(coupon_code.invoice.filter(pk=self.existing_invoice.pk).exists())
+
+    def test_inactive_code_is_rejected_when_table_is_stale(self):
+        Receipt.objects.filter(pk__gte=0).delete()
+        coupon_code = CouponCode.objects.get(pk=4)
+        self.assertTrue(coupon_table.lookup(coupon_code.site_id, coupon_code.code).active)
+        # Changed without the signals, like a change the table has not heard of yet
+        CouponCode.objects.filter(pk=coupon_code.pk).update(active=False)
+
+        response = self.client.post(self.url, {'promo_code': coupon_code.code})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(coupon_code.invoice.filter(pk=self.existing_invoice.pk).exists())
+
+    def test_expired_code_is_rejected(self):
+        Receipt.objects.filter(pk__gte=0).delete()
+        coupon_code = CouponCode.objects.get(pk=4)
+        CouponCode.objects.filter(pk=coupon_code.pk).update(end_date=timezone.now() - timezone.timedelta(days=1))
+
+        response = self.client.post(self.url, {'promo_code': coupon_code.code})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("Code has expired", str(response.content))
+
     def test_apply_coupon_percent_off_on_invoice(self):
         self.existing_invoice.empty_cart()
         self.existing_invoice.add_offer(Offer.objects.get(pk=6))
@@ -149,3 +201,41 @@ class ValidateCouponCodeCheckoutProcessAPIViewTest(TestCase):
         response = self.client.post(self.url, {'promo_code': single_product_coupon_fixed.code})
 
         self.assertIn("Code does not apply to any of the products in you cart", str(response.content))
+
+
+class AsyncValidateCouponCodeCheckoutProcessAPIViewTest(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.client = AsyncClient()
+        self.user = User.objects.get(pk=1)
+        self.client.force_login(self.user)
+        self.existing_invoice = Invoice.objects.get(pk=1)
+        self.url = reverse('checkout-validation-coupon-code-async', kwargs={'invoice_uuid': self.existing_invoice.uuid})
+
+    def post(self, data):
+        # Django 3.2's AsyncClient can not send multipart form data
+        return self.client.post(self.url, urlencode(data), content_type="application/x-www-form-urlencoded")
+
+    async def test_apply_coupon(self):
+        await sync_to_async(Receipt.objects.filter(pk__gte=0).delete)()
+        coupon_code = await sync_to_async(CouponCode.objects.get)(pk=4)
+
+        response = await self.post({'promo_code': coupon_code.code})
+
+        self.assertIn("Promo Code Applied", str(response.content))
+        self.assertTrue(await sync_to_async(coupon_code.invoice.filter(pk=self.existing_invoice.pk).exists)())
+
+    async def test_return_invalid_code(self):
+        response = await self.post({'promo_code': "invalid_code"})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("Invalid Code", str(response.content))
+
+    async def test_login_required(self):
+        await sync_to_async(self.client.logout)()
+
+        response = await self.post({'promo_code': "invalid_code"})
+
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,118 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+from vendor.models import CustomerProfile, Invoice, Receipt
+
+from vendorpromo.auto_apply import (apply_best_campaign, get_best_campaign,
+                                    rank_auto_apply_campaigns)
+from vendorpromo.campaign_index import campaign_index
+from vendorpromo.discounts import get_cart_snapshot
+from vendorpromo.models import CampaignRedemption, CouponCode, PromotionalCampaign
+from vendorpromo.resolvers import resolve_order_items
+
+User = get_user_model()
+
+
+class AutoApplyTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        campaign_index.clear()
+        Receipt.objects.filter(pk__gte=0).delete()
+        self.invoice = Invoice.objects.get(pk=1)
+        self.invoice.update_totals()
+        self.percent_campaign = CouponCode.objects.get(pk=4).promo
+        self.fixed_campaign = CouponCode.objects.get(pk=3).promo
+        PromotionalCampaign.objects.filter(pk__in=[self.percent_campaign.pk, self.fixed_campaign.pk]).update(auto_apply=True)
+
+    def tearDown(self):
+        campaign_index.clear()
+
+    def test_rank_auto_apply_campaigns(self):
+        cart_lines = get_cart_snapshot(resolve_order_items(self.invoice))
+        ranked_campaigns = rank_auto_apply_campaigns(self.invoice.site_id, cart_lines)
+        discount_totals = [coupon_discount.total for _, coupon_discount in ranked_campaigns]
+
+        self.assertEqual(set(indexed_campaign.pk for indexed_campaign, _ in ranked_campaigns), {self.percent_campaign.pk, self.fixed_campaign.pk})
+        self.assertEqual(discount_totals, sorted(discount_totals, reverse=True))
+
+    def test_get_best_campaign_ignores_campaigns_without_auto_apply(self):
+        PromotionalCampaign.objects.update(auto_apply=False)
+
+        self.assertIsNone(get_best_campaign(self.invoice))
+
+    def test_get_best_campaign_does_not_query_once_indexed(self):
+        order_items = resolve_order_items(self.invoice)
+        get_best_campaign(self.invoice, order_items)
+
+        with self.assertNumQueries(0):
+            get_best_campaign(self.invoice, order_items)
+
+    def test_apply_best_campaign(self):
+        best_campaign, coupon_discount = get_best_campaign(self.invoice)
+        current_discount = self.invoice.get_discounts()
+
+        indexed_campaign = apply_best_campaign(self.invoice)
+
+        self.invoice.refresh_from_db()
+        self.invoice.update_totals()
+        self.assertEqual(indexed_campaign.pk, best_campaign.pk)
+        self.assertTrue(self.invoice.order_items.filter(offer=best_campaign.offer_pk).exists())
+        self.assertAlmostEqual(float(current_discount + coupon_discount.total), float(self.invoice.get_discounts()))
+        self.assertEqual(PromotionalCampaign.objects.get(pk=best_campaign.pk).redemption_count, 1)
+        self.assertIsNone(apply_best_campaign(self.invoice))
+
+    def test_apply_best_campaign_skips_campaigns_at_max_redemptions(self):
+        best_campaign, _ = get_best_campaign(self.invoice)
+        PromotionalCampaign.objects.filter(pk=best_campaign.pk).update(max_redemptions=0)
+
+        indexed_campaign = apply_best_campaign(self.invoice)
+
+        self.assertNotEqual(indexed_campaign.pk, best_campaign.pk)
+
+    def test_apply_best_campaign_skips_owned_products(self):
+        with mock.patch.object(CustomerProfile, 'has_owned_product', return_value=True):
+            self.assertIsNone(apply_best_campaign(self.invoice))
+
+        self.assertFalse(self.invoice.order_items.filter(offer__is_promotional=True).exists())
+        self.assertFalse(PromotionalCampaign.objects.filter(redemption_count__gt=0).exists())
+
+    def test_failed_discount_does_not_keep_the_redemption(self):
+        with mock.patch('vendorpromo.auto_apply.apply_discount', side_effect=ValueError("discount failed")):
+            with self.assertRaises(ValueError):
+                apply_best_campaign(self.invoice)
+
+        self.assertFalse(PromotionalCampaign.objects.filter(redemption_count__gt=0).exists())
+        self.assertFalse(CampaignRedemption.objects.filter(invoice=self.invoice).exists())
+        self.assertFalse(self.invoice.order_items.filter(offer__is_promotional=True).exists())
+
+    def test_removed_offer_releases_redemption(self):
+        indexed_campaign = apply_best_campaign(self.invoice)
+
+        self.invoice.refresh_from_db()
+        self.invoice.remove_offer(self.invoice.order_items.get(offer=indexed_campaign.offer_pk).offer, clear=True)
+
+        self.assertEqual(PromotionalCampaign.objects.get(pk=indexed_campaign.pk).redemption_count, 0)
+
+    def test_removed_offer_releases_only_the_reserved_campaign(self):
+        indexed_campaign = apply_best_campaign(self.invoice)
+        self.assertTrue(CampaignRedemption.objects.filter(promo=indexed_campaign.pk, invoice=self.invoice).exists())
+        other_campaign = PromotionalCampaign.objects.create(name="Other Auto Campaign", applies_to_id=indexed_campaign.offer_pk, site=self.invoice.site, auto_apply=True, redemption_count=1)
+
+        self.invoice.refresh_from_db()
+        self.invoice.remove_offer(self.invoice.order_items.get(offer=indexed_campaign.offer_pk).offer, clear=True)
+
+        self.assertEqual(PromotionalCampaign.objects.get(pk=indexed_campaign.pk).redemption_count, 0)
+        self.assertEqual(PromotionalCampaign.objects.get(pk=other_campaign.pk).redemption_count, 1)
+        self.assertFalse(CampaignRedemption.objects.filter(invoice=self.invoice).exists())
+
+    def test_auto_apply_api_view(self):
+        client = Client()
+        client.force_login(User.objects.get(pk=1))
+
+        response = client.post(reverse('checkout-auto-apply', kwargs={'invoice_uuid': self.invoice.uuid}))
+
+        self.assertIn("Promotion Applied", str(response.content))
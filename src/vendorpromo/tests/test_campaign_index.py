@@ -0,0 +1,73 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from vendor.models import Offer
+
+from vendorpromo.campaign_index import campaign_index
+from vendorpromo.models import PromotionalCampaign
+
+
+class CampaignIndexTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        campaign_index.clear()
+        self.promotional_campaign = PromotionalCampaign.objects.get(pk=4)
+        self.site_id = self.promotional_campaign.site_id
+        self.product_pks = list(self.promotional_campaign.applies_to.products.values_list('pk', flat=True))
+
+    def tearDown(self):
+        campaign_index.clear()
+
+    def test_lookup_campaign_pks(self):
+        campaign_pks = campaign_index.lookup_campaign_pks(self.site_id, self.product_pks)
+
+        self.assertIn(self.promotional_campaign.pk, campaign_pks)
+        self.assertEqual(campaign_pks, set(PromotionalCampaign.objects.filter(site=self.site_id, applies_to__products__in=self.product_pks).values_list('pk', flat=True)))
+
+    def test_lookup_does_not_query_once_compiled(self):
+        campaign_index.lookup(self.site_id, self.product_pks)
+
+        with self.assertNumQueries(0):
+            campaign_index.lookup(self.site_id, self.product_pks + [0])
+
+    def test_lookup_checks_campaign_window(self):
+        now = timezone.now()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotional_campaign.start_date = now + timedelta(days=1)
+            self.promotional_campaign.save()
+
+        self.assertNotIn(self.promotional_campaign.pk, campaign_index.lookup_campaign_pks(self.site_id, self.product_pks, now=now))
+        self.assertIn(self.promotional_campaign.pk, campaign_index.lookup_campaign_pks(self.site_id, self.product_pks, now=now + timedelta(days=2)))
+
+    def test_campaign_delete_updates_index(self):
+        campaign_index.lookup(self.site_id, self.product_pks)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotional_campaign.delete()
+
+        self.assertNotIn(self.promotional_campaign.pk, campaign_index.lookup_campaign_pks(self.site_id, self.product_pks))
+
+    def test_offer_products_change_updates_index(self):
+        campaign_index.lookup(self.site_id, self.product_pks)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Offer.objects.get(pk=self.promotional_campaign.applies_to_id).products.clear()
+
+        self.assertNotIn(self.promotional_campaign.pk, campaign_index.lookup_campaign_pks(self.site_id, self.product_pks))
+
+    def test_campaign_save_patches_index(self):
+        campaign_index.lookup(self.site_id, self.product_pks)
+        now = timezone.now()
+
+        with mock.patch.object(campaign_index, 'compile', side_effect=AssertionError("compiled")):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.promotional_campaign.start_date = now + timedelta(days=1)
+                self.promotional_campaign.save()
+
+            self.assertNotIn(self.promotional_campaign.pk, campaign_index.lookup_campaign_pks(self.site_id, self.product_pks, now=now))
+            self.assertIn(self.promotional_campaign.pk, campaign_index.lookup_campaign_pks(self.site_id, self.product_pks, now=now + timedelta(days=2)))
@@ -0,0 +1,216 @@
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from integrations.models import Credential
+from vendor.models import Invoice, Receipt
+
+from vendorpromo.circuit_breaker import (CLOSED, FALLBACK_REJECT, HALF_OPEN,
+                                         OPEN, BreakerPolicy, CircuitBreaker,
+                                         CircuitOpenError)
+from vendorpromo.config import (VENDOR_PROMO_CIRCUIT_BREAKER_SITES,
+                                PromoProcessorSiteConfig)
+from vendorpromo.fallback import reconcile_deferred_validations
+from vendorpromo.http_sessions import close_sessions
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.models import CouponCode, DeferredValidation, ValidationKind
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+POLICY = BreakerPolicy(failure_rate=0.5, min_calls=4, slow_call_seconds=1, window=60, reset_timeout=0.1, fallback='local')
+
+
+def fail():
+    raise ValueError("Unavailable")
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test', 1, POLICY)
+
+    def tearDown(self):
+        cache.clear()
+
+    def open_circuit(self):
+        for _ in range(POLICY.min_calls):
+            with self.assertRaises(ValueError):
+                self.breaker.call(fail)
+
+    def test_circuit_opens_after_failures(self):
+        self.breaker.call(lambda: True)
+        self.breaker.call(lambda: True)
+
+        with self.assertRaises(ValueError):
+            self.breaker.call(fail)
+
+        self.assertEqual(self.breaker.get_state(), CLOSED)
+
+        with self.assertRaises(ValueError):
+            self.breaker.call(fail)
+
+        self.assertEqual(self.breaker.get_state(), OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: True)
+
+    def test_unsuccessful_result_is_a_failure(self):
+        for _ in range(POLICY.min_calls):
+            self.breaker.call(lambda: 503, lambda status_code: status_code < 500)
+
+        self.assertEqual(self.breaker.get_state(), OPEN)
+
+    def test_slow_call_is_a_failure(self):
+        self.breaker.policy = POLICY._replace(slow_call_seconds=0)
+
+        for _ in range(POLICY.min_calls):
+            self.breaker.call(lambda: time.sleep(0.001))
+
+        self.assertEqual(self.breaker.get_state(), OPEN)
+
+    def test_half_open_probe_closes_circuit(self):
+        self.open_circuit()
+        time.sleep(POLICY.reset_timeout)
+
+        self.assertEqual(self.breaker.get_state(), HALF_OPEN)
+        self.assertTrue(self.breaker.call(lambda: True))
+        self.assertEqual(self.breaker.get_state(), CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open_circuit()
+        time.sleep(POLICY.reset_timeout)
+
+        self.assertTrue(self.breaker.before_call())
+
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_failed_probe_opens_circuit(self):
+        self.open_circuit()
+        time.sleep(POLICY.reset_timeout)
+
+        with self.assertRaises(ValueError):
+            self.breaker.call(fail)
+
+        self.assertEqual(self.breaker.get_state(), OPEN)
+
+    def test_circuits_are_per_site(self):
+        self.open_circuit()
+
+        self.assertEqual(CircuitBreaker('test', 2, POLICY).get_state(), CLOSED)
+
+
+class VoucheryFallbackTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        cache.clear()
+        self.server = FakeVoucheryServer().start()
+        self.coupon_code = CouponCode.objects.get(pk=4)
+        self.site = self.coupon_code.promo.site
+        self.invoice = Invoice.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+        PromoProcessorSiteConfig(self.site).save("vouchery.VoucheryProcessor", "promo_processor")
+        self.processor = VoucheryProcessor(self.site, invoice=self.invoice)
+        self.processor.get_circuit_breaker().open()
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+        cache.clear()
+
+    def test_open_circuit_validates_locally(self):
+        with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+            self.assertTrue(self.processor.is_code_valid_on_checkout(self.coupon_code.code, 10))
+
+        deferred_validation = DeferredValidation.objects.get(code=self.coupon_code.code)
+
+        self.assertEqual((deferred_validation.site, deferred_validation.invoice, deferred_validation.offer_cost), (self.site, self.invoice, 10))
+        self.assertIsNone(deferred_validation.checked)
+        self.assertIn(self.coupon_code.code, self.invoice.vendor_notes['promos'])
+        self.assertEqual(self.server.requests, [])
+
+    def test_open_circuit_rejects_unknown_code(self):
+        with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+            self.assertFalse(self.processor.is_code_valid_on_checkout("UNKNOWN-CODE", 10))
+
+        self.assertFalse(DeferredValidation.objects.exists())
+
+    def test_reject_fallback(self):
+        with mock.patch.dict(VENDOR_PROMO_CIRCUIT_BREAKER_SITES, {self.site.pk: {'fallback': FALLBACK_REJECT}}):
+            with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+                self.assertFalse(self.processor.is_code_valid_on_checkout(self.coupon_code.code, 10))
+
+        self.assertFalse(DeferredValidation.objects.exists())
+
+    def test_is_code_valid_checks_the_voucher(self):
+        self.processor.get_circuit_breaker().close()
+        self.server.add_response("GET", f"/vouchers/{self.coupon_code.code}", {"type": "Voucher", "code": self.coupon_code.code})
+        self.server.add_response("GET", "/vouchers/UNKNOWN-CODE", {"type": "Error", "error": "Not found"}, status=404)
+
+        self.assertTrue(self.processor.is_code_valid(self.coupon_code))
+        self.assertFalse(self.processor.is_code_valid("UNKNOWN-CODE"))
+        self.assertFalse(DeferredValidation.objects.exists())
+
+    def test_open_circuit_applies_coupon_code_on_checkout(self):
+        Receipt.objects.filter(pk__gte=0).delete()
+        client = Client()
+        client.force_login(self.invoice.profile.user)
+
+        with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+            response = client.post(reverse('checkout-validation-coupon-code', kwargs={'invoice_uuid': self.invoice.uuid}), {'promo_code': self.coupon_code.code})
+
+        self.assertIn("Promo Code Applied", str(response.content))
+        self.assertEqual(DeferredValidation.objects.get(code=self.coupon_code.code).invoice, self.invoice)
+        self.assertEqual(self.server.requests, [])
+
+    def test_reconcile_deferred_validations(self):
+        with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+            self.processor.is_code_valid_on_checkout(self.coupon_code.code, 10)
+
+        self.assertEqual(reconcile_deferred_validations(), (0, 0, 1))
+
+        self.processor.get_circuit_breaker().close()
+        code_path = f"/vouchers/{self.coupon_code.code}/redemptions"
+        self.server.add_response("GET", code_path, {"type": "Error", "error": "Not found"}, status=404)
+        self.server.add_response("POST", code_path, {"type": "Error", "error": "Voucher expired"}, status=422)
+
+        with self.assertLogs('vendorpromo.fallback', 'WARNING'):
+            self.assertEqual(reconcile_deferred_validations(), (1, 1, 0))
+
+        deferred_validation = DeferredValidation.objects.get(code=self.coupon_code.code)
+
+        self.assertFalse(deferred_validation.is_valid)
+        self.assertEqual(deferred_validation.attempts, 2)
+        self.assertIsNotNone(deferred_validation.checked)
+
+    def test_reconcile_deferred_code_check_only_gets_the_voucher(self):
+        with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+            self.assertTrue(self.processor.is_code_valid(self.coupon_code, invoice=self.invoice))
+
+        self.assertEqual(DeferredValidation.objects.get(code=self.coupon_code.code).kind, ValidationKind.CODE)
+
+        self.processor.get_circuit_breaker().close()
+        self.server.add_response("GET", f"/vouchers/{self.coupon_code.code}", {"type": "Voucher", "code": self.coupon_code.code})
+
+        self.assertEqual(reconcile_deferred_validations(), (1, 0, 0))
+        self.assertTrue(DeferredValidation.objects.get(code=self.coupon_code.code).is_valid)
+        self.assertEqual([(method, path) for method, path, _ in self.server.requests], [("GET", f"/vouchers/{self.coupon_code.code}")])
+
+    def test_reconcile_deferred_validations_command(self):
+        DeferredValidation.objects.create(site=self.site, code=self.coupon_code.code, invoice=self.invoice, offer_cost=10)
+        self.processor.get_circuit_breaker().close()
+        code_path = f"/vouchers/{self.coupon_code.code}/redemptions"
+        self.server.add_response("GET", code_path, {"type": "Redemption", "status": "pending"})
+
+        out = StringIO()
+        call_command('reconcile_deferred_validations', '--site', self.site.pk, stdout=out)
+
+        self.assertIn("Checked 1 codes, 0 rejected, 0 still pending", out.getvalue())
+        self.assertTrue(DeferredValidation.objects.get(code=self.coupon_code.code).is_valid)
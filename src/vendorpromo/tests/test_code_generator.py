@@ -0,0 +1,96 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from vendorpromo.code_generator import CodeGenerator, generate_coupon_codes
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import CouponCode, PromotionalCampaign
+
+
+class CodeGeneratorTests(SimpleTestCase):
+
+    def test_codes_are_unique(self):
+        codes = list(CodeGenerator(alphabet="ab", length=12).generate(4096))
+
+        self.assertEqual(len(set(codes)), 4096)
+
+    def test_codes_use_alphabet_length_and_prefix(self):
+        for code in CodeGenerator(alphabet="XYZ123", length=8, prefix="Spring-").generate(100):
+            self.assertTrue(code.startswith("spring-"))
+            self.assertEqual(len(code), len("spring-") + 8)
+            self.assertTrue(set(code[len("spring-"):]) <= set("xyz123"))
+
+    def test_same_key_generates_same_codes(self):
+        key = b"k" * 32
+
+        self.assertEqual(list(CodeGenerator(key=key).generate(10)), list(CodeGenerator(key=key).generate(10)))
+        self.assertNotEqual(list(CodeGenerator().generate(10)), list(CodeGenerator().generate(10)))
+
+    def test_invalid_alphabet(self):
+        with self.assertRaises(ValueError):
+            CodeGenerator(alphabet="aA")
+
+        with self.assertRaises(ValueError):
+            CodeGenerator(alphabet="ab!")
+
+    def test_code_space_exhausted(self):
+        with self.assertRaises(ValueError):
+            list(CodeGenerator(alphabet="ab", length=2).generate(5))
+
+
+class GenerateCouponCodesTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        coupon_table.clear()
+        self.promotional_campaign = PromotionalCampaign.objects.get(pk=1)
+
+    def tearDown(self):
+        coupon_table.clear()
+
+    def test_generate_coupon_codes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = generate_coupon_codes(self.promotional_campaign, 250, prefix="BULK", chunk_size=100)
+
+        coupon_codes = CouponCode.objects.filter(promo=self.promotional_campaign, normalized_code__startswith="bulk")
+        coupon_code = coupon_codes.first()
+
+        self.assertEqual(result.created, 250)
+        self.assertEqual(coupon_codes.count(), 250)
+        self.assertEqual(coupon_code.code, coupon_code.normalized_code)
+        self.assertEqual(coupon_code.site_id, self.promotional_campaign.site_id)
+        self.assertEqual(coupon_code.max_redemptions, 1)
+        self.assertEqual(coupon_table.lookup(self.promotional_campaign.site_id, coupon_code.code.upper()).pk, coupon_code.pk)
+
+    def test_large_campaign_left_out_of_coupon_table(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_coupon_codes(self.promotional_campaign, 150, prefix="BULK")
+
+        coupon_code = CouponCode.objects.filter(promo=self.promotional_campaign, normalized_code__startswith="bulk").first()
+
+        with mock.patch('vendorpromo.coupon_table.VENDOR_PROMO_COUPON_TABLE_MAX_CAMPAIGN_CODES', 100):
+            table = coupon_table.get(self.promotional_campaign.site_id)
+
+            self.assertNotIn(coupon_code.normalized_code, table)
+            self.assertEqual(coupon_table.lookup(self.promotional_campaign.site_id, coupon_code.code).pk, coupon_code.pk)
+            self.assertIsNone(coupon_table.lookup(self.promotional_campaign.site_id, "bulk-missing"))
+
+    def test_generate_coupon_codes_skips_existing_codes(self):
+        generate_coupon_codes(self.promotional_campaign, 30, alphabet="ab", length=5)
+        result = generate_coupon_codes(self.promotional_campaign, 2, alphabet="ab", length=5)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(CouponCode.objects.filter(promo=self.promotional_campaign, normalized_code__regex=r'^[ab]{5}$').count(), 32)
+
+        with self.assertRaises(ValueError):
+            generate_coupon_codes(self.promotional_campaign, 1, alphabet="ab", length=5)
+
+    def test_generate_coupon_codes_command(self):
+        out = StringIO()
+        call_command('generate_coupon_codes', self.promotional_campaign.pk, 10, prefix="cmd", stdout=out)
+
+        self.assertIn("Created 10 coupon codes", out.getvalue())
+        self.assertEqual(CouponCode.objects.filter(normalized_code__startswith="cmd").count(), 10)
@@ -29,6 +29,16 @@ class CouponCodeModelTests(TestCase):
         new_coupon_code.save()
         self.assertTrue(CouponCode.objects.get(code__icontains=test_code))
 
+    def test_coupon_code_save_sets_normalized_code_and_site(self):
+        new_coupon_code = CouponCode()
+        new_coupon_code.code = ' Summer-Code '
+        new_coupon_code.promo = PromotionalCampaign.objects.get(pk=1)
+        new_coupon_code.save()
+
+        self.assertEqual(new_coupon_code.normalized_code, 'summer-code')
+        self.assertEqual(new_coupon_code.site, new_coupon_code.promo.site)
+        self.assertTrue(CouponCode.objects.filter(normalized_code='summer-code', site=new_coupon_code.promo.site).exists())
+
 
 class CouponCodeViewTests(TestCase):
 
@@ -51,6 +61,12 @@ class CouponCodeViewTests(TestCase):
         self.assertIn("MORRELLOSALE", str(response.content))
         self.assertNotIn("JIMMYOFF", str(response.content))
 
+    def test_coupon_code_list_search_code_prefix(self):
+        view_url = f"{reverse('coupon-code-list')}?search_filter=VENDORP"
+        response = self.client.get(view_url)
+        self.assertIn("vendorper", str(response.content))
+        self.assertNotIn("vendorfix", str(response.content))
+
     def test_coupon_code_list_search_empty(self):
         view_url = f"{reverse('coupon-code-list')}?search_filter=Peter"
         response = self.client.get(view_url)
@@ -72,6 +88,18 @@ class CouponCodeViewTests(TestCase):
         self.assertEquals(response.status_code, 302)
         self.assertTrue(CouponCode.objects.filter(code__icontains=post_data['code']))
 
+    def test_coupon_code_create_post_case_variant_error(self):
+        view_url = reverse('coupon-code-create')
+        post_data = {
+            'code': " HAM10 ",
+            'promo': 1,
+            'max_redemptions': 3
+        }
+        response = self.client.post(view_url, post_data)
+        self.assertEquals(response.status_code, 200)
+        self.assertIn("Code already exists", str(response.content))
+        self.assertEqual(CouponCode.objects.filter(normalized_code="ham10").count(), 1)
+
     def test_coupon_code_update_get_200(self):
         coupon_code = CouponCode.objects.get(pk=1)
         view_url = reverse('coupon-code-update', kwargs={'uuid': coupon_code.uuid})
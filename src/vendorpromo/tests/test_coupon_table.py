@@ -0,0 +1,118 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from vendor.models import Offer
+
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import CouponCode, PromotionalCampaign
+
+
+class CouponTableTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        coupon_table.clear()
+        self.coupon_code = CouponCode.objects.get(pk=4)
+        self.site_id = self.coupon_code.promo.site_id
+
+    def tearDown(self):
+        coupon_table.clear()
+
+    def test_lookup_normalizes_code(self):
+        compiled_coupon = coupon_table.lookup(self.site_id, f"  {self.coupon_code.code.upper()} ")
+
+        self.assertEqual(compiled_coupon.pk, self.coupon_code.pk)
+        self.assertEqual(compiled_coupon.campaign_pk, self.coupon_code.promo.pk)
+        self.assertEqual(compiled_coupon.is_percent_off, self.coupon_code.promo.is_percent_off)
+        self.assertEqual(compiled_coupon.discount_value, abs(self.coupon_code.promo.applies_to.current_price()))
+        self.assertEqual(compiled_coupon.product_ids, set(self.coupon_code.promo.applies_to.products.values_list('pk', flat=True)))
+
+    def test_lookup_invalid_code(self):
+        self.assertIsNone(coupon_table.lookup(self.site_id, "invalid_code"))
+
+    def test_lookup_does_not_query_once_compiled(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        with self.assertNumQueries(0):
+            coupon_table.lookup(self.site_id, self.coupon_code.code)
+            coupon_table.lookup(self.site_id, "invalid_code")
+
+    def test_coupon_code_save_updates_table(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coupon_code.active = False
+            self.coupon_code.save()
+
+        self.assertFalse(coupon_table.lookup(self.site_id, self.coupon_code.code).active)
+
+    def test_coupon_code_save_patches_table(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        with mock.patch.object(coupon_table, 'compile', side_effect=AssertionError("compiled")):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.coupon_code.code = "ham11"
+                self.coupon_code.save()
+
+            self.assertIsNone(coupon_table.lookup(self.site_id, "ham10"))
+            self.assertEqual(coupon_table.lookup(self.site_id, "ham11").pk, self.coupon_code.pk)
+
+            # Another process loads the patched table from the cache
+            coupon_table._tables.clear()
+            self.assertEqual(coupon_table.lookup(self.site_id, "ham11").pk, self.coupon_code.pk)
+
+    def test_patch_is_dropped_after_a_concurrent_change(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        def apply(table):
+            # Invalidated by another process while the patch was applied
+            coupon_table.invalidate(self.site_id)
+            return {code: compiled_coupon for code, compiled_coupon in table.items() if code != self.coupon_code.normalized_code}
+
+        coupon_table.patch(self.site_id, apply)
+
+        self.assertEqual(coupon_table.lookup(self.site_id, self.coupon_code.code).pk, self.coupon_code.pk)
+
+    def test_table_compiled_before_a_change_is_not_kept(self):
+        compile = coupon_table.compile
+
+        def compile_then_change(site_id):
+            table = compile(site_id)
+            # Committed by another process while the table was compiled
+            CouponCode.objects.filter(pk=self.coupon_code.pk).update(active=False)
+            coupon_table.invalidate(site_id)
+            return table
+
+        with mock.patch.object(coupon_table, 'compile', compile_then_change):
+            coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        self.assertFalse(coupon_table.lookup(self.site_id, self.coupon_code.code).active)
+
+    def test_coupon_code_delete_updates_table(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coupon_code.delete()
+
+        self.assertIsNone(coupon_table.lookup(self.site_id, self.coupon_code.code))
+
+    def test_promotional_campaign_save_updates_table(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+        end_date = timezone.now()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promotional_campaign = PromotionalCampaign.objects.get(pk=self.coupon_code.promo.pk)
+            promotional_campaign.end_date = end_date
+            promotional_campaign.save()
+
+        self.assertEqual(coupon_table.lookup(self.site_id, self.coupon_code.code).end_date, end_date)
+
+    def test_offer_products_change_updates_table(self):
+        coupon_table.lookup(self.site_id, self.coupon_code.code)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Offer.objects.get(pk=self.coupon_code.promo.applies_to.pk).products.clear()
+
+        self.assertFalse(coupon_table.lookup(self.site_id, self.coupon_code.code).product_ids)
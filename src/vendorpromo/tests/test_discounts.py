@@ -0,0 +1,91 @@
+import math
+
+from django.test import SimpleTestCase, TestCase
+from vendor.models import Invoice, Offer
+
+from vendorpromo.coupon_table import CompiledCoupon, coupon_table
+from vendorpromo.discounts import (CartLine, calculate_discount,
+                                   get_cart_snapshot)
+from vendorpromo.models import CouponCode
+from vendorpromo.resolvers import resolve_order_items
+
+
+def compiled_coupon(is_percent_off, discount_value, product_ids):
+    return CompiledCoupon(1, "code", 1, 1, None, None, is_percent_off, discount_value, frozenset(product_ids), True, None, None)
+
+
+class CalculateDiscountTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cart_lines = [
+            CartLine(1, 2, 100, frozenset([1, 2])),
+            CartLine(2, 1, 50, frozenset([3])),
+            CartLine(3, 3, 30, frozenset([2, 4])),
+        ]
+
+    def test_percent_off_products(self):
+        coupon_discount = calculate_discount(self.cart_lines, compiled_coupon(True, 10, [2]))
+
+        self.assertEqual(coupon_discount.line_discounts, {1: 10, 3: 3})
+        self.assertEqual(coupon_discount.global_discount, 13)
+        self.assertIsNone(coupon_discount.coupon_quantity)
+
+    def test_fixed_amount_products(self):
+        coupon_discount = calculate_discount(self.cart_lines, compiled_coupon(False, 5, [3, 4]))
+
+        self.assertEqual(coupon_discount.line_discounts, {2: 5, 3: 15})
+        self.assertEqual(coupon_discount.global_discount, 0)
+        self.assertEqual(coupon_discount.coupon_quantity, 4)
+        self.assertEqual(coupon_discount.total, 20)
+
+    def test_no_matching_products(self):
+        coupon_discount = calculate_discount(self.cart_lines, compiled_coupon(True, 10, [9]))
+
+        self.assertEqual(coupon_discount.line_discounts, {})
+        self.assertEqual(coupon_discount.global_discount, 0)
+
+    def test_percent_off_without_products_discounts_subtotal(self):
+        self.assertEqual(calculate_discount(self.cart_lines, compiled_coupon(True, 10, [])).global_discount, 18)
+        self.assertEqual(calculate_discount(self.cart_lines, compiled_coupon(True, 10, []), subtotal=500).global_discount, 50)
+
+    def test_fixed_amount_without_products(self):
+        coupon_discount = calculate_discount(self.cart_lines, compiled_coupon(False, 5, []))
+
+        self.assertEqual(coupon_discount, (dict(), 0, 1, 5))
+
+
+class DiscountModelTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        coupon_table.clear()
+
+    def tearDown(self):
+        coupon_table.clear()
+
+    def test_cart_snapshot_does_not_query(self):
+        order_items = resolve_order_items(Invoice.objects.get(pk=1))
+
+        with self.assertNumQueries(0):
+            cart_lines = get_cart_snapshot(order_items)
+
+        self.assertEqual([cart_line.pk for cart_line in cart_lines], [order_item.pk for order_item in order_items])
+
+    def test_get_discounted_amount(self):
+        coupon_code = CouponCode.objects.get(pk=4)
+        offer = Offer.objects.filter(products__in=coupon_code.promo.applies_to.products.all()).exclude(pk=coupon_code.promo.applies_to.pk).first()
+        coupon_discount = math.fabs(coupon_code.promo.applies_to.current_price())
+
+        if coupon_code.promo.is_percent_off:
+            should_be_discount = (offer.current_price() * coupon_discount) / 100
+        else:
+            should_be_discount = coupon_discount
+
+        self.assertAlmostEqual(coupon_code.get_discounted_amount(offer), should_be_discount)
+
+    def test_get_discounted_amount_offer_does_not_apply(self):
+        coupon_code = CouponCode.objects.get(pk=4)
+        offer = Offer.objects.exclude(products__in=coupon_code.promo.applies_to.products.all()).first()
+
+        self.assertEqual(coupon_code.get_discounted_amount(offer), 0)
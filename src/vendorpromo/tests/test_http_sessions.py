@@ -0,0 +1,63 @@
+from django.contrib.sites.models import Site
+from django.test import SimpleTestCase, TestCase
+from integrations.models import Credential
+
+from vendorpromo.http_sessions import (DEFAULT_TIMEOUT, close_sessions,
+                                       get_session, request)
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+
+class HTTPSessionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+
+    def test_get_session_per_base_url(self):
+        self.assertIs(get_session(self.server.url), get_session(self.server.url))
+        self.assertIsNot(get_session(self.server.url), get_session("https://example.com"))
+
+    def test_request_reuses_connection(self):
+        for _ in range(5):
+            response = request(self.server.url, "GET", f"{self.server.url}/vouchers/code")
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_default_timeout(self):
+        self.assertEqual(DEFAULT_TIMEOUT, (3.05, 10))
+
+
+class VoucheryProcessorSessionTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+        self.site = Site.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+
+    def test_processor_calls_share_connection(self):
+        self.server.add_response("GET", "/vouchers/code/redemptions", {"type": "Error", "error": "Not found"}, status=404)
+        self.server.add_response("POST", "/vouchers/code/redemptions", {"type": "Redemption", "status": "redeemed"}, status=201)
+
+        processor = VoucheryProcessor(self.site)
+        processor.get_redeem("code", "transaction")
+        self.assertFalse(processor.is_request_success)
+
+        processor.clear_response_variables()
+        processor.create_redeem("code", "transaction", 10)
+        self.assertTrue(processor.is_request_success)
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual([(method, path) for method, path, _ in self.server.requests], [("GET", "/vouchers/code/redemptions"), ("POST", "/vouchers/code/redemptions")])
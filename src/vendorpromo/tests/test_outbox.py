@@ -0,0 +1,246 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from integrations.models import Credential
+from vendor.models.base import get_product_model
+
+from vendorpromo.forms import CouponCodeForm, PromoForm, PromotionalCampaignForm
+from vendorpromo.http_sessions import close_sessions
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.models import OutboxMessage, OutboxStatus, PromotionalCampaign
+from vendorpromo.outbox import drain
+from vendorpromo.processors.stripe import StripePromoProcessor
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.tests.stripe_server import FakeStripeServer
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_fake")
+class StripeOutboxTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeStripeServer().start()
+        self.site = Site.objects.get(pk=1)
+        self.processor = StripePromoProcessor(self.site)
+
+        outbox = mock.patch('vendorpromo.processors.stripe.VENDOR_PROMO_PROCESSOR_OUTBOX', True)
+        outbox.start()
+        self.addCleanup(outbox.stop)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def create_promo(self):
+        form = PromotionalCampaignForm({
+            'name': "Outbox Campaign",
+            'applies_to': [get_product_model().objects.filter(site=self.site).first().pk],
+            'is_percent_off': True,
+            'discount_value': 10,
+        }, site=self.site)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        return self.processor.create_promo(form)
+
+    def create_coupon_code(self, promotional_campaign):
+        form = CouponCodeForm({'code': "OUTBOX-CODE", 'promo': promotional_campaign.pk}, site=self.site)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        return self.processor.create_coupon_code(form)
+
+    def test_create_promo_is_queued(self):
+        promotional_campaign = self.create_promo()
+        message = OutboxMessage.objects.get()
+
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual((message.processor, message.action, message.content_object), ("stripe.StripePromoProcessor", 'send_stripe_coupon', promotional_campaign))
+        self.assertEqual(message.status, OutboxStatus.PENDING)
+
+    def test_drain_sends_messages_in_order(self):
+        promotional_campaign = self.create_promo()
+        coupon_code = self.create_coupon_code(promotional_campaign)
+
+        self.assertEqual(drain(), (2, 0, 0))
+
+        promotional_campaign.refresh_from_db()
+        coupon_code.refresh_from_db()
+        coupon_request, promotion_code_request = self.server.requests
+
+        self.assertEqual(promotion_code_request[2]['coupon'], promotional_campaign.meta['stripe_id'])
+        self.assertIn(coupon_code.meta['stripe_id'], self.server.objects['promotion_codes'])
+        self.assertEqual([coupon_request[3], promotion_code_request[3]], [str(message.idempotency_key) for message in OutboxMessage.objects.order_by('pk')])
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxStatus.SENT).exists())
+
+    def test_update_before_drain_is_queued(self):
+        promotional_campaign = self.create_promo()
+        coupon_code = self.create_coupon_code(promotional_campaign)
+        form = PromotionalCampaignForm({
+            'name': "Renamed Campaign",
+            'applies_to': [get_product_model().objects.filter(site=self.site).first().pk],
+            'is_percent_off': True,
+            'discount_value': 10,
+        }, instance=promotional_campaign, site=self.site)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        self.processor.update_promo(form)
+        self.processor.set_active_coupon_code(coupon_code, False)
+
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(drain(), (4, 0, 0))
+
+        promotional_campaign.refresh_from_db()
+        coupon_code.refresh_from_db()
+        self.assertEqual(self.server.objects['coupons'][promotional_campaign.meta['stripe_id']]['name'], "Renamed Campaign")
+        self.assertFalse(self.server.objects['promotion_codes'][coupon_code.meta['stripe_id']]['active'])
+
+    def test_stripe_calls_use_the_processor_api_key(self):
+        promotional_campaign = self.create_promo()
+        coupon_code = self.create_coupon_code(promotional_campaign)
+
+        # Another site's processor, or none, may have set the stripe module's key
+        with mock.patch('stripe.api_key', None):
+            self.assertTrue(self.processor.create_stripe_coupon(promotional_campaign))
+            coupon_code.refresh_from_db()
+            self.assertTrue(self.processor.create_stripe_promotion_code(coupon_code))
+            self.assertTrue(self.processor.update_stripe_coupon(promotional_campaign))
+            self.assertTrue(self.processor.set_active_stripe_promotion_code(coupon_code, False))
+            self.processor.delete_promo(promotional_campaign)
+
+        self.assertTrue(self.processor.stripe_builder.transaction_succeeded)
+        self.assertEqual(self.server.objects['coupons'], {})
+
+    def test_unexpected_error_is_retried(self):
+        self.create_promo()
+
+        with mock.patch.object(StripePromoProcessor, 'send_stripe_coupon', side_effect=KeyError('stripe_id')):
+            with self.assertLogs('vendorpromo.outbox', 'ERROR'):
+                self.assertEqual(drain(), (0, 1, 0))
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxStatus.PENDING, 1))
+        self.assertIn("KeyError", message.error)
+
+    def test_failed_message_is_retried_with_backoff(self):
+        self.create_promo()
+        self.server.add_failures("POST", "/v1/coupons", 1)
+
+        with self.assertLogs('vendor.processors.stripe', 'ERROR'):
+            self.assertEqual(drain(), (0, 1, 0))
+
+        message = OutboxMessage.objects.get()
+
+        self.assertEqual((message.status, message.attempts), (OutboxStatus.PENDING, 1))
+        self.assertGreater(message.next_attempt, timezone.now() + timedelta(seconds=20))
+        self.assertEqual(drain(), (0, 0, 0))
+
+        OutboxMessage.objects.update(next_attempt=timezone.now())
+
+        self.assertEqual(drain(), (1, 0, 0))
+        self.assertEqual(len(self.server.objects['coupons']), 1)
+
+    def test_resent_message_is_idempotent(self):
+        promotional_campaign = self.create_promo()
+        drain()
+
+        # As if the worker died before it could store the Stripe id
+        promotional_campaign.refresh_from_db()
+        promotional_campaign.meta = {}
+        promotional_campaign.save()
+        OutboxMessage.objects.update(status=OutboxStatus.PENDING)
+
+        self.assertEqual(drain(), (1, 0, 0))
+        self.assertEqual(len(self.server.get_requests("POST", "/v1/coupons")), 2)
+        self.assertEqual(len(self.server.objects['coupons']), 1)
+
+    def test_message_fails_after_max_attempts(self):
+        self.create_promo()
+        self.server.add_failures("POST", "/v1/coupons", 1)
+
+        with mock.patch('vendorpromo.outbox.VENDOR_PROMO_PROCESSOR_OUTBOX_MAX_ATTEMPTS', 1):
+            with self.assertLogs('vendor.processors.stripe', 'ERROR'), self.assertLogs('vendorpromo.outbox', 'WARNING'):
+                self.assertEqual(drain(), (0, 0, 1))
+
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxStatus.FAILED)
+
+    def test_deleted_object_fails(self):
+        promotional_campaign = self.create_promo()
+        PromotionalCampaign.objects.filter(pk=promotional_campaign.pk).delete()
+
+        with self.assertLogs('vendorpromo.outbox', 'WARNING'):
+            self.assertEqual(drain(), (0, 0, 1))
+
+        self.assertIn("was deleted", OutboxMessage.objects.get().error)
+
+    def test_drain_in_batches(self):
+        for _ in range(3):
+            self.create_promo()
+
+        self.assertEqual(drain(batch_size=2, max_batches=1), (2, 0, 0))
+        self.assertEqual(drain(batch_size=2), (1, 0, 0))
+
+    def test_drain_promo_outbox_command(self):
+        self.create_promo()
+
+        out = StringIO()
+        call_command('drain_promo_outbox', '--site', self.site.pk, stdout=out)
+
+        self.assertIn("Sent 1 messages, 0 to retry, 0 failed", out.getvalue())
+
+
+class VoucheryOutboxTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+        self.site = Site.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+        self.processor = VoucheryProcessor(self.site)
+
+        outbox = mock.patch('vendorpromo.processors.vouchery.VENDOR_PROMO_PROCESSOR_OUTBOX', True)
+        outbox.start()
+        self.addCleanup(outbox.stop)
+
+        form = PromoForm({'code': "OUTBOX-VOUCHER", 'campaign_name': "Outbox", 'offer': 1})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.instance.campaign_id = "7"
+        self.promo = self.processor.create_promo(form)
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+
+    def test_create_promo_is_saved_and_queued(self):
+        self.assertIsNotNone(self.promo.pk)
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(OutboxMessage.objects.get().content_object, self.promo)
+
+    def test_drain_creates_voucher(self):
+        self.assertEqual(drain(), (1, 0, 0))
+        self.assertEqual(self.server.requests[0][:2], ("POST", "/campaigns/7/vouchers"))
+        self.assertEqual(self.server.requests[0][2]["code"], "OUTBOX-VOUCHER")
+
+    def test_existing_voucher_is_sent(self):
+        self.server.add_response("POST", "/campaigns/7/vouchers", {"type": "Error", "message": "Code has already been taken"}, status=422)
+
+        self.assertEqual(drain(), (1, 0, 0))
+
+    def test_transient_failure_is_retried(self):
+        self.server.add_failures("POST", "/campaigns/7/vouchers", 1)
+
+        self.assertEqual(drain(), (0, 1, 0))
+        self.assertEqual(OutboxMessage.objects.get().error, "Unavailable")
+
+    def test_rejected_voucher_is_not_retried(self):
+        self.server.add_response("POST", "/campaigns/7/vouchers", {"type": "Error", "message": "Invalid campaign"}, status=400)
+
+        with self.assertLogs('vendorpromo.outbox', 'WARNING'):
+            self.assertEqual(drain(), (0, 0, 1))
+
+        self.assertEqual(OutboxMessage.objects.get().attempts, 1)
@@ -1,17 +1,33 @@
 
+import threading
+from itertools import islice
+
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from integrations.models import Credential
 
 from unittest import skipIf
 
-from vendor.models import Offer
+from vendor.models import Invoice, Offer
 from vendor.models.utils import random_string
 
 from vendorpromo.config import VENDOR_PROMO_PROCESSOR
 from vendorpromo.forms import PromoForm
+from vendorpromo.http_sessions import close_sessions
+from vendorpromo.integrations import VoucheryIntegration
 from vendorpromo.models import Promo
-from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.config import PromoProcessorSiteConfig
+from vendorpromo.processors import (get_site_promo_processor,
+                                    get_site_promo_processor_instance,
+                                    processor_pool, processor_table)
+from vendorpromo.processors.base import PromoProcessorBase
+from vendorpromo.processors.stripe import StripePromoProcessor
+from vendorpromo.processors.vouchery import (CAMPAIGN_TREE_META_KEY,
+                                             VoucheryError, VoucheryProcessor)
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
 
 User = get_user_model()
 
@@ -66,6 +82,245 @@ class BaseProcessorTests(TestCase):
     #     raise NotImplementedError
 
 
+class SitePromoProcessorTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        processor_table.clear()
+        self.site = Site.objects.get(pk=1)
+
+    def tearDown(self):
+        processor_table.clear()
+
+    def test_processor_is_cached(self):
+        self.assertEqual(get_site_promo_processor(self.site), PromoProcessorBase)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_site_promo_processor(self.site), PromoProcessorBase)
+
+    def test_saved_config_invalidates_cache(self):
+        get_site_promo_processor(self.site)
+        self.client.post(reverse('vendorpromo-processor-site', kwargs={'pk': self.site.pk}), {'site': self.site.pk, 'promo_processor': "vouchery.VoucheryProcessor"})
+
+        self.assertEqual(get_site_promo_processor(self.site), VoucheryProcessor)
+
+    def test_other_process_sees_invalidation(self):
+        get_site_promo_processor(self.site)
+        # Another process only shares the cache backend
+        cache.set(processor_table.get_cache_key(self.site.pk), ("other", {'promo_processor': "stripe.StripePromoProcessor"}))
+        cache.set(processor_table.get_version_key(self.site.pk), "other")
+
+        self.assertEqual(get_site_promo_processor(self.site), StripePromoProcessor)
+
+
+class ProcessorPoolTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        processor_table.clear()
+        processor_pool.clear()
+        self.site = Site.objects.get(pk=1)
+        self.credential = Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url="http://vouchery.test/api/v2.0", private_key="key")
+        PromoProcessorSiteConfig(self.site).save("vouchery.VoucheryProcessor", "promo_processor")
+
+    def tearDown(self):
+        processor_table.clear()
+        processor_pool.clear()
+
+    def test_instance_is_reused(self):
+        processor = get_site_promo_processor_instance(self.site)
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_site_promo_processor_instance(self.site), processor)
+
+    def test_instances_are_per_thread(self):
+        processor = processor_pool.get(self.site, PromoProcessorBase)
+        processors = []
+        thread = threading.Thread(target=lambda: processors.append(processor_pool.get(self.site, PromoProcessorBase)))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(processors[0], processor)
+
+    def test_credential_save_invalidates_instances(self):
+        get_site_promo_processor_instance(self.site)
+        self.credential.client_url = "http://vouchery.test/api/v3.0"
+        self.credential.save()
+
+        self.assertEqual(get_site_promo_processor_instance(self.site).BASE_URL, "http://vouchery.test/api/v3.0")
+
+    def test_invoice_is_passed_per_call(self):
+        processor = get_site_promo_processor_instance(self.site)
+        invoice = Invoice.objects.get(pk=1)
+        processor.set_promo_invoice_vendor_notes("ham10", invoice)
+
+        self.assertIsNone(processor.invoice)
+        self.assertIn("ham10", Invoice.objects.get(pk=1).vendor_notes['promos'])
+
+
+class VoucheryProcessorFakeServerTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+        self.site = Site.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+        self.processor = VoucheryProcessor(self.site)
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+
+    def test_call_returns_result(self):
+        self.server.add_response("GET", "/vouchers/missing", {"type": "Error", "message": "Not found", "error": "missing"}, status=404)
+
+        result = self.processor.get_voucher("missing")
+
+        self.assertFalse(result.is_success)
+        self.assertEqual((result.status_code, result.message, result.error), (404, "Not found", "missing"))
+        self.assertFalse(self.processor.is_request_success)
+        self.assertEqual(self.processor.response_error, "missing")
+
+    def test_last_response_is_per_thread(self):
+        self.server.add_response("GET", "/vouchers/missing", {"type": "Error", "error": "missing"}, status=404)
+        self.server.add_response("GET", "/vouchers/code", {"type": "Voucher", "code": "code"})
+
+        self.processor.get_voucher("code")
+        thread = threading.Thread(target=self.processor.get_voucher, args=("missing",))
+        thread.start()
+        thread.join()
+
+        self.assertTrue(self.processor.is_request_success)
+        self.assertEqual(self.processor.response_content["code"], "code")
+
+    def test_create_promo_automate_does_not_change_params(self):
+        subcampaign_params = dict(VoucheryProcessor.SUBCAMPAIGN_PARAMS)
+        offer = Offer.objects.filter(site=self.site).first()
+        self.server.add_response("POST", "/campaigns", {"type": "MainCampaign", "id": 7, "parent_id": 7})
+        self.server.add_response("GET", "/campaigns/7", {"type": "SubCampaign", "id": 7, "rewards": [{"id": 1}]})
+        self.server.add_response("POST", "/campaigns/7/vouchers", {"type": "Voucher", "code": "automate"})
+        promo_form = PromoForm({'code': "automate", 'campaign_name': "Automate", 'offer': offer.pk, 'meta': "{}"})
+        promo_form.is_valid()
+
+        self.processor.create_promo_automate(promo_form)
+
+        self.assertEqual(VoucheryProcessor.SUBCAMPAIGN_PARAMS, subcampaign_params)
+        self.assertEqual(self.server.requests[3], ("POST", "/campaigns", {"name": offer.name, **subcampaign_params, "parent_id": "7"}))
+        self.assertTrue(Promo.objects.filter(code="automate", campaign_id="7").exists())
+
+    def create_automate_promo(self, offer, code):
+        promo_form = PromoForm({'code': code, 'campaign_name': "Automate", 'offer': offer.pk, 'meta': "{}"})
+        promo_form.is_valid()
+        self.processor.create_promo_automate(promo_form)
+
+    def test_create_promo_automate_keeps_campaign_tree(self):
+        offer = Offer.objects.filter(site=self.site).first()
+        self.server.add_response("POST", "/campaigns", {"type": "MainCampaign", "id": 7, "parent_id": 7})
+        self.server.add_response("GET", "/campaigns/7", {"type": "SubCampaign", "id": 7, "parent_id": 7, "rewards": [{"id": 1}]})
+        self.server.add_response("POST", "/campaigns/7/vouchers", {"type": "Voucher"})
+
+        self.create_automate_promo(offer, "automate")
+        offer.refresh_from_db()
+
+        self.assertEqual(offer.meta[CAMPAIGN_TREE_META_KEY], {'client_url': self.server.url, 'campaign_id': "7", 'sub_campaign_id': "7", 'reward_id': "1"})
+
+        request_count = len(self.server.requests)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_automate_promo(offer, "automate-again")
+
+        self.assertEqual(self.server.requests[request_count:], [("POST", "/campaigns/7/vouchers", {**VoucheryProcessor.VOUCHER_PARAMS, "code": "automate-again"})])
+        self.assertTrue(Promo.objects.filter(code="automate-again", campaign_id="7").exists())
+        self.assertEqual(len(callbacks), 1)
+
+    def test_create_promo_automate_resolves_deleted_sub_campaign(self):
+        offer = Offer.objects.filter(site=self.site).first()
+        self.processor.set_offer_campaign_tree(offer, {'client_url': self.server.url, 'campaign_id': "5", 'sub_campaign_id': "6", 'reward_id': "1"})
+        self.server.add_response("POST", "/campaigns/6/vouchers", {"type": "Error", "message": "Not found"}, status=404)
+        self.server.add_response("POST", "/campaigns", {"type": "MainCampaign", "id": 7, "parent_id": 7})
+        self.server.add_response("GET", "/campaigns/7", {"type": "SubCampaign", "id": 7, "parent_id": 7, "rewards": [{"id": 1}]})
+        self.server.add_response("POST", "/campaigns/7/vouchers", {"type": "Voucher"})
+
+        self.create_automate_promo(offer, "automate")
+        offer.refresh_from_db()
+
+        self.assertEqual(offer.meta[CAMPAIGN_TREE_META_KEY]['sub_campaign_id'], "7")
+        self.assertTrue(Promo.objects.filter(code="automate", campaign_id="7").exists())
+
+    def test_verify_offer_campaign_tree(self):
+        offer = Offer.objects.filter(site=self.site).first()
+        campaign_tree = {'client_url': self.server.url, 'campaign_id': "7", 'sub_campaign_id': "8", 'reward_id': "1"}
+        self.processor.set_offer_campaign_tree(offer, campaign_tree)
+        self.server.add_response("GET", "/campaigns/8", {"type": "SubCampaign", "id": 8, "parent_id": 7, "rewards": [{"id": 1}]})
+
+        self.assertTrue(self.processor.verify_offer_campaign_tree(offer, campaign_tree))
+        self.assertEqual(self.processor.get_offer_campaign_tree(offer), campaign_tree)
+
+        self.server.add_response("GET", "/campaigns/8", {"type": "SubCampaign", "id": 8, "parent_id": 9, "rewards": [{"id": 1}]})
+
+        with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+            self.assertFalse(self.processor.verify_offer_campaign_tree(offer, campaign_tree))
+
+        offer.refresh_from_db()
+        self.assertNotIn(CAMPAIGN_TREE_META_KEY, offer.meta)
+
+    def test_campaign_tree_of_other_account_is_ignored(self):
+        offer = Offer.objects.filter(site=self.site).first()
+        self.processor.set_offer_campaign_tree(offer, {'client_url': "https://example.com", 'campaign_id': "7", 'sub_campaign_id': "8", 'reward_id': "1"})
+
+        self.assertIsNone(self.processor.get_offer_campaign_tree(offer))
+
+    def test_iter_vouchers_follows_pages(self):
+        vouchers = [{"type": "Voucher", "code": f"code-{index}"} for index in range(5)]
+        self.server.add_list("GET", "/campaigns/7/vouchers", vouchers)
+
+        self.assertEqual(list(self.processor.iter_vouchers(7, per_page=2)), vouchers)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_iter_campaigns_full_last_page(self):
+        campaigns = [{"type": "MainCampaign", "id": index} for index in range(4)]
+        self.server.add_list("GET", "/campaigns", campaigns)
+
+        self.assertEqual(list(self.processor.iter_campaigns(per_page=2)), campaigns)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_iter_campaigns_start_page(self):
+        campaigns = [{"type": "MainCampaign", "id": index} for index in range(5)]
+        self.server.add_list("GET", "/campaigns", campaigns)
+
+        self.assertEqual(list(islice(self.processor.iter_campaigns(per_page=2, start_page=2), 1)), campaigns[2:3])
+
+    def test_iter_redeems_error(self):
+        self.server.add_response("GET", "/campaigns/7/redemptions", {"type": "Error", "message": "Not found", "error": "missing"}, status=404)
+
+        with self.assertRaises(VoucheryError) as context:
+            list(self.processor.iter_redeems(7))
+
+        self.assertEqual(context.exception.result.status_code, 404)
+
+    def test_campaigns_view_paginates(self):
+        self.server.add_list("GET", "/campaigns", [{"type": "MainCampaign", "id": index} for index in range(30)])
+        client = Client()
+        client.force_login(User.objects.get(pk=1))
+        url = reverse('vouchery-campaigns-list')
+
+        response = client.get(url)
+
+        self.assertEqual(len(response.context['object_list']), 25)
+        self.assertTrue(response.context['page_obj'].has_next)
+        self.assertEqual(len(self.server.requests), 1)
+
+        response = client.get(url, {'page': 2})
+
+        self.assertEqual([campaign['id'] for campaign in response.context['object_list']], list(range(25, 30)))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertFalse(response.context['page_obj'].has_next)
+        self.assertTrue(response.context['page_obj'].has_previous)
+
+
 @skipIf(VENDOR_PROMO_PROCESSOR != "vouchery.VoucheryProcessor", "VoucheryPromoProcessor not set")
 class VoucheryProcessorTests(TestCase):
 
@@ -0,0 +1,117 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from vendor.models import Invoice, OrderItem
+from vendor.models.choice import InvoiceStatus
+
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.redemptions import (reconcile_redemption_counts,
+                                     release_redemption, reserve_redemption)
+
+
+class RedemptionTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.coupon_code = CouponCode.objects.get(pk=4)
+        self.promotional_campaign = PromotionalCampaign.objects.get(pk=self.coupon_code.promo_id)
+
+    def test_reserve_redemption_increments_counters(self):
+        self.assertTrue(reserve_redemption(self.coupon_code))
+
+        self.coupon_code.refresh_from_db()
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 1)
+        self.assertEqual(self.promotional_campaign.redemption_count, 1)
+
+    def test_reserve_redemption_coupon_code_max_redemptions(self):
+        CouponCode.objects.filter(pk=self.coupon_code.pk).update(max_redemptions=1)
+
+        self.assertTrue(reserve_redemption(self.coupon_code))
+        self.assertFalse(reserve_redemption(self.coupon_code))
+
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.promotional_campaign.redemption_count, 1)
+
+    def test_reserve_redemption_campaign_max_redemptions(self):
+        PromotionalCampaign.objects.filter(pk=self.promotional_campaign.pk).update(max_redemptions=1, redemption_count=1)
+
+        self.assertFalse(reserve_redemption(self.coupon_code))
+
+        self.coupon_code.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 0)
+
+    def test_release_redemption(self):
+        reserve_redemption(self.coupon_code)
+        release_redemption(self.coupon_code)
+        release_redemption(self.coupon_code)
+
+        self.coupon_code.refresh_from_db()
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 0)
+        self.assertEqual(self.promotional_campaign.redemption_count, 0)
+
+    def test_release_on_promotional_order_item_removed(self):
+        invoice = Invoice.objects.get(pk=1)
+        reserve_redemption(self.coupon_code)
+        self.coupon_code.invoice.add(invoice)
+        OrderItem.objects.create(invoice=invoice, offer=self.promotional_campaign.applies_to, quantity=1)
+
+        invoice.remove_offer(self.promotional_campaign.applies_to)
+
+        self.coupon_code.refresh_from_db()
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 0)
+        self.assertEqual(self.promotional_campaign.redemption_count, 0)
+        self.assertFalse(self.coupon_code.invoice.filter(pk=invoice.pk).exists())
+
+    def test_no_release_on_completed_invoice(self):
+        invoice = Invoice.objects.get(pk=1)
+        reserve_redemption(self.coupon_code)
+        self.coupon_code.invoice.add(invoice)
+        order_item = OrderItem.objects.create(invoice=invoice, offer=self.promotional_campaign.applies_to, quantity=1)
+        Invoice.objects.filter(pk=invoice.pk).update(status=InvoiceStatus.COMPLETE)
+
+        order_item.delete()
+
+        self.coupon_code.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 1)
+        self.assertTrue(self.coupon_code.invoice.filter(pk=invoice.pk).exists())
+
+    def test_reconcile_redemption_counts(self):
+        self.coupon_code.invoice.add(*Invoice.objects.all()[:2])
+        Invoice.objects.update(status=InvoiceStatus.COMPLETE)
+        CouponCode.objects.update(redemption_count=7)
+        PromotionalCampaign.objects.update(redemption_count=7)
+
+        reconcile_redemption_counts()
+
+        self.coupon_code.refresh_from_db()
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, self.coupon_code.redemptions().count())
+        self.assertEqual(self.promotional_campaign.redemption_count, self.coupon_code.redemptions().count())
+        self.assertFalse(CouponCode.objects.exclude(pk=self.coupon_code.pk).filter(redemption_count__gt=0).exists())
+
+    def test_reconcile_redemption_counts_keeps_cart_reservations(self):
+        invoice = Invoice.objects.filter(status=InvoiceStatus.CART).first()
+        reserve_redemption(self.coupon_code)
+        self.coupon_code.invoice.add(invoice)
+
+        reconcile_redemption_counts()
+
+        self.coupon_code.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 1)
+
+        OrderItem.objects.create(invoice=invoice, offer=self.promotional_campaign.applies_to, quantity=1)
+        invoice.remove_offer(self.promotional_campaign.applies_to)
+
+        self.coupon_code.refresh_from_db()
+        self.assertEqual(self.coupon_code.redemption_count, 0)
+
+    def test_reconcile_command(self):
+        out = StringIO()
+        call_command('reconcile_promo_redemptions', site=self.coupon_code.site_id, stdout=out)
+
+        self.assertIn("Reconciled", out.getvalue())
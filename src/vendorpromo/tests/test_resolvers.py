@@ -0,0 +1,54 @@
+from django.test import TestCase
+from vendor.models import Invoice, Offer
+
+from vendorpromo.models import CouponCode
+from vendorpromo.resolvers import (get_current_price, get_order_item_total,
+                                   get_order_items_product_ids,
+                                   get_product_ids, resolve_coupon_code,
+                                   resolve_order_items)
+
+
+class ResolverTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.invoice = Invoice.objects.select_related('site').get(pk=1)
+
+    def resolve_and_walk_cart(self):
+        order_items = resolve_order_items(self.invoice)
+        get_order_items_product_ids(order_items)
+        for order_item in order_items:
+            get_product_ids(order_item.offer)
+            get_order_item_total(order_item)
+        return order_items
+
+    def test_resolve_coupon_code_query_count(self):
+        coupon_code = CouponCode.objects.get(pk=4)
+
+        with self.assertNumQueries(3):
+            resolved_coupon_code = resolve_coupon_code(coupon_code.code.upper(), self.invoice.site)
+            get_product_ids(resolved_coupon_code.promo.applies_to)
+            get_current_price(resolved_coupon_code.promo.applies_to)
+
+        self.assertEqual(coupon_code, resolved_coupon_code)
+
+    def test_resolve_coupon_code_does_not_exist(self):
+        with self.assertRaises(CouponCode.DoesNotExist):
+            resolve_coupon_code("invalid_code", self.invoice.site)
+
+    def test_resolve_order_items_query_count_does_not_grow_with_cart(self):
+        with self.assertNumQueries(3):
+            small_cart = self.resolve_and_walk_cart()
+
+        for offer in Offer.objects.filter(site=self.invoice.site, is_promotional=False):
+            self.invoice.add_offer(offer)
+
+        with self.assertNumQueries(3):
+            large_cart = self.resolve_and_walk_cart()
+
+        self.assertGreater(len(large_cart), len(small_cart))
+
+    def test_order_item_total_matches_vendor(self):
+        for order_item in resolve_order_items(self.invoice):
+            self.assertAlmostEqual(order_item.total, get_order_item_total(order_item))
@@ -0,0 +1,138 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from vendor.models import Invoice, Receipt
+
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import (CodeMode, CouponCode, PromotionalCampaign,
+                                SignedCodeRedemption)
+from vendorpromo.redemptions import (reconcile_redemption_counts,
+                                     release_signed_redemption,
+                                     reserve_signed_redemption)
+from vendorpromo.signed_codes import (issue_signed_codes, parse_code,
+                                      resolve_signed_code, sign_code)
+
+
+class SignedCodeTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        coupon_table.clear()
+        self.promotional_campaign = CouponCode.objects.get(pk=4).promo
+        CouponCode.objects.filter(promo=self.promotional_campaign).delete()
+        PromotionalCampaign.objects.filter(pk=self.promotional_campaign.pk).update(code_mode=CodeMode.SIGNED)
+        self.promotional_campaign.refresh_from_db()
+        self.invoice = Invoice.objects.get(pk=1)
+        self.other_invoice = Invoice.objects.create(profile=self.invoice.profile, site=self.invoice.site)
+
+    def tearDown(self):
+        coupon_table.clear()
+
+    def test_parse_code(self):
+        code = sign_code(12, 345)
+
+        self.assertEqual(parse_code(code), (12, 345))
+        self.assertEqual(parse_code(f"  {code.lower().replace('-', '')} "), (12, 345))
+
+    def test_parse_code_rejects_tampered_codes(self):
+        code = sign_code(12, 345)
+        tampered_code = code[:-1] + ("A" if code[-1] != "A" else "B")
+
+        self.assertIsNone(parse_code(tampered_code))
+        self.assertIsNone(parse_code(code[:-1]))
+        self.assertIsNone(parse_code("not-a-code"))
+        self.assertIsNone(parse_code(None))
+
+    def test_issue_signed_codes(self):
+        codes = list(issue_signed_codes(self.promotional_campaign, 3))
+        more_codes = list(issue_signed_codes(self.promotional_campaign, 2))
+
+        self.assertEqual([parse_code(code).serial for code in codes + more_codes], [0, 1, 2, 3, 4])
+        self.assertEqual(self.promotional_campaign.signed_code_count, 5)
+
+    def test_issue_signed_codes_stored_campaign(self):
+        PromotionalCampaign.objects.filter(pk=self.promotional_campaign.pk).update(code_mode=CodeMode.STORED)
+        self.promotional_campaign.refresh_from_db()
+
+        with self.assertRaises(ValueError):
+            issue_signed_codes(self.promotional_campaign, 1)
+
+    def test_issue_signed_codes_count_must_be_positive(self):
+        list(issue_signed_codes(self.promotional_campaign, 2))
+
+        for count in (0, -1):
+            with self.assertRaises(ValueError):
+                issue_signed_codes(self.promotional_campaign, count)
+
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.promotional_campaign.signed_code_count, 2)
+
+    def test_resolve_signed_code(self):
+        code = next(issue_signed_codes(self.promotional_campaign, 1))
+        compiled_coupon = resolve_signed_code(self.promotional_campaign.site_id, code)
+
+        self.assertIsNone(compiled_coupon.pk)
+        self.assertEqual(compiled_coupon.campaign_pk, self.promotional_campaign.pk)
+        self.assertEqual(compiled_coupon.offer_pk, self.promotional_campaign.applies_to_id)
+        self.assertIsNone(compiled_coupon.stack_group)
+
+    def test_resolve_signed_code_not_issued(self):
+        self.assertIsNone(resolve_signed_code(self.promotional_campaign.site_id, sign_code(self.promotional_campaign.pk, 0)))
+
+    def test_reserve_signed_redemption(self):
+        signed_code = parse_code(next(issue_signed_codes(self.promotional_campaign, 1)))
+
+        self.assertTrue(reserve_signed_redemption(signed_code, self.invoice))
+        self.assertTrue(reserve_signed_redemption(signed_code, self.invoice))
+        self.assertFalse(reserve_signed_redemption(signed_code, self.other_invoice))
+
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.promotional_campaign.redemption_count, 1)
+
+        release_signed_redemption(signed_code, self.invoice)
+
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.promotional_campaign.redemption_count, 0)
+        self.assertFalse(SignedCodeRedemption.objects.exists())
+
+    def test_reserve_signed_redemption_campaign_max_redemptions(self):
+        PromotionalCampaign.objects.filter(pk=self.promotional_campaign.pk).update(max_redemptions=1, redemption_count=1)
+        signed_code = parse_code(next(issue_signed_codes(self.promotional_campaign, 1)))
+
+        self.assertFalse(reserve_signed_redemption(signed_code, self.invoice))
+        self.assertFalse(SignedCodeRedemption.objects.exists())
+
+    def test_reconcile_signed_redemption_counts(self):
+        for code in issue_signed_codes(self.promotional_campaign, 2):
+            SignedCodeRedemption.objects.create(promo=self.promotional_campaign, serial=parse_code(code).serial)
+
+        reconcile_redemption_counts()
+
+        self.promotional_campaign.refresh_from_db()
+        self.assertEqual(self.promotional_campaign.redemption_count, 2)
+
+    def test_apply_signed_code(self):
+        Receipt.objects.filter(pk__gte=0).delete()
+        client = Client()
+        client.force_login(self.invoice.profile.user)
+        url = reverse('checkout-validation-coupon-code', kwargs={'invoice_uuid': self.invoice.uuid})
+        code = next(issue_signed_codes(self.promotional_campaign, 1))
+
+        response = client.post(url, {'promo_code': code})
+
+        self.assertIn("Promo Code Applied", str(response.content))
+        self.assertTrue(self.invoice.order_items.filter(offer=self.promotional_campaign.applies_to).exists())
+        self.assertTrue(SignedCodeRedemption.objects.filter(promo=self.promotional_campaign, serial=0, invoice=self.invoice).exists())
+
+        response = client.post(reverse('checkout-validation-coupon-code', kwargs={'invoice_uuid': self.other_invoice.uuid}), {'promo_code': code})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_issue_signed_codes_command(self):
+        out = StringIO()
+        call_command('issue_signed_codes', self.promotional_campaign.pk, 3, stdout=out)
+
+        self.assertEqual([parse_code(code).serial for code in out.getvalue().split()], [0, 1, 2])
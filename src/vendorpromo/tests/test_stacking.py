@@ -0,0 +1,123 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from vendor.models import Invoice, Receipt
+
+from vendorpromo.coupon_table import CompiledCoupon, coupon_table
+from vendorpromo.discounts import CartLine
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.stacking import can_stack, solve_stack
+
+User = get_user_model()
+
+
+def compiled_coupon(pk, is_percent_off, discount_value, product_ids, stack_group="group", stack_limit=None):
+    return CompiledCoupon(pk, f"code{pk}", pk, pk, None, None, is_percent_off, discount_value, frozenset(product_ids), True, stack_group, stack_limit)
+
+
+class SolveStackTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cart_lines = [
+            CartLine(1, 1, 100, frozenset([1])),
+            CartLine(2, 2, 40, frozenset([2])),
+        ]
+
+    def test_can_stack(self):
+        self.assertTrue(can_stack([compiled_coupon(1, True, 10, [1], stack_group=None)]))
+        self.assertTrue(can_stack([compiled_coupon(1, True, 10, [1]), compiled_coupon(2, True, 10, [2])]))
+        self.assertFalse(can_stack([compiled_coupon(1, True, 10, [1]), compiled_coupon(2, True, 10, [2], stack_group=None)]))
+        self.assertFalse(can_stack([compiled_coupon(1, True, 10, [1]), compiled_coupon(2, True, 10, [2], stack_group="other")]))
+
+    def test_stacks_coupons_in_the_same_group(self):
+        stack, total = solve_stack(self.cart_lines, [compiled_coupon(1, True, 10, [1]), compiled_coupon(2, False, 5, [2])])
+
+        self.assertEqual(set(coupon.pk for coupon, _ in stack), {1, 2})
+        self.assertEqual(total, 20)
+
+    def test_picks_best_coupon_without_group(self):
+        stack, total = solve_stack(self.cart_lines, [compiled_coupon(1, True, 10, [1], stack_group=None), compiled_coupon(2, False, 15, [2], stack_group=None)])
+
+        self.assertEqual([coupon.pk for coupon, _ in stack], [2])
+        self.assertEqual(total, 30)
+
+    def test_respects_stack_limit(self):
+        coupons = [
+            compiled_coupon(1, True, 10, [1], stack_limit=2),
+            compiled_coupon(2, False, 5, [2]),
+            compiled_coupon(3, False, 1, [2]),
+        ]
+        stack, total = solve_stack(self.cart_lines, coupons)
+
+        self.assertEqual(set(coupon.pk for coupon, _ in stack), {1, 2})
+        self.assertEqual(total, 20)
+
+    def test_caps_discounts_at_line_total(self):
+        cart_lines = [CartLine(1, 1, 100, frozenset([1])), CartLine(2, 2, 60, frozenset([2]))]
+        coupons = [
+            compiled_coupon(1, True, 60, [1], stack_limit=2),
+            compiled_coupon(2, True, 50, [1]),
+            compiled_coupon(3, False, 22, [2]),
+        ]
+        stack, total = solve_stack(cart_lines, coupons)
+
+        # 60% and 50% on the same line are capped at 100, the fixed coupon saves more
+        self.assertEqual(set(coupon.pk for coupon, _ in stack), {1, 3})
+        self.assertEqual(total, 104)
+
+
+class CouponStackingAPITests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        coupon_table.clear()
+        Receipt.objects.filter(pk__gte=0).delete()
+        self.client = Client()
+        self.client.force_login(User.objects.get(pk=1))
+        self.invoice = Invoice.objects.get(pk=1)
+        self.invoice.update_totals()
+        self.url = reverse('checkout-validation-coupon-code', kwargs={'invoice_uuid': self.invoice.uuid})
+        self.percent_coupon_code = CouponCode.objects.get(pk=4)
+        self.fixed_coupon_code = CouponCode.objects.get(pk=3)
+
+    def tearDown(self):
+        coupon_table.clear()
+
+    def test_second_code_without_stack_group(self):
+        self.client.post(self.url, {'promo_code': self.percent_coupon_code.code})
+        response = self.client.post(self.url, {'promo_code': self.fixed_coupon_code.code})
+
+        self.assertIn("You can only apply one promo code per checkout session", str(response.content))
+
+    def test_expired_code_is_replaced(self):
+        self.client.post(self.url, {'promo_code': self.percent_coupon_code.code})
+        CouponCode.objects.filter(pk=self.percent_coupon_code.pk).update(end_date=timezone.now() - timezone.timedelta(days=1))
+        coupon_table.clear()
+
+        response = self.client.post(self.url, {'promo_code': self.fixed_coupon_code.code})
+
+        self.assertIn("Promo Code Applied", str(response.content))
+        self.assertFalse(self.invoice.order_items.filter(offer=self.percent_coupon_code.promo.applies_to).exists())
+        self.assertEqual(list(self.invoice.coupon_code.values_list('pk', flat=True)), [self.fixed_coupon_code.pk])
+        self.assertEqual(CouponCode.objects.get(pk=self.percent_coupon_code.pk).redemption_count, 0)
+
+    def test_stack_codes_in_the_same_group(self):
+        PromotionalCampaign.objects.filter(pk__in=[self.percent_coupon_code.promo_id, self.fixed_coupon_code.promo_id]).update(stack_group="spring")
+        coupon_table.clear()
+        current_discount = self.invoice.get_discounts()
+
+        self.client.post(self.url, {'promo_code': self.percent_coupon_code.code})
+        self.invoice.refresh_from_db()
+        self.invoice.update_totals()
+        percent_discount = self.invoice.get_discounts() - current_discount
+
+        self.client.post(self.url, {'promo_code': self.fixed_coupon_code.code})
+        self.invoice.refresh_from_db()
+        self.invoice.update_totals()
+
+        self.assertTrue(self.invoice.order_items.filter(offer=self.percent_coupon_code.promo.applies_to).exists())
+        self.assertTrue(self.invoice.order_items.filter(offer=self.fixed_coupon_code.promo.applies_to).exists())
+        self.assertGreater(self.invoice.get_discounts() - current_discount, percent_discount)
+        self.assertEqual(set(self.invoice.coupon_code.values_list('pk', flat=True)), {self.percent_coupon_code.pk, self.fixed_coupon_code.pk})
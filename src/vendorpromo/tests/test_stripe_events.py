@@ -0,0 +1,150 @@
+import hashlib
+import hmac
+import json
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from vendorpromo.models import CouponCode, PromotionalCampaign, StripeEvent
+from vendorpromo.redemptions import (reconcile_redemption_counts,
+                                     reserve_redemption)
+
+SECRET = "whsec_test"
+
+
+def sign(payload, secret=SECRET):
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class StripeWebhookTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.site = Site.objects.get(pk=1)
+        self.coupon_code = CouponCode.objects.select_related('promo').get(pk=4)
+        self.promotional_campaign = self.coupon_code.promo
+        CouponCode.objects.filter(pk=self.coupon_code.pk).update(meta={'stripe_id': "promo_4"})
+        PromotionalCampaign.objects.filter(pk=self.promotional_campaign.pk).update(meta={'stripe_id': "co_3"})
+        self.count = 0
+
+        patch = mock.patch('vendorpromo.processors.stripe_events.VENDOR_PROMO_STRIPE_WEBHOOK_SECRET', SECRET)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get_event(self, event_type, stripe_object, event_id=None):
+        self.count += 1
+        return {
+            'id': event_id or f"evt_{self.count}",
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()) + self.count,
+            'data': {'object': stripe_object},
+        }
+
+    def post_event(self, event, secret=SECRET):
+        payload = json.dumps(event)
+        return self.client.post(reverse('stripe-webhook'), payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=sign(payload, secret))
+
+    def get_counts(self):
+        self.coupon_code.refresh_from_db()
+        self.promotional_campaign.refresh_from_db()
+        return (self.coupon_code.stripe_redemption_count, self.promotional_campaign.stripe_redemption_count)
+
+    def test_invalid_signature_is_rejected(self):
+        event = self.get_event('promotion_code.updated', {'id': "promo_4", 'object': 'promotion_code', 'times_redeemed': 2})
+
+        with self.assertLogs('vendorpromo.api.v1.stripe.views', 'WARNING'):
+            response = self.post_event(event, secret="whsec_other")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_site_without_secret_is_rejected(self):
+        event = self.get_event('promotion_code.updated', {'id': "promo_4", 'object': 'promotion_code', 'times_redeemed': 2})
+
+        with mock.patch('vendorpromo.processors.stripe_events.VENDOR_PROMO_STRIPE_WEBHOOK_SECRET', {2: SECRET}):
+            with self.assertLogs('vendorpromo.api.v1.stripe.views', 'WARNING'):
+                self.assertEqual(self.post_event(event).status_code, 400)
+
+    def test_promotion_code_event_adds_redemptions_once(self):
+        counts = self.get_counts()
+        event = self.get_event('promotion_code.updated', {'id': "promo_4", 'object': 'promotion_code', 'times_redeemed': 2})
+
+        self.assertEqual(self.post_event(event).status_code, 200)
+        self.assertEqual(self.post_event(event).status_code, 200)
+        self.post_event(self.get_event('promotion_code.updated', {'id': "promo_4", 'object': 'promotion_code', 'times_redeemed': 1}))
+
+        self.assertEqual(self.get_counts(), (counts[0] + 2, counts[1]))
+        self.assertEqual(StripeEvent.objects.filter(applied__isnull=True).count(), 0)
+
+    def test_first_event_brings_in_earlier_redemptions(self):
+        CouponCode.objects.filter(pk=self.coupon_code.pk).update(stripe_redemption_count=5)
+
+        self.post_event(self.get_event('promotion_code.updated', {'id': "promo_4", 'object': 'promotion_code', 'times_redeemed': 6}))
+
+        self.assertEqual(self.get_counts()[0], 6)
+
+    def test_stripe_redemptions_are_kept_apart_from_local_ones(self):
+        reserve_redemption(self.coupon_code)
+        invoice = {'id': "in_1", 'object': 'invoice', 'billing_reason': 'subscription_create', 'discount': {'id': "di_1", 'promotion_code': "promo_4", 'coupon': {'id': "co_3"}}}
+        self.post_event(self.get_event('invoice.paid', invoice))
+
+        self.assertEqual(self.get_counts(), (1, 1))
+        self.assertEqual((self.coupon_code.redemption_count, self.promotional_campaign.redemption_count), (1, 1))
+
+        reconcile_redemption_counts()
+
+        self.assertEqual(self.get_counts(), (1, 1))
+
+    def test_coupon_event_adds_campaign_redemptions(self):
+        counts = self.get_counts()
+        self.post_event(self.get_event('coupon.updated', {'id': "co_3", 'object': 'coupon', 'times_redeemed': 3}))
+
+        self.assertEqual(self.get_counts(), (counts[0], counts[1] + 3))
+
+    def test_paid_invoice_redeems_code_and_campaign(self):
+        counts = self.get_counts()
+        invoice = {'id': "in_1", 'object': 'invoice', 'billing_reason': 'subscription_create', 'discount': {'id': "di_1", 'promotion_code': "promo_4", 'coupon': {'id': "co_3"}}}
+        self.post_event(self.get_event('invoice.paid', invoice))
+        # The same redemption reported by the promotion code afterwards
+        self.post_event(self.get_event('promotion_code.updated', {'id': "promo_4", 'object': 'promotion_code', 'times_redeemed': 1}))
+
+        self.assertEqual(self.get_counts(), (counts[0] + 1, counts[1] + 1))
+
+    def test_renewal_invoice_is_not_counted(self):
+        counts = self.get_counts()
+        invoice = {'id': "in_2", 'object': 'invoice', 'billing_reason': 'subscription_cycle', 'discount': {'id': "di_1", 'promotion_code': "promo_4", 'coupon': {'id': "co_3"}}}
+        self.post_event(self.get_event('invoice.paid', invoice))
+
+        self.assertEqual(self.get_counts(), counts)
+
+    def test_other_events_are_dropped(self):
+        response = self.post_event(self.get_event('customer.created', {'id': "cus_1", 'object': 'customer'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_apply_stripe_events_command_in_batches(self):
+        counts = self.get_counts()
+
+        for times_redeemed in range(1, 4):
+            StripeEvent.objects.create(site=self.site, event_id=f"evt_{times_redeemed}", type='promotion_code.updated', data={'id': "promo_4", 'times_redeemed': times_redeemed}, stripe_created=timezone.now())
+
+        out = StringIO()
+        call_command('apply_stripe_events', '--site', self.site.pk, '--batch-size', 2, '--max-batches', 1, stdout=out)
+
+        self.assertIn("Applied 2 events to 1 coupon codes and 0 campaigns", out.getvalue())
+        self.assertEqual(self.get_counts()[0], counts[0] + 2)
+
+        call_command('apply_stripe_events', stdout=out)
+
+        self.assertEqual(self.get_counts()[0], counts[0] + 3)
@@ -0,0 +1,117 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from vendorpromo.coupon_table import coupon_table
+from vendorpromo.models import CouponCode
+from vendorpromo.processors.stripe import StripePromoProcessor
+from vendorpromo.processors.stripe_reconcile import (FIELD, MISSING_LOCAL,
+                                                     MISSING_STRIPE,
+                                                     REPAIR_LOCAL,
+                                                     REPAIR_STRIPE,
+                                                     StripeReconciliation)
+from vendorpromo.processors.stripe_sync import PROMOTION_CODE, StripeSync
+from vendorpromo.tests.stripe_server import FakeStripeServer
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_fake")
+class StripeReconciliationTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        coupon_table.clear()
+        self.server = FakeStripeServer().start()
+        self.site = Site.objects.get(pk=1)
+        self.processor = StripePromoProcessor(self.site)
+        StripeSync(self.processor, rate_limit=0).run()
+        self.coupon_code = CouponCode.objects.get(pk=4)
+        self.promotion_code = self.server.objects['promotion_codes'][self.coupon_code.meta['stripe_id']]
+
+    def tearDown(self):
+        self.server.stop()
+        coupon_table.clear()
+
+    def reconcile(self, **options):
+        drift = []
+        summary = self.processor.reconcile_with_stripe(drift.append, rate_limit=0, **options)
+        return summary, drift
+
+    def test_no_drift(self):
+        summary, drift = self.reconcile()
+
+        self.assertEqual(drift, [])
+        self.assertEqual(summary.checked, len(self.server.objects['coupons']) + len(self.server.objects['promotion_codes']))
+
+    def test_field_drift(self):
+        self.promotion_code.update({'active': False, 'times_redeemed': 3})
+
+        summary, drift = self.reconcile()
+
+        self.assertEqual(
+            [(item.kind, item.type, item.pk, item.field, item.local, item.stripe) for item in drift],
+            [(PROMOTION_CODE, FIELD, self.coupon_code.pk, 'active', True, False), (PROMOTION_CODE, FIELD, self.coupon_code.pk, 'stripe_redemption_count', 0, 3)]
+        )
+        self.assertEqual((summary.drift, summary.repaired), (2, 0))
+
+    def test_repair_local(self):
+        self.promotion_code.update({'active': False, 'expires_at': 1893456000, 'times_redeemed': 3})
+
+        summary, drift = self.reconcile(repair=REPAIR_LOCAL)
+        coupon_code = CouponCode.objects.get(pk=self.coupon_code.pk)
+
+        self.assertEqual({item.field: item.repaired for item in drift}, {'active': True, 'end_date': True, 'stripe_redemption_count': True})
+        self.assertFalse(coupon_code.active)
+        self.assertEqual(int(coupon_code.end_date.timestamp()), 1893456000)
+        self.assertEqual((coupon_code.redemption_count, coupon_code.stripe_redemption_count), (0, 3))
+        self.assertEqual(StripeSync(self.processor).diff(), [])
+
+    def test_repair_local_refreshes_coupon_table(self):
+        self.assertTrue(coupon_table.lookup(self.site.pk, self.coupon_code.code).active)
+        self.promotion_code.update({'active': False})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reconcile(repair=REPAIR_LOCAL)
+
+        self.assertFalse(coupon_table.lookup(self.site.pk, self.coupon_code.code).active)
+
+    def test_repair_stripe(self):
+        CouponCode.objects.filter(pk=self.coupon_code.pk).update(active=False)
+
+        summary, drift = self.reconcile(repair=REPAIR_STRIPE)
+
+        self.assertEqual(summary.repaired, 1)
+        self.assertFalse(self.promotion_code['active'])
+        self.assertEqual(self.server.get_requests("POST", f"/v1/promotion_codes/{self.promotion_code['id']}")[0][2], {'active': False})
+
+    def test_missing_objects(self):
+        del self.server.objects['promotion_codes'][self.promotion_code['id']]
+        orphan = self.server.add_object('promotion_codes', code="ORPHAN", metadata={'site': str(self.site)})
+        self.server.add_object('promotion_codes', code="OTHER-SITE", metadata={'site': "other.example.com"})
+
+        summary, drift = self.reconcile(repair=REPAIR_LOCAL)
+
+        self.assertEqual(
+            sorted((item.type, item.stripe_id, item.pk, item.repaired) for item in drift),
+            [(MISSING_LOCAL, orphan['id'], None, False), (MISSING_STRIPE, self.promotion_code['id'], self.coupon_code.pk, True)]
+        )
+        self.assertNotIn('stripe_id', CouponCode.objects.get(pk=self.coupon_code.pk).meta)
+
+    def test_stripe_lists_are_streamed_in_chunks(self):
+        with mock.patch('vendorpromo.processors.stripe_reconcile.PAGE_SIZE', 2):
+            summary = StripeReconciliation(self.processor, chunk_size=3).run()
+
+        self.assertEqual(summary.drift, 0)
+        self.assertEqual(len(self.server.get_requests("GET", "/v1/promotion_codes")), -(-len(self.server.objects['promotion_codes']) // 2))
+
+    def test_reconcile_stripe_promos_command(self):
+        self.promotion_code.update({'active': False})
+
+        out, err = StringIO(), StringIO()
+        call_command('reconcile_stripe_promos', self.site.pk, stdout=out, stderr=err)
+
+        self.assertEqual(out.getvalue().splitlines()[1], f"promotion_code,field,{self.promotion_code['id']},{self.coupon_code.pk},active,True,False,False")
+        self.assertIn("found 1 differences, repaired 0", err.getvalue())
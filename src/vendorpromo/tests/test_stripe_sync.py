@@ -0,0 +1,137 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from vendorpromo.models import CouponCode, PromotionalCampaign
+from vendorpromo.processors.stripe import StripePromoProcessor
+from vendorpromo.processors.stripe_sync import (COUPON, CREATE, PROMOTION_CODE,
+                                                UPDATE, StripeSync)
+from vendorpromo.tests.stripe_server import FakeStripeServer
+
+
+@override_settings(STRIPE_SECRET_KEY="sk_test_fake")
+class StripeSyncTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeStripeServer().start()
+        self.site = Site.objects.get(pk=1)
+        self.processor = StripePromoProcessor(self.site)
+        self.campaign_count = PromotionalCampaign.objects.filter(site=self.site).count()
+        self.code_count = CouponCode.objects.filter(promo__site=self.site).count()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get_sync(self, **options):
+        return StripeSync(self.processor, **{'rate_limit': 0, 'backoff': 0, **options})
+
+    def test_diff(self):
+        changes = self.get_sync().diff()
+
+        self.assertEqual(len([change for change in changes if change.kind == COUPON]), self.campaign_count)
+        self.assertEqual(len([change for change in changes if change.kind == PROMOTION_CODE]), self.code_count)
+        self.assertTrue(all(change.action == CREATE for change in changes))
+        self.assertEqual(self.server.requests, [])
+
+    def test_sync_creates_stripe_objects(self):
+        summary = self.processor.sync_to_stripe(rate_limit=0, max_workers=4, chunk_size=4)
+        coupon_code = CouponCode.objects.select_related('promo').get(pk=4)
+
+        self.assertEqual((summary.created, summary.updated, summary.failed), (self.campaign_count + self.code_count, 0, []))
+        self.assertEqual(len(self.server.objects['coupons']), self.campaign_count)
+        self.assertEqual(len(self.server.objects['promotion_codes']), self.code_count)
+        self.assertEqual(self.server.objects['promotion_codes'][coupon_code.meta['stripe_id']]['coupon'], coupon_code.promo.meta['stripe_id'])
+        self.assertEqual(self.get_sync().diff(), [])
+
+    def test_changed_rows_are_updated(self):
+        self.get_sync().run()
+        promotional_campaign = PromotionalCampaign.objects.get(pk=1)
+        promotional_campaign.name = "Renamed"
+        promotional_campaign.save()
+
+        self.assertEqual([(change.kind, change.action, change.pk) for change in self.get_sync().diff()], [(COUPON, UPDATE, 1)])
+
+        summary = self.get_sync().run()
+
+        self.assertEqual((summary.created, summary.updated), (0, 1))
+        self.assertEqual(self.server.objects['coupons'][promotional_campaign.meta['stripe_id']]['name'], "Renamed")
+
+    def test_coupon_update_only_sends_updatable_fields(self):
+        self.get_sync().run()
+        promotional_campaign = PromotionalCampaign.objects.get(pk=1)
+        promotional_campaign.name = "Renamed"
+        promotional_campaign.max_redemptions = 10
+        promotional_campaign.end_date = timezone.now() + timezone.timedelta(days=30)
+        promotional_campaign.save()
+
+        summary = self.get_sync().run()
+        request = self.server.get_requests("POST", f"/v1/coupons/{promotional_campaign.meta['stripe_id']}")[-1]
+
+        self.assertEqual((summary.updated, summary.failed), (1, []))
+        self.assertEqual(sorted(request[2]), ['metadata', 'name'])
+
+    def test_sync_uses_the_processor_api_key(self):
+        # Another site's processor, or none, may have set the stripe module's key
+        with mock.patch('stripe.api_key', None):
+            summary = self.get_sync().run()
+
+        self.assertEqual((summary.created, summary.failed), (self.campaign_count + self.code_count, []))
+
+    def test_interrupted_sync_resumes(self):
+        def interrupt(*counts):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.get_sync(chunk_size=4, progress=interrupt).run()
+
+        summary = self.get_sync(chunk_size=4).run()
+
+        self.assertEqual(summary.created, self.campaign_count + self.code_count - 4)
+        self.assertEqual(len(self.server.objects['coupons']), self.campaign_count)
+
+    def test_repeated_create_is_idempotent(self):
+        self.get_sync().run()
+        # As if the sync died before it could store the Stripe id
+        PromotionalCampaign.objects.filter(pk=1).update(meta={})
+
+        summary = self.get_sync().run()
+
+        self.assertEqual(summary.created, 1)
+        self.assertEqual(len(self.server.get_requests("POST", "/v1/coupons")), self.campaign_count + 1)
+        self.assertEqual(len(self.server.objects['coupons']), self.campaign_count)
+
+    def test_transient_failures_are_retried(self):
+        self.server.add_failures("POST", "/v1/coupons", 2, status=429)
+
+        summary = self.get_sync(retries=2, max_workers=1).run()
+
+        self.assertEqual((summary.created, summary.failed, summary.retries), (self.campaign_count + self.code_count, [], 2))
+
+    def test_failed_coupon_fails_its_codes(self):
+        self.server.add_failures("POST", "/v1/coupons", 1, status=400)
+
+        summary = self.get_sync(max_workers=1).run()
+        failed_campaign = PromotionalCampaign.objects.get(meta={})
+
+        self.assertEqual(summary.created, self.campaign_count + self.code_count - 1 - failed_campaign.coupon_code.count())
+        self.assertEqual(
+            sorted((failure.kind, failure.pk) for failure in summary.failed),
+            sorted([(COUPON, failed_campaign.pk)] + [(PROMOTION_CODE, pk) for pk in failed_campaign.coupon_code.values_list('pk', flat=True)])
+        )
+
+    def test_sync_stripe_promos_command(self):
+        out = StringIO()
+        call_command('sync_stripe_promos', self.site.pk, '--dry-run', stdout=out)
+
+        self.assertIn(f"{self.campaign_count + self.code_count} changes to sync", out.getvalue())
+        self.assertEqual(self.server.requests, [])
+
+        call_command('sync_stripe_promos', self.site.pk, '--rate-limit', '0', stdout=out)
+
+        self.assertIn(f"Created {self.campaign_count + self.code_count} and updated 0 Stripe objects", out.getvalue())
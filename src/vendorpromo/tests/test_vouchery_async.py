@@ -0,0 +1,109 @@
+from unittest import skipIf
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.sites.models import Site
+from django.test import TestCase
+from integrations.models import Credential
+from vendor.models import Invoice
+
+from vendorpromo.http_sessions import close_async_clients, httpx
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.models import CouponCode, DeferredValidation
+from vendorpromo.processors.vouchery import VoucheryProcessor, parse_response
+from vendorpromo.processors.vouchery_async import AsyncVoucheryClient
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+
+class ParseResponseTests(TestCase):
+
+    def test_parse_response(self):
+        self.assertTrue(parse_response(204, b'').is_success)
+        self.assertTrue(parse_response(200, b'[{"id": 1}]').is_success)
+        self.assertEqual(parse_response(200, b'[{"id": 1}]').content, [{"id": 1}])
+
+        error = parse_response(404, b'{"type": "Error", "message": "Not found", "error": "missing"}')
+
+        self.assertFalse(error.is_success)
+        self.assertEqual((error.message, error.error), ("Not found", "missing"))
+
+
+@skipIf(httpx is None, "httpx not installed, pip install django-vendor-promo[async]")
+class AsyncVoucheryClientTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+        self.site = Site.objects.get(pk=1)
+        self.invoice = Invoice.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+
+    def tearDown(self):
+        self.server.stop()
+
+    async def run_client(self, *calls):
+        try:
+            return [await call(AsyncVoucheryClient(self.server.url, "key")) for call in calls]
+        finally:
+            await close_async_clients()
+
+    def test_client_calls_share_connection(self):
+        self.server.add_response("GET", "/vouchers/code", {"type": "Voucher", "code": "code"})
+
+        results = async_to_sync(self.run_client)(lambda client: client.get_voucher("code"), lambda client: client.get_campaigns())
+
+        self.assertEqual(results[0].content["code"], "code")
+        self.assertTrue(results[1].is_success)
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_is_code_valid_on_checkout(self):
+        self.server.add_response("GET", "/vouchers/code/redemptions", {"type": "Error", "error": "Not found"}, status=404)
+        self.server.add_response("POST", "/vouchers/code/redemptions", {"type": "Redemption", "status": "redeemed"}, status=201)
+        processor = await sync_to_async(VoucheryProcessor)(self.site, invoice=self.invoice)
+
+        try:
+            self.assertTrue(await processor.ais_code_valid_on_checkout("code", 10))
+        finally:
+            await close_async_clients()
+
+        await sync_to_async(self.invoice.refresh_from_db)()
+        self.assertIn("code", self.invoice.vendor_notes['promos'])
+        self.assertEqual([(method, path) for method, path, _ in self.server.requests], [("GET", "/vouchers/code/redemptions"), ("POST", "/vouchers/code/redemptions")])
+
+    async def test_is_code_valid_on_checkout_rejected(self):
+        self.server.add_response("GET", "/vouchers/code/redemptions", {"type": "Error", "error": "Not found"}, status=404)
+        self.server.add_response("POST", "/vouchers/code/redemptions", {"type": "Error", "error": "Invalid"}, status=422)
+        processor = await sync_to_async(VoucheryProcessor)(self.site, invoice=self.invoice)
+
+        try:
+            self.assertFalse(await processor.ais_code_valid_on_checkout("code", 10))
+        finally:
+            await close_async_clients()
+
+    async def test_is_code_valid(self):
+        self.server.add_response("GET", "/vouchers/code", {"type": "Voucher", "code": "code"})
+        self.server.add_response("GET", "/vouchers/missing", {"type": "Error", "error": "Not found"}, status=404)
+        processor = await sync_to_async(VoucheryProcessor)(self.site)
+
+        try:
+            self.assertTrue(await processor.ais_code_valid("code", invoice=self.invoice))
+            self.assertFalse(await processor.ais_code_valid("missing", invoice=self.invoice))
+        finally:
+            await close_async_clients()
+
+        self.assertEqual([(method, path) for method, path, _ in self.server.requests], [("GET", "/vouchers/code"), ("GET", "/vouchers/missing")])
+
+    async def test_is_code_valid_open_circuit_validates_locally(self):
+        coupon_code = await sync_to_async(CouponCode.objects.get)(pk=4)
+        processor = await sync_to_async(VoucheryProcessor)(self.site)
+        await sync_to_async(processor.get_circuit_breaker().open)()
+
+        try:
+            with self.assertLogs('vendorpromo.processors.vouchery', 'WARNING'):
+                self.assertTrue(await processor.ais_code_valid(coupon_code, invoice=self.invoice))
+        finally:
+            await close_async_clients()
+            await sync_to_async(processor.get_circuit_breaker().close)()
+
+        self.assertTrue(await sync_to_async(DeferredValidation.objects.filter(code=coupon_code.code, invoice=self.invoice).exists)())
+        self.assertEqual(self.server.requests, [])
@@ -0,0 +1,104 @@
+import time
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from integrations.models import Credential
+
+from vendorpromo.http_sessions import close_sessions
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.processors.vouchery_cache import ResponseCache, get_resource
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+
+class GetResourceTests(SimpleTestCase):
+
+    def test_get_resource(self):
+        self.assertEqual(get_resource("https://example.com/api/campaigns"), 'campaigns')
+        self.assertEqual(get_resource("https://example.com/api/campaigns/7/vouchers"), 'vouchers')
+        self.assertEqual(get_resource("https://example.com/api/vouchers/code/redemptions"), 'redemptions')
+        self.assertEqual(get_resource("https://example.com/api/rewards/10"), 'rewards')
+        self.assertIsNone(get_resource("https://example.com/api/other"))
+
+
+class ResponseCacheTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        cache.clear()
+        self.server = FakeVoucheryServer().start()
+        self.site = Site.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+        self.processor = VoucheryProcessor(self.site)
+        self.server.add_response("GET", "/campaigns/7", {"type": "SubCampaign", "id": 7, "rewards": []})
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+        cache.clear()
+
+    def get_request_count(self, path):
+        return len([request for request in self.server.requests if request[:2] == ("GET", path)])
+
+    def test_read_calls_are_cached(self):
+        self.processor.get_campaign(7)
+        result = self.processor.get_campaign(7)
+
+        self.assertEqual(result.content["id"], 7)
+        self.assertEqual(self.processor.response_content["id"], 7)
+        self.assertEqual(self.get_request_count("/campaigns/7"), 1)
+
+    def test_cache_is_per_request(self):
+        self.processor.get_campaigns(name_cont="a")
+        self.processor.get_campaigns(name_cont="b")
+        self.processor.get_campaigns(name_cont="a")
+
+        self.assertEqual(self.get_request_count("/campaigns"), 2)
+
+    def test_errors_are_not_cached(self):
+        self.server.add_response("GET", "/vouchers/missing", {"type": "Error", "error": "missing"}, status=404)
+
+        self.processor.get_voucher("missing")
+        self.processor.get_voucher("missing")
+
+        self.assertEqual(self.get_request_count("/vouchers/missing"), 2)
+
+    def test_get_redeem_is_not_cached(self):
+        self.processor.get_redeem("code", "transaction")
+        self.processor.get_redeem("code", "transaction")
+
+        self.assertEqual(self.get_request_count("/vouchers/code/redemptions"), 2)
+
+    def test_write_calls_invalidate(self):
+        self.processor.get_campaign(7)
+        self.processor.get_vouchers(7)
+        self.processor.create_reward(7, **VoucheryProcessor.REWARD_PARAMS)
+        self.processor.get_campaign(7)
+        self.processor.get_vouchers(7)
+
+        self.assertEqual(self.get_request_count("/campaigns/7"), 2)
+        self.assertEqual(self.get_request_count("/campaigns/7/vouchers"), 1)
+
+    def test_stale_response_is_refreshed_in_background(self):
+        self.processor.response_cache = ResponseCache(timeouts={'campaigns': 0.05}, stale_timeout=60)
+        self.processor.get_campaign(7)
+        self.server.add_response("GET", "/campaigns/7", {"type": "SubCampaign", "id": 7, "rewards": [{"id": 1}]})
+        time.sleep(0.1)
+
+        self.assertEqual(self.processor.get_campaign(7).content["rewards"], [])
+
+        deadline = time.monotonic() + 2
+        while self.processor.get_campaign(7).content["rewards"] == [] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.processor.get_campaign(7).content["rewards"], [{"id": 1}])
+
+    def test_uncached_resource(self):
+        self.processor.response_cache = ResponseCache(timeouts={'campaigns': 0})
+
+        self.processor.get_campaign(7)
+        self.processor.get_campaign(7)
+
+        self.assertEqual(self.get_request_count("/campaigns/7"), 2)
@@ -0,0 +1,129 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from integrations.models import Credential
+
+from vendorpromo.code_generator import generate_coupon_codes
+from vendorpromo.http_sessions import close_sessions
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.models import CouponCode, PromotionalCampaign, VoucheryExport
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.processors.vouchery_export import VoucherExport
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+VOUCHERS_PATH = "/campaigns/55/vouchers"
+
+
+class VoucherExportTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+        self.promotional_campaign = CouponCode.objects.get(pk=4).promo
+        PromotionalCampaign.objects.filter(pk=self.promotional_campaign.pk).update(campaign_id="55")
+        self.promotional_campaign.refresh_from_db()
+        generate_coupon_codes(self.promotional_campaign, 7)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.promotional_campaign.site, client_url=self.server.url, private_key="key")
+        self.processor = VoucheryProcessor(self.promotional_campaign.site)
+        self.codes = list(CouponCode.objects.filter(promo=self.promotional_campaign).order_by('pk').values_list('code', flat=True))
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+
+    def get_pushed_codes(self):
+        return [body['code'] for method, path, body in self.server.requests if (method, path) == ("POST", VOUCHERS_PATH)]
+
+    def test_export_coupon_codes(self):
+        progress = []
+
+        summary = self.processor.export_coupon_codes(self.promotional_campaign, chunk_size=3, max_workers=3, progress=lambda *counts: progress.append(counts))
+        export = VoucheryExport.objects.get(promo=self.promotional_campaign, campaign_id="55")
+
+        self.assertEqual((summary.exported, summary.skipped, summary.failed), (len(self.codes), 0, []))
+        self.assertEqual(sorted(self.get_pushed_codes()), sorted(self.codes))
+        self.assertEqual(progress[-1], (len(self.codes), 0, 0))
+        self.assertEqual(len(progress), -(-len(self.codes) // 3))
+        self.assertEqual(export.exported_count, len(self.codes))
+        self.assertEqual(export.last_coupon_code_pk, CouponCode.objects.filter(promo=self.promotional_campaign).latest('pk').pk)
+        self.assertIsNotNone(export.completed)
+        self.assertGreater(export.throughput, 0)
+
+    def test_interrupted_export_resumes(self):
+        def interrupt(*counts):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            VoucherExport(self.processor, self.promotional_campaign, chunk_size=3, progress=interrupt).run()
+
+        self.assertEqual(VoucheryExport.objects.get(promo=self.promotional_campaign).exported_count, 3)
+
+        summary = VoucherExport(self.processor, self.promotional_campaign, chunk_size=3).run()
+
+        self.assertEqual(summary.exported, len(self.codes) - 3)
+        self.assertEqual(sorted(self.get_pushed_codes()), sorted(self.codes))
+
+    def test_export_only_new_codes(self):
+        self.processor.export_coupon_codes(self.promotional_campaign)
+        generate_coupon_codes(self.promotional_campaign, 2)
+
+        summary = self.processor.export_coupon_codes(self.promotional_campaign)
+
+        self.assertEqual(summary.exported, 2)
+        self.assertEqual(len(self.get_pushed_codes()), len(self.codes) + 2)
+        self.assertEqual(VoucheryExport.objects.get(promo=self.promotional_campaign).exported_count, len(self.codes) + 2)
+
+    def test_existing_vouchers_are_skipped(self):
+        self.server.add_response("POST", VOUCHERS_PATH, {"type": "Error", "message": "Code has already been taken"}, status=422)
+
+        summary = self.processor.export_coupon_codes(self.promotional_campaign)
+
+        self.assertEqual((summary.exported, summary.skipped, summary.failed), (0, len(self.codes), []))
+
+    def test_transient_failures_are_retried(self):
+        self.server.add_failures("POST", VOUCHERS_PATH, 2)
+
+        summary = VoucherExport(self.processor, self.promotional_campaign, retries=2, backoff=0).run()
+
+        self.assertEqual((summary.exported, summary.failed, summary.retries), (len(self.codes), [], 2))
+
+    def test_failed_vouchers(self):
+        self.server.add_response("POST", VOUCHERS_PATH, {"type": "Error", "message": "Invalid campaign"}, status=400)
+
+        summary = self.processor.export_coupon_codes(self.promotional_campaign)
+
+        self.assertEqual(sorted(failure.id for failure in summary.failed), sorted(self.codes))
+        self.assertEqual(VoucheryExport.objects.get(promo=self.promotional_campaign).failed_count, len(self.codes))
+
+    def test_failed_vouchers_are_pushed_again(self):
+        self.server.add_failures("POST", VOUCHERS_PATH, 1)
+
+        summary = VoucherExport(self.processor, self.promotional_campaign, chunk_size=3, max_workers=1, retries=0).run()
+        export = VoucheryExport.objects.get(promo=self.promotional_campaign)
+
+        self.assertEqual([failure.id for failure in summary.failed], self.codes[:1])
+        self.assertEqual(self.get_pushed_codes(), self.codes[:3])
+        self.assertLess(export.last_coupon_code_pk, CouponCode.objects.get(promo=self.promotional_campaign, code=self.codes[0]).pk)
+        self.assertIsNone(export.completed)
+
+        summary = VoucherExport(self.processor, self.promotional_campaign, chunk_size=3, max_workers=1, retries=0).run()
+        export.refresh_from_db()
+
+        self.assertEqual(summary.failed, [])
+        self.assertEqual(self.get_pushed_codes()[3:], self.codes)
+        self.assertIsNotNone(export.completed)
+
+    def test_export_requires_vouchery_campaign(self):
+        self.promotional_campaign.campaign_id = None
+
+        with self.assertRaises(ValueError):
+            self.processor.export_coupon_codes(self.promotional_campaign)
+
+    def test_export_vouchery_vouchers_command(self):
+        out = StringIO()
+        call_command('export_vouchery_vouchers', self.promotional_campaign.pk, '--vouchery-campaign', "56", stdout=out)
+
+        self.assertIn(f"Exported {len(self.codes)} coupon codes", out.getvalue())
+        self.assertTrue(VoucheryExport.objects.filter(promo=self.promotional_campaign, campaign_id="56").exists())
@@ -0,0 +1,125 @@
+import time
+from io import StringIO
+
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from integrations.models import Credential
+
+from vendorpromo.http_sessions import RateLimiter, close_sessions
+from vendorpromo.integrations import VoucheryIntegration
+from vendorpromo.processors.vouchery import VoucheryProcessor
+from vendorpromo.processors.vouchery_teardown import CampaignTeardown
+from vendorpromo.tests.vouchery_server import FakeVoucheryServer
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def test_wait_spaces_out_calls(self):
+        rate_limiter = RateLimiter(100)
+        start_time = time.monotonic()
+
+        for _ in range(11):
+            rate_limiter.wait()
+
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.1)
+
+    def test_no_rate(self):
+        rate_limiter = RateLimiter()
+        start_time = time.monotonic()
+
+        for _ in range(100):
+            rate_limiter.wait()
+
+        self.assertLess(time.monotonic() - start_time, 0.1)
+
+
+class CampaignTeardownTests(TestCase):
+
+    fixtures = ['user', 'unit_test']
+
+    def setUp(self):
+        self.server = FakeVoucheryServer().start()
+        self.site = Site.objects.get(pk=1)
+        Credential.objects.create(name=VoucheryIntegration.NAME, site=self.site, client_url=self.server.url, private_key="key")
+        self.processor = VoucheryProcessor(self.site)
+        self.processor.PAGE_SIZE = 2
+
+        self.server.add_response("GET", "/campaigns/1", {"type": "MainCampaign", "id": 1, "children": [
+            {"type": "SubCampaign", "id": 2},
+            {"type": "SubCampaign", "id": 3},
+            {"type": "Reward", "id": 4},
+        ]})
+        self.server.add_response("GET", "/campaigns/2", {"type": "SubCampaign", "id": 2, "rewards": [{"id": 10}]})
+        self.server.add_response("GET", "/campaigns/3", {"type": "SubCampaign", "id": 3, "rewards": []})
+        self.server.add_list("GET", "/campaigns/2/vouchers", [{"type": "Voucher", "code": f"code-{index}"} for index in range(5)])
+        self.server.add_list("GET", "/campaigns/3/vouchers", [{"type": "Voucher", "code": f"other-{index}"} for index in range(2)])
+
+    def tearDown(self):
+        close_sessions()
+        self.server.stop()
+
+    def get_deleted_paths(self):
+        return [path for method, path, body in self.server.requests if method == "DELETE"]
+
+    def test_delete_full_campaign(self):
+        progress = []
+
+        summary = self.processor.delete_full_campaign(1, max_workers=4, progress=lambda deleted, failed: progress.append(deleted))
+        deleted_paths = self.get_deleted_paths()
+
+        self.assertTrue(summary.result.is_success)
+        self.assertEqual((summary.deleted, summary.failed, summary.retries), (11, [], 0))
+        self.assertEqual(sorted(progress), list(range(1, 12)))
+        self.assertEqual(len(deleted_paths), 11)
+        self.assertEqual(deleted_paths[10], "/campaigns/1")
+
+        # Each sub-campaign is deleted after its vouchers and rewards
+        sub_campaign_2 = deleted_paths.index("/campaigns/2")
+        sub_campaign_3 = deleted_paths.index("/campaigns/3")
+
+        self.assertTrue(all(deleted_paths.index(f"/vouchers/code-{index}") < sub_campaign_2 for index in range(5)))
+        self.assertLess(deleted_paths.index("/rewards/10"), sub_campaign_2)
+        self.assertTrue(all(deleted_paths.index(f"/vouchers/other-{index}") < sub_campaign_3 for index in range(2)))
+
+    def test_bounded_concurrency(self):
+        self.server.delay = 0.02
+
+        self.processor.delete_full_campaign(1, max_workers=3)
+
+        self.assertLessEqual(self.server.max_active, 3)
+        self.assertGreater(self.server.max_active, 1)
+
+    def test_retries_transient_failures(self):
+        self.server.add_failures("DELETE", "/vouchers/code-0", 2)
+
+        summary = CampaignTeardown(self.processor, retries=2, backoff=0).run(1)
+
+        self.assertEqual((summary.deleted, summary.failed, summary.retries), (11, [], 2))
+        self.assertEqual(self.get_deleted_paths().count("/vouchers/code-0"), 3)
+
+    def test_failure_keeps_parent_campaigns(self):
+        self.server.add_failures("DELETE", "/vouchers/code-0", 3, status=500)
+
+        summary = CampaignTeardown(self.processor, retries=2, backoff=0).run(1)
+        deleted_paths = self.get_deleted_paths()
+
+        self.assertIsNone(summary.result)
+        self.assertEqual([(failure.kind, failure.id) for failure in summary.failed], [('voucher', 'code-0')])
+        self.assertIn("/campaigns/3", deleted_paths)
+        self.assertNotIn("/campaigns/2", deleted_paths)
+        self.assertNotIn("/campaigns/1", deleted_paths)
+
+    def test_missing_objects_count_as_deleted(self):
+        self.server.add_response("DELETE", "/vouchers/code-0", {"type": "Error", "message": "Not found"}, status=404)
+
+        summary = self.processor.delete_full_campaign(1)
+
+        self.assertEqual((summary.deleted, summary.failed), (11, []))
+
+    def test_delete_vouchery_campaign_command(self):
+        out = StringIO()
+        call_command('delete_vouchery_campaign', 1, '--site', self.site.pk, '--max-workers', 2, stdout=out)
+
+        self.assertIn("Deleted 11 objects", out.getvalue())
+        self.assertIn("/campaigns/1", self.get_deleted_paths())
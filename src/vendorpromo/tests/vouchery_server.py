@@ -0,0 +1,108 @@
+"""
+Local stand in for the Vouchery API used by the processor tests and the
+benchmarks. It speaks HTTP/1.1 with keep-alive and answers each request with
+the JSON registered for its method and path, or an empty list. Lists added
+with add_list() are paginated with the page and per_page query parameters.
+add_failures() makes the next calls to a path fail, and delay slows down
+every response, with max_active counting the most calls in flight at once.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeVoucheryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def handle_api(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b""
+        url = urlsplit(self.path)
+        path = url.path
+
+        with self.server.lock:
+            self.server.requests.append((self.command, path, json.loads(body) if body else None))
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+
+        time.sleep(self.server.delay)
+        status, content = self.server.get_response(self.command, path, parse_qs(url.query))
+
+        with self.server.lock:
+            self.server.active -= 1
+
+        content = json.dumps(content).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = handle_api
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeVoucheryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeVoucheryHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.responses = {}
+        self.lists = {}
+        self.failures = {}
+        self.delay = 0
+        self.active = 0
+        self.max_active = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_response(self, method, path, content, status=200):
+        self.responses[(method, path)] = (status, content)
+
+    def add_list(self, method, path, items):
+        self.lists[(method, path)] = items
+
+    def add_failures(self, method, path, count, status=503):
+        self.failures[(method, path)] = (count, status)
+
+    def get_response(self, method, path, query=None):
+        with self.lock:
+            count, status = self.failures.get((method, path), (0, None))
+
+            if count:
+                self.failures[(method, path)] = (count - 1, status)
+                return (status, {"type": "Error", "message": "Unavailable"})
+
+        if (method, path) in self.lists:
+            query = query or {}
+            page = int(query.get('page', ['1'])[0])
+            per_page = int(query.get('per_page', ['25'])[0])
+            return (200, self.lists[(method, path)][(page - 1) * per_page:page * per_page])
+
+        return self.responses.get((method, path), (200, []))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -6,3 +6,13 @@ def get_site_from_request(request):
     if hasattr(request, 'site'):
         return request.site
     return get_current_site(request)
+
+
+def normalize_code(code):
+    """
+    Returns the code case-folded and without surrounding whitespace so
+    lookups don't depend on how the customer typed it.
+    """
+    if code is None:
+        return None
+    return str(code).strip().casefold()
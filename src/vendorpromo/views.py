@@ -22,8 +22,9 @@ from vendorpromo.forms import (AffiliateForm, CouponCodeForm, PromoCodeFormset,
 from vendorpromo.integrations import VoucheryIntegration
 from vendorpromo.models import (Affiliate, CouponCode, Promo,
                                 PromotionalCampaign)
-from vendorpromo.processors import get_site_promo_processor
-from vendorpromo.utils import get_site_from_request
+from vendorpromo.processors import (get_site_promo_processor,
+                                    get_site_promo_processor_instance)
+from vendorpromo.utils import get_site_from_request, normalize_code
 
 
 class DjangoVendorPromoIndexView(LoginRequiredMixin, ListView):
@@ -158,7 +159,7 @@ class PromotionalCampaignCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         site = get_site_from_request(self.request)
-        promo_processor = get_site_promo_processor(site)(site)
+        promo_processor = get_site_promo_processor_instance(site)
         promo_processor.create_promo(form)
         return redirect(self.success_url)
 
@@ -186,7 +187,7 @@ class PromotionalCampaignUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         site = get_site_from_request(self.request)
-        promo_processor = get_site_promo_processor(site)(site)
+        promo_processor = get_site_promo_processor_instance(site)
         promo_processor.update_promo(form)
         return redirect(self.success_url)
 
@@ -200,7 +201,7 @@ class PromotionalCampaignDeleteView(LoginRequiredMixin, DeleteView):
 
     def post(self, request, *args, **kwargs):
         site = get_site_from_request(request)
-        promo_processor = get_site_promo_processor(site)(site)
+        promo_processor = get_site_promo_processor_instance(site)
         promo_processor.delete_promo(self.get_object())
         return HttpResponseRedirect(self.success_url)
 
@@ -213,7 +214,7 @@ class CouponCodeListView(LoginRequiredMixin, TableFilterMixin, ListView):
     def search_filter(self, queryset):
         search_value = self.request.GET.get('search_filter')
         return queryset.filter(Q(pk__icontains=search_value)
-                               | Q(code__icontains=search_value)
+                               | Q(normalized_code__startswith=normalize_code(search_value))
                                | Q(promo__name__icontains=search_value))
     
     def get_paginated_by(self, queryset):
@@ -241,7 +242,7 @@ class CouponCodeCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         site = get_site_from_request(self.request)
-        promo_processor = get_site_promo_processor(site)(site)
+        promo_processor = get_site_promo_processor_instance(site)
         promo_processor.create_coupon_code(form)
         return redirect(self.success_url)
 
@@ -261,7 +262,7 @@ class CouponCodeUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         site = get_site_from_request(self.request)
-        promo_processor = get_site_promo_processor(site)(site)
+        promo_processor = get_site_promo_processor_instance(site)
         promo_processor.update_coupon_code(form)
         return redirect(self.success_url)
     
@@ -275,7 +276,7 @@ class CouponCodeDeleteView(LoginRequiredMixin, DeleteView):
 
     def post(self, request, *args, **kwargs):
         site = get_site_from_request(request)
-        promo_processor = get_site_promo_processor(site)(site)
+        promo_processor = get_site_promo_processor_instance(site)
         promo_processor.delete_coupon_code(self.get_object())
         return HttpResponseRedirect(self.success_url)
 
@@ -339,7 +340,7 @@ class PromoCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         promo = form.save(commit=False)
-        processor = get_site_promo_processor(promo.offer.site)(promo.offer.site)
+        processor = get_site_promo_processor_instance(promo.offer.site)
         processor.create_promo(form)
         return redirect('vendorpromo-list')
 
@@ -353,7 +354,7 @@ class PromoUpdateView(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         promo = form.save(commit=False)
-        processor = get_site_promo_processor(promo.offer.site)(promo.offer.site)
+        processor = get_site_promo_processor_instance(promo.offer.site)
         processor.update_promo(form)
         return redirect('vendorpromo-list')
 
@@ -364,7 +365,7 @@ class PromoDeleteView(LoginRequiredMixin, DeleteView):
     slug_url_kwarg = 'uuid'
 
     def post(self, request, *args, **kwargs):
-        processor = get_site_promo_processor(self.get_object().offer.site)(self.get_object().offer.site)
+        processor = get_site_promo_processor_instance(self.get_object().offer.site)
         processor.delete_promo(self.get_object())
         return redirect(request.META.get('HTTP_REFERER'))
 